@@ -0,0 +1,125 @@
+"""Sales rollups for the admin dashboard.
+
+Two tables are kept up to date by checkout, in the same transaction as the
+order itself:
+
+- product_daily_sales (day, product_id): units and revenue
+- daily_sales (day): orders, units, revenue, and low_stock_events, the
+  number of products a checkout pushed to or below the low-stock threshold
+
+Reports read only these tables (plus product for names and the low-stock
+list), so their cost depends on the number of days and products in the
+range, not on the number of orders. `backfill()` rebuilds the rollups
+from order/order_item for history or after manual data fixes.
+
+All SQL here runs on both SQLite (3.24+) and PostgreSQL.
+"""
+from sqlalchemy import Date, bindparam, text
+
+UPSERT_PRODUCT_DAY = text("""
+    INSERT INTO product_daily_sales (day, product_id, units, revenue)
+    VALUES (:day, :product_id, :units, :revenue)
+    ON CONFLICT (day, product_id) DO UPDATE SET
+        units = product_daily_sales.units + excluded.units,
+        revenue = product_daily_sales.revenue + excluded.revenue
+""").bindparams(bindparam('day', type_=Date))
+
+UPSERT_DAY = text("""
+    INSERT INTO daily_sales (day, orders, units, revenue, low_stock_events)
+    VALUES (:day, 1, :units, :revenue, :low_stock_events)
+    ON CONFLICT (day) DO UPDATE SET
+        orders = daily_sales.orders + 1,
+        units = daily_sales.units + excluded.units,
+        revenue = daily_sales.revenue + excluded.revenue,
+        low_stock_events = daily_sales.low_stock_events + excluded.low_stock_events
+""").bindparams(bindparam('day', type_=Date))
+
+
+def record_order(conn, day, items, low_stock_events=0):
+    """Add one order of [(product_id, price, qty), ...] to the rollups for `day`"""
+    conn.execute(UPSERT_PRODUCT_DAY, [
+        {'day': day, 'product_id': pid, 'units': qty, 'revenue': price * qty} for pid, price, qty in items])
+    conn.execute(UPSERT_DAY, {
+        'day': day,
+        'units': sum(qty for _, _, qty in items),
+        'revenue': sum(price * qty for _, price, qty in items),
+        'low_stock_events': low_stock_events,
+    })
+
+
+def _range(column, start, end):
+    clauses, params = [], {}
+    if start is not None:
+        clauses.append(f'{column} >= :start')
+        params['start'] = start
+    if end is not None:
+        clauses.append(f'{column} < :end')
+        params['end'] = end
+    return (' AND '.join(clauses) or '1 = 1'), params
+
+
+def backfill(conn, start=None, end=None):
+    """Recompute the rollups for days in [start, end) from the order tables
+
+    low_stock_events cannot be recovered from history and is left as is.
+    Returns the number of days written.
+    """
+    where, params = _range('day', start, end)
+    order_where, order_params = _range('date("order".created_at)', start, end)
+    dates = [bindparam(k, type_=Date) for k in params]
+    conn.execute(text(f'DELETE FROM product_daily_sales WHERE {where}').bindparams(*dates), params)
+    conn.execute(text(f"""
+        INSERT INTO product_daily_sales (day, product_id, units, revenue)
+        SELECT date("order".created_at), order_item.product_id,
+               SUM(order_item.qty), SUM(order_item.price * order_item.qty)
+        FROM order_item JOIN "order" ON "order".id = order_item.order_id
+        WHERE {order_where}
+        GROUP BY date("order".created_at), order_item.product_id
+    """).bindparams(*dates), order_params)
+    conn.execute(text(f'UPDATE daily_sales SET orders = 0, units = 0, revenue = 0 WHERE {where}')
+                 .bindparams(*dates), params)
+    result = conn.execute(text(f"""
+        INSERT INTO daily_sales (day, orders, units, revenue, low_stock_events)
+        SELECT d.day, d.orders, d.units, d.revenue, 0 FROM (
+            SELECT date("order".created_at) AS day, COUNT(DISTINCT "order".id) AS orders,
+                   SUM(order_item.qty) AS units, SUM(order_item.price * order_item.qty) AS revenue
+            FROM "order" JOIN order_item ON order_item.order_id = "order".id
+            WHERE {order_where}
+            GROUP BY date("order".created_at)
+        ) AS d
+        WHERE true
+        ON CONFLICT (day) DO UPDATE SET
+            orders = excluded.orders, units = excluded.units, revenue = excluded.revenue
+    """).bindparams(*dates), order_params)
+    return result.rowcount
+
+
+def sales_report(conn, start, end, top=10, low_stock_threshold=5, low_stock_limit=20):
+    """Dashboard data for days in [start, end), read from the rollup tables"""
+    dates = (bindparam('start', type_=Date), bindparam('end', type_=Date))
+    params = {'start': start, 'end': end}
+    days = [dict(r._mapping) for r in conn.execute(text("""
+        SELECT day, orders, units, revenue, low_stock_events FROM daily_sales
+        WHERE day >= :start AND day < :end ORDER BY day
+    """).bindparams(*dates).columns(day=Date), params)]
+    top_products = [dict(r._mapping) for r in conn.execute(text("""
+        SELECT s.product_id, p.name, s.units, s.revenue FROM (
+            SELECT product_id, SUM(units) AS units, SUM(revenue) AS revenue
+            FROM product_daily_sales WHERE day >= :start AND day < :end
+            GROUP BY product_id ORDER BY revenue DESC LIMIT :top
+        ) AS s LEFT JOIN product p ON p.id = s.product_id
+        ORDER BY s.revenue DESC
+    """).bindparams(*dates), dict(params, top=top))]
+    low = {'threshold': low_stock_threshold}
+    low['count'] = conn.execute(text('SELECT COUNT(*) FROM product WHERE stock <= :t'),
+                                {'t': low_stock_threshold}).scalar()
+    low['products'] = [dict(r._mapping) for r in conn.execute(text(
+        'SELECT id, name, stock FROM product WHERE stock <= :t ORDER BY stock, id LIMIT :n'),
+        {'t': low_stock_threshold, 'n': low_stock_limit})]
+    totals = {k: sum(d[k] for d in days) for k in ('orders', 'units', 'revenue', 'low_stock_events')}
+    totals['revenue'] = round(totals['revenue'], 2)
+    for row in days + top_products:
+        row['revenue'] = round(row['revenue'], 2)
+    for row in days:
+        row['day'] = row['day'].isoformat()
+    return {'totals': totals, 'days': days, 'top_products': top_products, 'low_stock': low}
@@ -0,0 +1,124 @@
+"""Non-blocking HTTP client for the Kivy app.
+
+All requests run on one small thread pool sharing a single keep-alive
+`requests.Session`, so the login cookie and TCP connections are reused and
+the UI thread never waits on the network. Results are handed back on the
+Kivy main thread. Concurrent identical GETs (same path and params) share a
+single request.
+
+Requests can be retried automatically on network errors and 502/503/504
+with `retries=n`. Only use that for requests that are safe to repeat, such
+as a checkout carrying an Idempotency-Key.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = (5, 20)  # connect, read (seconds)
+RETRY_STATUSES = (502, 503, 504)
+RETRY_BACKOFF = 0.5  # seconds, doubled on every retry
+RETRY_MAX_BACKOFF = 8
+
+
+def kivy_dispatch(func, *args):
+    """Run func(*args) on the Kivy main thread"""
+    from kivy.clock import Clock
+    Clock.schedule_once(lambda dt: func(*args))
+
+
+class ApiClient:
+    def __init__(self, base_url, max_workers=4, timeout=DEFAULT_TIMEOUT, dispatch=kivy_dispatch):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.dispatch = dispatch
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="api")
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _send(self, method, path, kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.session.request(method, self.url(path), **kwargs)
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        return response, data
+
+    def _send_with_retry(self, method, path, kwargs, retries):
+        """_send(), repeated up to `retries` times with jittered exponential backoff"""
+        attempt = 0
+        while True:
+            try:
+                response, data = self._send(method, path, dict(kwargs))
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response, data
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= retries:
+                    raise
+            attempt += 1
+            delay = min(RETRY_BACKOFF * 2 ** (attempt - 1), RETRY_MAX_BACKOFF)
+            time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def _submit(self, key, fn, *args, on_success=None, on_error=None):
+        """Run fn(*args) on the pool, sharing the future with identical in-flight calls"""
+        with self._lock:
+            future = self._inflight.get(key) if key else None
+            created = future is None
+            if created:
+                future = self.executor.submit(fn, *args)
+                if key:
+                    self._inflight[key] = future
+        if created and key:
+            # outside the lock: a future that has already finished runs this right away
+            future.add_done_callback(lambda f: self._forget(key, f))
+
+        def done(f):
+            exc = f.exception()
+            if exc is not None:
+                if on_error:
+                    self.dispatch(on_error, exc)
+            elif on_success:
+                self.dispatch(on_success, *f.result())
+
+        future.add_done_callback(done)
+        return future
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def request(self, method, path, on_success=None, on_error=None, retries=0, **kwargs):
+        """Send a request in the background
+
+        on_success(response, data) runs on the main thread for every HTTP
+        response (including 4xx/5xx) with the decoded JSON body or None;
+        on_error(exc) runs for network errors and timeouts once `retries`
+        retries have failed too.
+        """
+        key = None
+        if method == "GET":
+            key = (path, tuple(sorted((kwargs.get("params") or {}).items())))
+        return self._submit(key, self._send_with_retry, method, path, kwargs, retries,
+                            on_success=on_success, on_error=on_error)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
@@ -0,0 +1,170 @@
+"""Optional ASGI server for the read-heavy JSON API.
+
+    pip install -r requirements-asgi.txt
+    uvicorn asgi_app:app --port 5000 --workers 2
+
+/api/products, /api/products/<id> and /api/orders are answered on an event
+loop with an async SQLAlchemy engine (aiosqlite for SQLite, asyncpg for
+PostgreSQL), so a slow mobile connection costs an idle coroutine instead of
+a worker thread. They reuse web_app's models, queries, serializers and
+caches and produce the same bodies, headers and ETags as the Flask views.
+
+Every other request (pages, login, cart, checkout, admin) and the cases
+the async views hand back (no signed-in user, unknown product) go to the
+Flask app on a thread pool of ASGI_WSGI_THREADS (default 16) threads, so
+one server still serves the whole site. Run `flask --app web_app init-db`
+first, as with gunicorn. Per-endpoint metrics only cover the Flask side.
+"""
+import contextlib
+import os
+from urllib.parse import urlencode
+
+from a2wsgi import WSGIMiddleware
+from itsdangerous import BadSignature
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from werkzeug.http import generate_etag, parse_etags
+
+import db_config
+import web_app
+
+with web_app.app.app_context():
+    # Flask-SQLAlchemy resolves relative SQLite paths into the instance folder
+    sync_url = web_app.db.engine.url
+
+engine = create_async_engine(db_config.async_database_url(sync_url), **db_config.async_engine_options(sync_url))
+db_config.install_sqlite_pragmas(engine.sync_engine)
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+flask_app = WSGIMiddleware(web_app.app, workers=int(os.environ.get('ASGI_WSGI_THREADS', 16)))
+
+
+class FlaskFallback:
+    """ASGI endpoint for `view(request)`; a None result is answered by the Flask app"""
+
+    def __init__(self, view):
+        self.view = view
+
+    async def __call__(self, scope, receive, send):
+        response = await self.view(Request(scope, receive))
+        if response is None:
+            await flask_app(scope, receive, send)
+        else:
+            await response(scope, receive, send)
+
+
+def json_response(request, data, status=200, headers=None, conditional=False):
+    """Same body as Flask's jsonify(); with `conditional`, an ETag and 304 support"""
+    body = web_app.app.json.response(data).get_data()
+    headers = dict(headers or {})
+    if conditional:
+        etag = generate_etag(body)
+        headers['ETag'] = f'"{etag}"'
+        if parse_etags(request.headers.get('if-none-match')).contains_weak(etag):
+            return Response(status_code=304, headers=headers)
+    return Response(body, status_code=status, headers=headers, media_type='application/json')
+
+
+def error(request, message, status=400):
+    return json_response(request, {'status': 'error', 'message': message}, status)
+
+
+async def session_user_id(request):
+    """The Flask-Login user of the session cookie, or None"""
+    app = web_app.app
+    cookie = request.cookies.get(app.config['SESSION_COOKIE_NAME'])
+    if not cookie:
+        return None
+    try:
+        data = app.session_interface.get_signing_serializer(app).loads(
+            cookie, max_age=int(app.permanent_session_lifetime.total_seconds()))
+        user_id = int(data['_user_id'])
+    except (BadSignature, KeyError, TypeError, ValueError):
+        return None
+
+    async def load():
+        async with Session() as session:
+            row = (await session.execute(
+                web_app.db.select(web_app.User.id, web_app.User.username, web_app.User.is_admin)
+                .where(web_app.User.id == user_id))).first()
+        return tuple(row) if row else None
+
+    # same key and value as web_app.load_user
+    row = await web_app.user_cache.get_or_load_async(user_id, load)
+    return row[0] if row else None
+
+
+async def api_products(request):
+    """Async web_app.api_products"""
+    args = request.query_params
+    try:
+        fields, cursor, limit = web_app.product_page_args(args)
+    except ValueError as e:
+        return error(request, str(e))
+
+    async def load():
+        async with Session() as session:
+            rows = (await session.execute(web_app.product_page_query(cursor, limit, fields))).all()
+        return web_app.product_page_result(rows, limit, fields)
+
+    rows, next_cursor = await web_app.catalog_cache.get_or_load_async(('page', cursor, limit, fields), load)
+    headers = {}
+    if next_cursor is not None:
+        headers['X-Next-Cursor'] = str(next_cursor)
+        query = {'cursor': next_cursor, 'limit': limit, 'fields': args.get('fields') or None}
+        query = urlencode({k: v for k, v in query.items() if v is not None}, safe=',')
+        headers['Link'] = f'<{request.url.path}?{query}>; rel="next"'
+    return json_response(request, rows, headers=headers, conditional=True)
+
+
+async def api_product_detail(request):
+    """Async web_app.api_product_detail"""
+    product_id = request.path_params['product_id']
+
+    async def load():
+        async with Session() as session:
+            product = await session.get(web_app.Product, product_id)
+            return web_app.product_row(product) if product else None
+
+    product = await web_app.catalog_cache.get_or_load_async(('product', product_id), load)
+    if product is None:
+        return None
+    return json_response(request, product)
+
+
+async def api_orders(request):
+    """Async web_app.api_orders"""
+    user_id = await session_user_id(request)
+    if user_id is None:
+        # Flask-Login redirects to the login page or signs in from the remember cookie
+        return None
+    args = request.query_params
+    summary = args.get('summary') in ('1', 'true')
+    try:
+        limit = int(args.get('limit', web_app.ORDERS_PAGE_SIZE))
+        limit = max(1, min(limit, web_app.ORDERS_MAX_PAGE_SIZE))
+        query = web_app.order_page_query(user_id, args.get('cursor'), limit, with_items=not summary)
+    except ValueError as e:
+        return error(request, str(e))
+    async with Session() as session:
+        orders, next_cursor = web_app.order_page_result((await session.scalars(query)).all(), limit)
+        results = [web_app.order_json(o, with_items=not summary) for o in orders]
+    headers = {'X-Next-Cursor': next_cursor} if next_cursor else None
+    return json_response(request, results, headers=headers)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    await engine.dispose()
+
+
+app = Starlette(routes=[
+    Route('/api/products', FlaskFallback(api_products), methods=['GET']),
+    Route('/api/products/{product_id:int}', FlaskFallback(api_product_detail), methods=['GET']),
+    Route('/api/orders', FlaskFallback(api_orders), methods=['GET']),
+    Mount('/', app=flask_app),
+], lifespan=lifespan)
@@ -0,0 +1,139 @@
+"""Fingerprinted, long-cached static files.
+
+`asset_url('style.css')` in a template renders `/static/style.css?v=<hash>`.
+Requests carrying the current hash are served with an immutable one-year
+Cache-Control; anything else must revalidate with its ETag. Text assets are
+also served from precompressed `.br` / `.gz` siblings, written next to the
+original the first time they are requested.
+
+The `brotli` package is optional; without it only gzip is used.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import abort, request, send_from_directory
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the install
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.xml')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+
+class AssetManifest:
+    """Content hashes of files under a static directory
+
+    Hashes are recomputed only when a file's size or mtime changes.
+    """
+
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(path):
+        path = path.lstrip('/')
+        return path[len('static/'):] if path.startswith('static/') else path
+
+    def fingerprint(self, path):
+        full = safe_join(self.static_dir, path)
+        if full is None:
+            return None
+        try:
+            st = os.stat(full)
+        except OSError:
+            return None
+        key = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            cached = self._hashes.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+        h = hashlib.sha256()
+        with open(full, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                h.update(chunk)
+        digest = h.hexdigest()[:12]
+        with self._lock:
+            self._hashes[path] = (key, digest)
+        return digest
+
+    def url(self, path):
+        """Versioned URL for a static file (accepts 'x', '/static/x' or 'static/x')"""
+        path = self.normalize(path)
+        digest = self.fingerprint(path)
+        return f'/static/{path}?v={digest}' if digest else f'/static/{path}'
+
+
+def precompressed(full_path, encoding):
+    """Path of the `encoding` variant of `full_path`, creating it if needed"""
+    suffix = '.br' if encoding == 'br' else '.gz'
+    target = full_path + suffix
+    try:
+        if os.stat(target).st_mtime_ns >= os.stat(full_path).st_mtime_ns:
+            return target
+    except FileNotFoundError:
+        pass
+    with open(full_path, 'rb') as f:
+        data = f.read()
+    if encoding == 'br':
+        data = brotli.compress(data)
+    else:
+        data = gzip.compress(data, compresslevel=9, mtime=0)
+    tmp = f'{target}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, target)
+    return target
+
+
+def accepted_encoding(path):
+    if not path.endswith(COMPRESSIBLE):
+        return None
+    accept = request.accept_encodings
+    if brotli is not None and accept['br']:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+
+def init_app(app):
+    """Install asset_url() in templates and replace the static file view"""
+    manifest = AssetManifest(app.static_folder)
+    app.extensions['assets'] = manifest
+    app.jinja_env.globals['asset_url'] = manifest.url
+
+    def static(filename):
+        full = safe_join(app.static_folder, filename)
+        if full is None or not os.path.isfile(full):
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding = accepted_encoding(filename)
+        served = filename
+        if encoding:
+            try:
+                served = os.path.relpath(precompressed(full, encoding), app.static_folder)
+            except OSError:
+                encoding = None
+        resp = send_from_directory(app.static_folder, served, mimetype=mimetype, conditional=True)
+        if filename.endswith(COMPRESSIBLE):
+            resp.vary.add('Accept-Encoding')
+        if encoding:
+            resp.headers['Content-Encoding'] = encoding
+        version = request.args.get('v')
+        if version and version == manifest.fingerprint(filename):
+            resp.headers['Cache-Control'] = IMMUTABLE
+        else:
+            resp.headers['Cache-Control'] = REVALIDATE
+        return resp
+
+    app.view_functions['static'] = static
+    return manifest
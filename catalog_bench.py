@@ -0,0 +1,204 @@
+"""Construction benchmark for the Kivy catalog screen, no server needed.
+
+Builds CatalogScreen with N synthetic products (no images, so nothing
+touches the network) and runs frames until the RecycleView has laid out
+its cards. Reports the wall time, the peak of Python allocations
+(tracemalloc, measured in a second run since tracing slows everything
+down) and how much the peak RSS grew. Every measurement runs in a fresh
+process so one size's leftovers don't count against the next.
+
+--eager builds a ProductCard for every product up front instead, as the
+screen did before it used a RecycleView.
+
+--headless needs no display: it runs with Kivy's mock GL backend (every
+OpenGL call is a no-op) and a bare WindowBase instead of an SDL2 window,
+so the numbers cover widget construction and layout but no drawing:
+
+    python catalog_bench.py --headless --sizes 100,1000,10000
+    python catalog_bench.py --headless --eager --out eager.json
+"""
+import argparse
+import gc
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MAX_FRAMES = 300
+RESULT = 'RESULT '
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='100,1000,10000', help='product counts to build')
+    parser.add_argument('--eager', action='store_true', help='build every card up front (old screen)')
+    parser.add_argument('--headless', action='store_true', help='no display or OpenGL (mock GL backend)')
+    parser.add_argument('--width', type=int, default=480)
+    parser.add_argument('--height', type=int, default=800)
+    parser.add_argument('--out', default='catalog_bench.json')
+    # internal: measure one size in this process
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--trace', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def synthetic_products(n):
+    return [{'id': i, 'name': f'Product {i}', 'price': round(1 + i % 200 * 0.5, 2), 'image': None}
+            for i in range(1, n + 1)]
+
+
+# === ONE MEASUREMENT ===
+
+def settle(count):
+    """Run frames until count() is non-zero and unchanged for three frames"""
+    from kivy.base import EventLoop
+    last, stable = None, 0
+    for _ in range(MAX_FRAMES):
+        EventLoop.idle()
+        current = count()
+        stable = stable + 1 if current == last else 0
+        last = current
+        if current and stable >= 3:
+            return
+    raise RuntimeError(f'screen did not settle in {MAX_FRAMES} frames')
+
+
+def build_recycled(main, window, products):
+    screen = main.CatalogScreen(name='catalog')
+    window.add_widget(screen)
+    screen.update_products(products)
+    layout = screen.ids.products_view.layout_manager
+    settle(lambda: len(layout.children))
+    return len(layout.children)
+
+
+def build_eager(main, window, products):
+    from kivy.metrics import dp
+    from kivy.uix.gridlayout import GridLayout
+    from kivy.uix.scrollview import ScrollView
+    grid = GridLayout(cols=1, spacing=dp(10), size_hint_y=None)
+    grid.bind(minimum_height=grid.setter('height'))
+    for index, product in enumerate(products):
+        card = main.ProductCard(size_hint_y=None, height=dp(180))
+        card.refresh_view_attrs(None, index, {'product': product})
+        grid.add_widget(card)
+    scroll = ScrollView()
+    scroll.add_widget(grid)
+    window.add_widget(scroll)
+    settle(lambda: grid.height)
+    return len(grid.children)
+
+
+def headless_window():
+    """A window with nothing behind it; needs KIVY_GL_BACKEND=mock"""
+    import kivy.core.window
+    from kivy.core.window import WindowBase
+
+    class HeadlessWindow(WindowBase):
+        pass
+
+    window = HeadlessWindow()  # registers itself with the EventLoop
+    kivy.core.window.Window = window
+    return window
+
+
+def measure(size, eager, width, height, trace, headless):
+    # main.py keeps cart.json, catalog.json and image_cache/ in the working directory
+    workdir = tempfile.mkdtemp(prefix='catalog-bench-')
+    os.chdir(workdir)
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+    if headless:
+        # no window provider at all, instead of failing over to one that needs a display
+        os.environ['KIVY_WINDOW'] = ''
+        os.environ['KIVY_GL_BACKEND'] = 'mock'
+    sys.path.insert(0, ROOT)
+    from kivy.resources import resource_add_path
+    resource_add_path(ROOT)  # for shopping.kv
+    from kivy.base import EventLoop
+    if headless:
+        window = headless_window()
+    else:
+        EventLoop.ensure_window()
+        window = EventLoop.window
+    window.size = (width, height)
+    import main
+
+    products = synthetic_products(size)
+    gc.collect()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    cards = (build_eager if eager else build_recycled)(main, window, products)
+    seconds = time.perf_counter() - started
+    result = {
+        'products': size,
+        'cards': cards,
+        'ms': round(seconds * 1000, 1),
+        # ru_maxrss is in KiB on Linux
+        'rss_growth_mb': round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024, 1),
+    }
+    if trace:
+        result['peak_python_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        tracemalloc.stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+# === DRIVER ===
+
+def run_child(size, args, trace):
+    cmd = [sys.executable, os.path.abspath(__file__), '--size', str(size),
+           '--width', str(args.width), '--height', str(args.height)]
+    if args.eager:
+        cmd.append('--eager')
+    if args.headless:
+        cmd.append('--headless')
+    if trace:
+        cmd.append('--trace')
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(RESULT):
+            return json.loads(line[len(RESULT):])
+    sys.exit(f'{size} products failed (exit {proc.returncode}):\n' + '\n'.join(proc.stderr.splitlines()[-15:]))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.size is not None:
+        result = measure(args.size, args.eager, args.width, args.height, args.trace, args.headless)
+        print(RESULT + json.dumps(result), flush=True)
+        return
+
+    import loadtest
+    results = []
+    for size in [int(n) for n in args.sizes.split(',') if n.strip()]:
+        result = run_child(size, args, trace=False)
+        result['peak_python_mb'] = run_child(size, args, trace=True)['peak_python_mb']
+        results.append(result)
+        print(f'{size} products: {result["ms"]} ms, {result["cards"]} cards')
+
+    report = {
+        'commit': loadtest.git_commit(),
+        'at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'params': {k: v for k, v in vars(args).items() if k not in ('out', 'size', 'trace')},
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\n{"products":>9} {"cards":>7} {"ms":>9} {"py peak MB":>11} {"RSS +MB":>8}')
+    for r in results:
+        print(f'{r["products"]:>9} {r["cards"]:>7} {r["ms"]:>9.1f} {r["peak_python_mb"]:>11.1f} '
+              f'{r["rss_growth_mb"]:>8.1f}')
+    print(f'\nresults written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
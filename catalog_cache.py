@@ -0,0 +1,135 @@
+"""In-process cache for catalog reads.
+
+Entries are tagged with the catalog version they were built from. Writers
+call `bump()` after committing a product change, which makes every older
+entry stale at once. With a `FileVersion` the version lives in a stamp file
+that all worker processes on the host check, so a write in one gunicorn
+worker invalidates the others as well.
+"""
+import itertools
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalVersion:
+    """Catalog version kept in this process only"""
+
+    def __init__(self):
+        self._counter = itertools.count(1)
+        self._value = 0
+
+    def get(self):
+        return self._value
+
+    def bump(self):
+        self._value = next(self._counter)
+
+
+class FileVersion:
+    """Catalog version shared through a stamp file
+
+    bump() atomically replaces the file, so its (inode, mtime) pair changes
+    on every write and reading the version is a single stat() call.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path):
+            self.bump()
+
+    def get(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns)
+
+    def bump(self):
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.catalog-version-')
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(time.time_ns()))
+        os.replace(tmp, self.path)
+
+
+class CatalogCache:
+    """TTL + LRU cache of catalog query results
+
+    Values must be plain data (dicts, lists, tuples), never ORM instances,
+    since they are shared between request threads.
+    """
+
+    def __init__(self, maxsize=256, ttl=60, version=None, enabled=True):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = version or LocalVersion()
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, key):
+        """Return (hit, value, version, now); on a miss, store the result under that version/time"""
+        version = self.version.get()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[2], version, now
+            self.misses += 1
+        return False, None, version, now
+
+    def get_or_load(self, key, loader):
+        if not self.enabled:
+            return loader()
+        hit, value, version, now = self._lookup(key)
+        if hit:
+            return value
+        value = loader()
+        self._store(key, version, now, value)
+        return value
+
+    async def get_or_load_async(self, key, loader):
+        """get_or_load() with a coroutine function as `loader`"""
+        if not self.enabled:
+            return await loader()
+        hit, value, version, now = self._lookup(key)
+        if hit:
+            return value
+        value = await loader()
+        self._store(key, version, now, value)
+        return value
+
+    def _store(self, key, version, now, value):
+        with self._lock:
+            self._entries[key] = (version, now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def bump(self):
+        """Invalidate every cached entry, in this process and any sharing the version"""
+        self.version.bump()
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,51 @@
+"""Offline copy of the product catalog for the Kivy app.
+
+The catalog is kept in a compact JSON file next to cart.json together with
+the server catalog version it reflects, so the app can render immediately
+on start and then only fetch what changed via /api/products/changes.
+"""
+import json
+import os
+
+CATALOG_FILE = "catalog.json"
+
+
+class CatalogStore:
+    def __init__(self, path=CATALOG_FILE):
+        self.path = path
+        self.version = 0
+        self.products = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self.version = data["version"]
+            self.products = {p["id"]: p for p in data["products"]}
+        except (OSError, ValueError, KeyError):
+            self.version = 0
+            self.products = {}
+
+    def save(self):
+        """Write the catalog atomically so a crash never leaves half a file"""
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": self.version, "products": list(self.products.values())},
+                      f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def apply(self, delta):
+        """Apply one /api/products/changes response; returns True if anything changed"""
+        if delta.get("reset"):
+            self.products = {}
+        for product in delta.get("changed", []):
+            self.products[product["id"]] = product
+        for product_id in delta.get("deleted", []):
+            self.products.pop(product_id, None)
+        changed = bool(delta.get("reset") or delta.get("changed") or delta.get("deleted"))
+        self.version = delta.get("version", self.version)
+        return changed
+
+    def all(self):
+        return [self.products[pid] for pid in sorted(self.products)]
@@ -1,19 +1,20 @@
-import sqlite3
-import os
+"""Show the tables and schema version of the configured database.
 
-db_path = 'instance/shopping.db'
+New tables are added by migrations (`flask --app web_app migrate`), so the
+database never needs to be deleted to pick them up.
+"""
+from sqlalchemy import inspect
 
-if os.path.exists(db_path):
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    cur.execute("SELECT name FROM sqlite_master WHERE type='table'")
-    tables = [r[0] for r in cur.fetchall()]
-    print('Existing tables:', tables)
-    conn.close()
-    
-    # Recreate DB to ensure all tables are created
-    print('Removing old DB to recreate with all tables...')
-    os.remove(db_path)
-    print('Database removed. Restart the server to recreate with Order/OrderItem tables.')
-else:
-    print('Database does not exist.')
+import migrations
+from web_app import app, db
+
+if __name__ == '__main__':
+    with app.app_context():
+        print('Database:', db.engine.url)
+        print('Existing tables:', sorted(inspect(db.engine).get_table_names()))
+        todo = migrations.pending(db.engine)
+        print(f'Schema version: {migrations.latest_version() - len(todo)} of {migrations.latest_version()}')
+        for number, name, _ in todo:
+            print(f'  pending {number} {name}')
+        if todo:
+            print('Run `flask --app web_app migrate` to apply them.')
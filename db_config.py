@@ -0,0 +1,109 @@
+"""Database engine configuration for web_app.
+
+Everything can be overridden from the environment so the same code runs
+against the local SQLite file in development and a server database in
+production:
+
+- DATABASE_URL      SQLAlchemy URL (default sqlite:///shopping.db)
+- DB_POOL_SIZE      connections kept open per worker process (default 5)
+- DB_MAX_OVERFLOW   extra connections allowed under bursts (default 10)
+- DB_POOL_TIMEOUT   seconds to wait for a free connection (default 30)
+- SQLITE_BUSY_TIMEOUT_MS, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB
+                    tuning for the SQLite pragmas below
+- SQLITE_PRAGMAS    0 leaves SQLite at its defaults (for benchmarks only)
+
+asgi_app uses the same settings with the backend's asyncio driver.
+"""
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+DEFAULT_DATABASE_URL = 'sqlite:///shopping.db'
+
+
+def database_url():
+    url = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+    # Heroku style URLs still use the old scheme name
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def is_sqlite(url):
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def sqlite_pragmas():
+    """Pragmas applied to every new SQLite connection.
+
+    WAL lets readers keep going while a checkout is writing, and
+    synchronous=NORMAL is the safe pairing for WAL (only the last
+    transactions can be lost on power failure, never corruption).
+    """
+    return {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        # negative means KiB rather than pages
+        'cache_size': -int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024)),
+        'temp_store': 'MEMORY',
+    }
+
+
+def engine_options(url):
+    """SQLALCHEMY_ENGINE_OPTIONS for `url`, sized per worker process"""
+    options = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+    }
+    if is_sqlite(url):
+        if make_url(url).database in (None, '', ':memory:'):
+            # in-memory databases live in a single connection
+            return {}
+        # SQLAlchemy 1.4 defaults file databases to NullPool
+        options['poolclass'] = QueuePool
+        # connections are handed between request threads
+        options['connect_args'] = {'check_same_thread': False}
+    else:
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = 1800
+    return options
+
+
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg'}
+
+
+def async_database_url(url):
+    """`url` switched to the asyncio driver of its backend (for asgi_app)"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'no asyncio driver configured for {backend}')
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+
+def async_engine_options(url):
+    """engine_options() for create_async_engine()"""
+    options = engine_options(url)
+    if 'poolclass' in options:
+        options['poolclass'] = AsyncAdaptedQueuePool
+    options.pop('connect_args', None)
+    return options
+
+
+def install_sqlite_pragmas(engine):
+    """Run sqlite_pragmas() on every connection `engine` opens"""
+    if engine.dialect.name != 'sqlite' or os.environ.get('SQLITE_PRAGMAS', '1') == '0':
+        return
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_conn, connection_record):
+        cur = dbapi_conn.cursor()
+        for name, value in pragmas.items():
+            cur.execute(f'PRAGMA {name} = {value}')
+        cur.close()
@@ -0,0 +1,197 @@
+"""Mobile catalog load benchmark: original photos vs resized variants.
+
+Runs the app on a local HTTP server with --products products whose images
+are --images distinct phone-sized photos (made from the sample upload in
+static/uploads), then loads the catalog the way the Kivy app does on a cold
+start: /api/products/changes page by page with its field list, then the
+thumbnails of the first screen (--visible cards, the rows on screen plus
+PREFETCH_ROWS), three downloads at a time like its ImageCache.
+
+"before" is the catalog as uploads used to be served, every card loading
+the original; "after" is the same catalog once the image pipeline has
+attached its variants and the card loads the 240px JPEG. Bytes are
+response bodies. Load time is measured over localhost and, since that has
+no bandwidth limit, also estimated for a --mbps link by adding the
+transfer time of those bytes.
+
+    python image_bench.py --products 500 --visible 10 --mbps 2,10
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from flask import send_from_directory
+from werkzeug.datastructures import FileStorage
+from werkzeug.serving import make_server
+
+import loadtest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SAMPLE = os.path.join(ROOT, 'static', 'uploads', 'IMG_4541.JPG')
+# as main.py asks for them
+PRODUCT_FIELDS = 'id,name,price,image,images'
+DOWNLOADS = 3
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--images', type=int, default=20, help='distinct photos, assigned round robin')
+    parser.add_argument('--visible', type=int, default=10, help='thumbnails loaded for the first screen')
+    parser.add_argument('--repeat', type=int, default=5, help='cold loads per mode; the median is reported')
+    parser.add_argument('--mbps', default='2,10', help='link speeds to estimate load time for')
+    parser.add_argument('--out', default='image_bench.json')
+    return parser.parse_args(argv)
+
+
+# === SETUP ===
+
+def photos(n):
+    """`n` distinct full-size JPEGs cut from the sample upload"""
+    from PIL import Image, ImageOps
+    with Image.open(SAMPLE) as src:
+        img = ImageOps.exif_transpose(src).convert('RGB')
+    width, height = img.size
+    for i in range(n):
+        # shift a 90% crop around so every photo has different content
+        dx, dy = int(width * 0.1 * (i % 5) / 4), int(height * 0.1 * (i // 5 % 5) / 4)
+        buf = io.BytesIO()
+        img.crop((dx, dy, dx + int(width * 0.9), dy + int(height * 0.9))).save(buf, 'JPEG', quality=90)
+        yield f'IMG_{i:04d}.JPG', buf.getvalue()
+
+
+def seed_catalog(web_app, pipeline, products, images):
+    """Replace the catalog with products using stored photos; returns {original url: path}"""
+    stored = {}
+    for filename, data in photos(images):
+        url = pipeline.store(FileStorage(io.BytesIO(data), filename=filename))
+        stored[url] = os.path.join(pipeline.upload_dir, os.path.basename(url))
+    urls = list(stored)
+    with web_app.app.app_context():
+        web_app.init_db()
+        web_app.db.session.execute(web_app.db.text('DELETE FROM product'))
+        web_app.db.session.execute(web_app.db.text('DELETE FROM product_change'))
+        web_app.db.session.add_all([
+            web_app.Product(name=f'Product {i}', price=10 + i % 90, stock=100, image=urls[i % len(urls)])
+            for i in range(products)])
+        web_app.db.session.commit()
+        web_app.db.session.remove()
+    web_app.catalog_cache.bump()
+    return stored
+
+
+def attach_variants(web_app, pipeline, stored):
+    """What the pipeline does after an upload, run synchronously"""
+    from image_pipeline import make_variants
+    for url, path in stored.items():
+        web_app.apply_image_variants(url, make_variants(path, pipeline.upload_dir, pipeline.url_prefix))
+
+
+# === CLIENT ===
+
+def thumbnail_url(product):
+    """main.product_image_url without importing Kivy"""
+    return product.get('images', {}).get('jpeg', {}).get('240') or product.get('image')
+
+
+def cold_load(base, visible):
+    """Sync the catalog and fetch the first screen's thumbnails; returns (seconds, json bytes, image bytes)"""
+    session = requests.Session()
+    started = time.perf_counter()
+    products, json_bytes, since = [], 0, 0
+    while True:
+        response = session.get(f'{base}/api/products/changes', params={'since': since, 'fields': PRODUCT_FIELDS})
+        response.raise_for_status()
+        json_bytes += len(response.content)
+        delta = response.json()
+        products.extend(delta['changed'])
+        since = delta['version']
+        if not delta['more']:
+            break
+
+    def fetch(path):
+        response = session.get(f'{base}/{path}')
+        response.raise_for_status()
+        return len(response.content)
+
+    with ThreadPoolExecutor(DOWNLOADS) as pool:
+        image_bytes = sum(pool.map(fetch, [thumbnail_url(p) for p in products[:visible]]))
+    seconds = time.perf_counter() - started
+    session.close()
+    return seconds, json_bytes, image_bytes
+
+
+def measure(base, args, speeds):
+    runs = [cold_load(base, args.visible) for _ in range(args.repeat)]
+    seconds = statistics.median(r[0] for r in runs)
+    _, json_bytes, image_bytes = runs[-1]
+    total = json_bytes + image_bytes
+    return {
+        'json_bytes': json_bytes,
+        'image_bytes': image_bytes,
+        'total_bytes': total,
+        'localhost_ms': round(seconds * 1000, 1),
+        'estimated_ms': {str(mbps): round((seconds + total * 8 / (mbps * 1e6)) * 1000) for mbps in speeds},
+    }
+
+
+# === DRIVER ===
+
+def main(argv=None):
+    args = parse_args(argv)
+    speeds = [float(s) for s in args.mbps.split(',') if s.strip()]
+    workdir = tempfile.mkdtemp(prefix='image-bench-')
+    loadtest.setup_environment(workdir)
+    import web_app
+    from image_pipeline import ImagePipeline
+
+    # uploads go to the scratch directory, not static/uploads
+    uploads = os.path.join(workdir, 'uploads')
+    pipeline = ImagePipeline(uploads, url_prefix='bench-uploads')
+    web_app.app.add_url_rule('/bench-uploads/<path:name>', 'bench_uploads',
+                             lambda name: send_from_directory(uploads, name))
+    stored = seed_catalog(web_app, pipeline, args.products, args.images)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, web_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+
+    results = {}
+    try:
+        results['before'] = measure(base, args, speeds)
+        attach_variants(web_app, pipeline, stored)
+        results['after'] = measure(base, args, speeds)
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'commit': loadtest.git_commit(),
+        'at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'params': {k: v for k, v in vars(args).items() if k != 'out'},
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'cold catalog load, {args.products} products, first {args.visible} thumbnails')
+    header = f'{"":>7} {"JSON KB":>9} {"images KB":>10} {"total KB":>9} {"localhost ms":>13}'
+    print(header + ''.join(f' {f"{s:g} Mbit/s ms":>15}' for s in speeds))
+    for mode, r in results.items():
+        print(f'{mode:>7} {r["json_bytes"] / 1024:>9.1f} {r["image_bytes"] / 1024:>10.1f} '
+              f'{r["total_bytes"] / 1024:>9.1f} {r["localhost_ms"]:>13.1f}'
+              + ''.join(f' {r["estimated_ms"][str(s)]:>15}' for s in speeds))
+    print(f'\nresults written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
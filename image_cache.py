@@ -0,0 +1,213 @@
+"""Two-tier cache for product images in the Kivy app.
+
+- memory: LRU of raw image bytes, bounded by `memory_bytes`
+- disk: one file per URL under `cache_dir`, bounded by `disk_bytes` and
+  evicted least-recently-used first; each entry remembers the server ETag
+  so stale entries are revalidated with If-None-Match instead of refetched
+
+Network fetches run on a small pool (`max_downloads` at once) and
+concurrent requests for the same URL share one download. `prefetch()`
+warms the disk tier for rows that are about to scroll into view.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+INDEX_FILE = "index.json"
+
+
+def kivy_dispatch(func, *args):
+    from kivy.clock import Clock
+    Clock.schedule_once(lambda dt: func(*args))
+
+
+class ImageCache:
+    def __init__(self, cache_dir="image_cache", session=None, memory_bytes=16 * 1024 * 1024,
+                 disk_bytes=64 * 1024 * 1024, max_downloads=3, max_age=24 * 3600,
+                 timeout=(5, 20), dispatch=kivy_dispatch):
+        self.cache_dir = cache_dir
+        self.session = session or requests.Session()
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.max_age = max_age
+        self.timeout = timeout
+        self.dispatch = dispatch
+        self.executor = ThreadPoolExecutor(max_workers=max_downloads, thread_name_prefix="images")
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "fetches": 0, "revalidated": 0, "bytes_fetched": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index = self._load_index()
+
+    # -- disk index --------------------------------------------------------
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILE)) as f:
+                return OrderedDict(sorted(json.load(f).items(), key=lambda kv: kv[1]["used"]))
+        except (OSError, ValueError):
+            return OrderedDict()
+
+    def _save_index(self):
+        path = os.path.join(self.cache_dir, INDEX_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _key(url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _disk_size(self):
+        return sum(entry["size"] for entry in self._index.values())
+
+    # -- tiers -------------------------------------------------------------
+
+    def _remember(self, url, data):
+        """Put bytes in the memory tier, evicting least recently used entries"""
+        with self._lock:
+            if url in self._memory:
+                self._memory_size -= len(self._memory.pop(url))
+            if len(data) > self.memory_bytes:
+                return
+            self._memory[url] = data
+            self._memory_size += len(data)
+            while self._memory_size > self.memory_bytes:
+                _, old = self._memory.popitem(last=False)
+                self._memory_size -= len(old)
+
+    def _store(self, url, data, etag):
+        """Write bytes to the disk tier, evicting until it fits the budget"""
+        if len(data) > self.disk_bytes:
+            return
+        key = self._key(url)
+        tmp = self._path(key) + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self._path(key))
+        with self._lock:
+            self._index.pop(key, None)
+            self._index[key] = {"url": url, "etag": etag, "size": len(data),
+                                "fetched": time.time(), "used": time.time()}
+            total = self._disk_size()
+            while total > self.disk_bytes:
+                old_key, old = self._index.popitem(last=False)
+                total -= old["size"]
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+            self._save_index()
+
+    def _load(self, url):
+        """Worker: return image bytes from disk or the network"""
+        key = self._key(url)
+        with self._lock:
+            entry = self._index.get(key)
+        headers = {}
+        if entry is not None:
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = None
+            if data is not None:
+                if time.time() - entry["fetched"] < self.max_age or not entry.get("etag"):
+                    with self._lock:
+                        self._index.move_to_end(key)
+                        entry["used"] = time.time()
+                        self.stats["disk_hits"] += 1
+                    return data
+                headers["If-None-Match"] = entry["etag"]
+
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        with self._lock:
+            self.stats["fetches"] += 1
+        if response.status_code == 304 and headers:
+            with self._lock:
+                self.stats["revalidated"] += 1
+                entry["fetched"] = entry["used"] = time.time()
+                self._index.move_to_end(key)
+                self._save_index()
+            return data
+        response.raise_for_status()
+        data = response.content
+        with self._lock:
+            self.stats["bytes_fetched"] += len(data)
+        self._store(url, data, response.headers.get("ETag"))
+        return data
+
+    def _fetch(self, url):
+        """Shared future loading `url` into the memory tier"""
+        with self._lock:
+            future = self._inflight.get(url)
+            if future is not None:
+                return future
+
+            def run():
+                try:
+                    data = self._load(url)
+                    self._remember(url, data)
+                    return data
+                finally:
+                    with self._lock:
+                        self._inflight.pop(url, None)
+
+            future = self.executor.submit(run)
+            self._inflight[url] = future
+            return future
+
+    # -- public API --------------------------------------------------------
+
+    def get(self, url, on_ready, on_error=None):
+        """Call on_ready(url, data) on the main thread once the image is available
+
+        Memory hits call back synchronously.
+        """
+        with self._lock:
+            data = self._memory.get(url)
+            if data is not None:
+                self._memory.move_to_end(url)
+                self.stats["memory_hits"] += 1
+        if data is not None:
+            on_ready(url, data)
+            return None
+
+        def done(f):
+            exc = f.exception()
+            if exc is not None:
+                if on_error:
+                    self.dispatch(on_error, url, exc)
+            else:
+                self.dispatch(on_ready, url, f.result())
+
+        future = self._fetch(url)
+        future.add_done_callback(done)
+        return future
+
+    def prefetch(self, urls):
+        """Warm the cache for images likely to be shown next"""
+        for url in urls:
+            if not url:
+                continue
+            with self._lock:
+                cached = url in self._memory or self._key(url) in self._index
+            if not cached:
+                self._fetch(url)
+
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["fetches"]
+        return hits / total if total else 0.0
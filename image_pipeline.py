@@ -0,0 +1,113 @@
+"""Background processing of product image uploads.
+
+Uploads are stored under a content-hashed name and then resized into a few
+widths, each saved as JPEG and WebP, on a small thread pool so the admin
+request returns as soon as the original is on disk. Variant names are
+derived from the content hash, so reprocessing the same upload is a no-op
+and every URL can be cached forever.
+
+Pillow is optional: without it uploads are still stored, just not resized.
+"""
+import hashlib
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - depends on the install
+    Image = None
+
+log = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = (120, 240, 480)
+FORMATS = {
+    # format: (extension, save options)
+    'jpeg': ('jpg', {'quality': 80, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'quality': 75, 'method': 4}),
+}
+
+
+def content_name(data, filename):
+    """Name an upload after its content: `<sha256 prefix><original ext>`
+
+    Only a short alphanumeric extension is kept from the client's filename
+    (anything else becomes .bin), so the name never holds a path separator,
+    dots or characters that need quoting in a URL.
+    """
+    ext = os.path.splitext(filename or '')[1].lower()
+    if not re.fullmatch(r'\.[a-z0-9]{1,8}', ext):
+        ext = '.bin'
+    return hashlib.sha256(data).hexdigest()[:16] + ext
+
+
+def make_variants(path, out_dir, url_prefix):
+    """Resize the image at `path` into every width/format
+
+    Returns a {format: {width: url}} map, e.g.
+    {'jpeg': {'120': 'static/uploads/ab12-120.jpg', ...}, 'webp': {...}}.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    variants = {fmt: {} for fmt in FORMATS}
+    with Image.open(path) as src:
+        img = ImageOps.exif_transpose(src).convert('RGB')
+    for width in VARIANT_WIDTHS:
+        resized = img.copy()
+        # never upscale; keeps the aspect ratio
+        resized.thumbnail((width, width * 4), Image.LANCZOS)
+        for fmt, (ext, options) in FORMATS.items():
+            name = f'{stem}-{width}.{ext}'
+            target = os.path.join(out_dir, name)
+            if not os.path.exists(target):
+                tmp = target + '.tmp'
+                resized.save(tmp, format=fmt.upper(), **options)
+                os.replace(tmp, target)
+            variants[fmt][str(width)] = f'{url_prefix}/{name}'
+    return variants
+
+
+class ImagePipeline:
+    """Thread pool that turns stored uploads into size/format variants"""
+
+    def __init__(self, upload_dir, url_prefix='static/uploads', max_workers=2):
+        self.upload_dir = upload_dir
+        self.url_prefix = url_prefix
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-pipeline')
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def store(self, file_storage):
+        """Save an uploaded werkzeug FileStorage under its content hash
+
+        Returns the relative URL of the original.
+        """
+        data = file_storage.read()
+        name = content_name(data, file_storage.filename)
+        os.makedirs(self.upload_dir, exist_ok=True)
+        path = os.path.join(self.upload_dir, name)
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(data)
+        return f'{self.url_prefix}/{name}'
+
+    def submit(self, image_url, on_done):
+        """Build variants for a stored upload off the request thread
+
+        `on_done(image_url, variants)` runs on the worker thread once the
+        files are written.
+        """
+        if not self.available:
+            return None
+        path = os.path.join(self.upload_dir, os.path.basename(image_url))
+
+        def run():
+            try:
+                variants = make_variants(path, self.upload_dir, self.url_prefix)
+                on_done(image_url, variants)
+            except Exception:
+                log.exception('image processing failed for %s', image_url)
+
+        return self.executor.submit(run)
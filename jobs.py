@@ -0,0 +1,191 @@
+"""Durable background jobs backed by the `job` table (an outbox).
+
+Producers call `enqueue()` with their own connection or session, so a job
+is committed or rolled back together with the work that created it (for
+example the order in checkout). An optional idempotency key makes
+enqueueing the same job twice a no-op.
+
+`Worker` threads claim due jobs in batches with a single
+UPDATE ... RETURNING and a lease, so several threads or processes can
+share the table; a job whose worker died becomes claimable again when
+its lease runs out. Each handler runs as `handler(conn, payload)` in the
+same transaction that marks the job done, so database side effects
+happen exactly once; a worker that finds the job was reclaimed after its
+lease ran out rolls the handler's work back instead. Failures are retried with exponential backoff, and
+after `max_attempts` the job is dead-lettered (status 'dead') with its
+last error for an admin to inspect and retry.
+
+The SQL runs on SQLite 3.35+ and PostgreSQL.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+
+from sqlalchemy import text
+
+PENDING, RUNNING, DONE, DEAD = 'pending', 'running', 'done', 'dead'
+MAX_ATTEMPTS = 5
+
+log = logging.getLogger('web_app.jobs')
+
+ENQUEUE = text("""
+    INSERT INTO job (kind, payload, idempotency_key, status, attempts, max_attempts, run_at, created_at)
+    VALUES (:kind, :payload, :key, 'pending', 0, :max_attempts, :run_at, :now)
+    ON CONFLICT (idempotency_key) DO NOTHING
+""")
+
+CLAIM = text("""
+    UPDATE job SET status = 'running', attempts = attempts + 1, locked_until = :lease, locked_by = :worker
+    WHERE id IN (
+        SELECT id FROM job
+        WHERE (status = 'pending' AND run_at <= :now) OR (status = 'running' AND locked_until < :now)
+        ORDER BY run_at LIMIT :batch
+    ) AND (status = 'pending' OR locked_until < :now)
+    RETURNING id, kind, payload, idempotency_key, attempts, max_attempts
+""")
+
+FINISH = text("""
+    UPDATE job SET status = 'done', finished_at = :now, locked_until = NULL
+    WHERE id = :id AND locked_by = :worker AND status = 'running'
+""")
+
+
+class LeaseLost(Exception):
+    """Another worker claimed the job after this one's lease ran out"""
+
+
+def enqueue(conn, kind, payload, key=None, delay=0, max_attempts=MAX_ATTEMPTS):
+    """Add a job in the caller's transaction; a repeated `key` is ignored"""
+    now = time.time()
+    conn.execute(ENQUEUE, {'kind': kind, 'payload': json.dumps(payload), 'key': key,
+                           'max_attempts': max_attempts, 'run_at': now + delay, 'now': now})
+
+
+def stats(conn, dead_limit=20):
+    counts = {status: 0 for status in (PENDING, RUNNING, DONE, DEAD)}
+    counts.update(dict(conn.execute(text('SELECT status, COUNT(*) FROM job GROUP BY status')).all()))
+    oldest = conn.execute(text("SELECT MIN(run_at) FROM job WHERE status = 'pending'")).scalar()
+    dead = [dict(r._mapping) for r in conn.execute(text(
+        "SELECT id, kind, idempotency_key, attempts, last_error, finished_at FROM job "
+        "WHERE status = 'dead' ORDER BY finished_at DESC LIMIT :n"), {'n': dead_limit})]
+    return {'counts': counts, 'oldest_pending_age': round(time.time() - oldest, 1) if oldest else None,
+            'dead': dead}
+
+
+def retry_dead(conn, job_id=None):
+    """Put dead-lettered jobs (all, or just `job_id`) back in the queue"""
+    sql = "UPDATE job SET status = 'pending', attempts = 0, run_at = :now, last_error = NULL WHERE status = 'dead'"
+    params = {'now': time.time()}
+    if job_id is not None:
+        sql += ' AND id = :id'
+        params['id'] = job_id
+    return conn.execute(text(sql), params).rowcount
+
+
+def purge(conn, older_than):
+    """Delete finished jobs older than `older_than` seconds"""
+    return conn.execute(text("DELETE FROM job WHERE status = 'done' AND finished_at < :t"),
+                        {'t': time.time() - older_than}).rowcount
+
+
+class Worker:
+    def __init__(self, engine, handlers, batch=10, lease=60, poll=1.0, backoff=2.0, max_backoff=300,
+                 retention=7 * 24 * 3600):
+        self.engine = engine
+        self.handlers = handlers
+        self.batch = batch
+        self.lease = lease
+        self.poll = poll
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retention = retention
+        self.name = f'{os.getpid()}'
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._last_purge = 0.0
+        self.processed = 0
+        self.failed = 0
+        self.lost = 0
+
+    def notify(self):
+        """Wake idle threads now instead of at the next poll"""
+        self._wake.set()
+
+    def worker_id(self):
+        """What claim() stores in locked_by: one id per thread"""
+        return f'{self.name}:{threading.get_ident()}'
+
+    def claim(self):
+        now = time.time()
+        with self.engine.begin() as conn:
+            return [dict(r._mapping) for r in conn.execute(CLAIM, {
+                'now': now, 'lease': now + self.lease, 'batch': self.batch, 'worker': self.worker_id()})]
+
+    def run_job(self, job):
+        """Run a job claimed by this thread"""
+        handler = self.handlers.get(job['kind'])
+        worker = self.worker_id()
+        try:
+            if handler is None:
+                raise LookupError(f"no handler for job kind {job['kind']!r}")
+            with self.engine.begin() as conn:
+                handler(conn, json.loads(job['payload']))
+                finished = conn.execute(FINISH, {'now': time.time(), 'id': job['id'], 'worker': worker})
+                if not finished.rowcount:
+                    raise LeaseLost(job['id'])
+            self.processed += 1
+        except LeaseLost:
+            self.lost += 1
+            log.warning('job %s %s was reclaimed after its lease ran out; rolled back', job['id'], job['kind'])
+        except Exception as e:
+            self.failed += 1
+            dead = handler is None or job['attempts'] >= job['max_attempts']
+            delay = min(self.backoff * 2 ** (job['attempts'] - 1), self.max_backoff)
+            error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+            log.warning('job %s %s attempt %s failed%s: %s', job['id'], job['kind'], job['attempts'],
+                        ' (dead-lettered)' if dead else '', error)
+            now = time.time()
+            with self.engine.begin() as conn:
+                conn.execute(text("UPDATE job SET status = :status, run_at = :run_at, last_error = :error, "
+                                  "locked_until = NULL, finished_at = :finished "
+                                  "WHERE id = :id AND locked_by = :worker AND status = 'running'"), {
+                    'status': DEAD if dead else PENDING, 'run_at': now + delay, 'error': error[:2000],
+                    'finished': now if dead else None, 'id': job['id'], 'worker': worker})
+
+    def run_once(self):
+        """Claim and run one batch; returns how many jobs were claimed"""
+        jobs = self.claim()
+        for job in jobs:
+            self.run_job(job)
+        if time.time() - self._last_purge > 3600:
+            self._last_purge = time.time()
+            with self.engine.begin() as conn:
+                purge(conn, self.retention)
+        return len(jobs)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception:
+                log.exception('job worker error')
+            self._wake.wait(self.poll)
+            self._wake.clear()
+
+    def start(self, threads=1):
+        for i in range(threads):
+            t = threading.Thread(target=self._loop, name=f'jobs-{i}', daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
@@ -0,0 +1,581 @@
+"""Load test and benchmark for the web app.
+
+Seeds a throwaway SQLite database with synthetic users, products and orders,
+then drives the real Flask app in-process (through its WSGI test client, no
+server or network needed) with concurrent clients, one scenario at a time:
+
+    browse      GET /
+    products    GET /api/products?limit=100 (one keyset page)
+    products_full
+                the whole catalog as one JSON list, as /api/products did
+                before it was paginated (baseline)
+    search      GET /api/products/search?q=...
+    search_page GET /?q=... (full-text index)
+    search_scan GET /?q=... filtering every product in Python (baseline)
+    cart_add    POST /api/cart/add
+    cart_5, cart_50, cart_500
+                POST /api/cart/add to a cart that already has 5, 50 or 500
+                lines; the cookie carries only the cart id
+    cookie_cart_5, cookie_cart_50, cookie_cart_500
+                the same with the whole cart in the session cookie, as
+                carts were kept before the cart table (baseline)
+    checkout    POST /api/checkout (1-3 random lines)
+    orders      GET /api/orders
+    heavy_orders
+                GET /api/orders as a user with --heavy-orders orders
+    heavy_orders_all
+                every order of that user with its items loaded one order
+                at a time, as /api/orders did before it was paginated
+                (baseline)
+    admin_edit  POST /admin/edit/<id>
+    analytics   GET /admin/api/analytics (last 30 days)
+    checkout_replay
+                POST /api/checkout from every client with one Idempotency-Key;
+                fails the run unless exactly one order was created
+    mixed       GET /api/orders or /api/products/<id>, with a checkout every
+                fifth request
+    oversell    every client buys one unit of a new product stocked with
+                --oversell-stock units; fails the run if stock goes negative
+                or the number of orders differs from the units available
+
+Baseline scenarios run the old version of a view, registered by this script
+under /loadtest/, so one run compares it with the current one.
+
+With --workers N each scenario runs in N forked processes of --clients
+threads each, like gunicorn -w N --threads, all sharing the database file.
+
+For every scenario it reports throughput, latency percentiles, errors, SQL
+statements and response bytes per request, and writes everything to a JSON
+file. Pass --compare with an earlier result file to see the change per
+scenario.
+
+    python loadtest.py --clients 8 --requests 2000 --out bench.json
+    python loadtest.py --out new.json --compare bench.json
+    python loadtest.py --catalog-cache off --products 100000 --scenarios products,products_full
+    python loadtest.py --catalog-cache off --products 10000 --scenarios search_page,search_scan
+    python loadtest.py --heavy-orders 10000 --scenarios heavy_orders,heavy_orders_all
+    python loadtest.py --workers 4 --scenarios mixed --sqlite-pragmas off
+    python loadtest.py --scenarios cart_5,cart_50,cart_500,cookie_cart_5,cookie_cart_50,cookie_cart_500
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import jsonify, render_template, request, session
+from flask_login import current_user, login_required
+from sqlalchemy import event
+
+# scenario -> lines already in the cart
+CART_SCENARIOS = {f'{kind}_{n}': n for kind in ('cart', 'cookie_cart') for n in (5, 50, 500)}
+SCENARIOS = ('browse', 'products', 'products_full', 'search', 'search_page', 'search_scan', 'cart_add',
+             *CART_SCENARIOS, 'checkout', 'orders', 'heavy_orders', 'heavy_orders_all', 'admin_edit', 'analytics',
+             'mixed', 'checkout_replay', 'oversell')
+ADMIN_SCENARIOS = ('admin_edit', 'analytics')
+HEAVY_SCENARIOS = ('heavy_orders', 'heavy_orders_all')
+HEAVY_USER = 'heavy-buyer'
+PASSWORD = 'loadtest'
+REPLAY_KEY = 'loadtest-replay'
+WORDS = ('red', 'blue', 'green', 'black', 'classic', 'sport', 'summer', 'winter', 'cotton', 'leather',
+         'shirt', 'jeans', 'sneakers', 'hat', 'jacket', 'socks', 'scarf', 'boots', 'dress', 'bag')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--heavy-orders', type=int, default=10000,
+                        help='orders of the user in the heavy_orders scenarios')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent client threads (per worker)')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes')
+    parser.add_argument('--catalog-cache', choices=('on', 'off'), default='on',
+                        help='off reads every catalog request from the database')
+    parser.add_argument('--sqlite-pragmas', choices=('on', 'off'), default='on',
+                        help='off runs SQLite without WAL and the other db_config pragmas')
+    parser.add_argument('--requests', type=int, default=1000, help='requests per scenario')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--oversell-stock', type=int, default=50, help='units of the oversell product')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', default='loadtest.json')
+    parser.add_argument('--compare', help='earlier result file to diff against')
+    parser.add_argument('--keep-db', action='store_true', help='print the database path and keep it')
+    return parser.parse_args(argv)
+
+
+def setup_environment(workdir, sqlite_pragmas=True, catalog_cache=True):
+    """Point the app at a scratch database before web_app is imported"""
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'loadtest.db')
+    os.environ['SQLITE_PRAGMAS'] = '1' if sqlite_pragmas else '0'
+    os.environ['CATALOG_CACHE'] = '1' if catalog_cache else '0'
+    os.environ['CATALOG_CACHE_STAMP'] = os.path.join(workdir, 'catalog.version')
+    os.environ.setdefault('SLOW_REQUEST_MS', '60000')
+
+
+# === SEEDING ===
+
+def seed(web_app, rnd, users, products, orders, heavy_orders=0):
+    db = web_app.db
+    started = time.perf_counter()
+    web_app.init_db()
+    # hashing is deliberately slow, so every synthetic user shares one hash
+    password_hash = web_app.hash_password(PASSWORD)
+    db.session.execute(db.insert(web_app.User), [
+        {'username': f'user{i}', 'password_hash': password_hash, 'is_admin': False} for i in range(users)])
+    db.session.execute(db.insert(web_app.User), [
+        {'username': 'loadtest-admin', 'password_hash': password_hash, 'is_admin': True}])
+    first = (db.session.query(db.func.max(web_app.Product.id)).scalar() or 0) + 1
+    db.session.execute(db.insert(web_app.Product), [
+        {'id': first + i, 'name': f'{rnd.choice(WORDS).title()} {rnd.choice(WORDS)} {i}',
+         'price': round(rnd.uniform(1, 200), 2), 'stock': 10 ** 7} for i in range(products)])
+    user_ids = [u for (u,) in db.session.query(web_app.User.id).filter(web_app.User.is_admin.is_(False))]
+    if heavy_orders:
+        db.session.execute(db.insert(web_app.User), [
+            {'username': HEAVY_USER, 'password_hash': password_hash, 'is_admin': False}])
+        heavy_id = db.session.query(web_app.User.id).filter_by(username=HEAVY_USER).scalar()
+    product_ids = list(range(first, first + products))
+    now = datetime.utcnow()
+    order_rows, item_rows = [], []
+    for order_id in range(1, orders + heavy_orders + 1):
+        lines = rnd.sample(product_ids, rnd.randint(1, 3))
+        items = [{'order_id': order_id, 'product_id': pid, 'product_name': f'Product {pid}',
+                  'price': 10.0, 'qty': rnd.randint(1, 3)} for pid in lines]
+        order_rows.append({'id': order_id, 'user_id': heavy_id if order_id > orders else rnd.choice(user_ids),
+                           'total': sum(i['price'] * i['qty'] for i in items),
+                           'created_at': now - timedelta(minutes=rnd.randint(0, 60 * 24 * 365))})
+        item_rows.extend(items)
+    if order_rows:
+        db.session.execute(db.insert(web_app.Order), order_rows)
+        db.session.execute(db.insert(web_app.OrderItem), item_rows)
+    web_app.analytics.backfill(db.session)
+    db.session.commit()
+    web_app.catalog_cache.bump()
+    return {'users': users, 'products': products, 'orders': orders, 'heavy_orders': heavy_orders,
+            'order_items': len(item_rows),
+            'seconds': round(time.perf_counter() - started, 2)}
+
+
+def add_product(web_app, stock):
+    """Insert one more product with `stock` units and return its id"""
+    with web_app.app.app_context():
+        product = web_app.Product(name='Limited edition', price=50.0, stock=stock)
+        web_app.db.session.add(product)
+        web_app.db.session.commit()
+        web_app.catalog_cache.bump()
+        try:
+            return product.id
+        finally:
+            web_app.db.session.remove()
+
+
+def product_stock(web_app, product_id):
+    with web_app.app.app_context():
+        try:
+            return web_app.db.session.get(web_app.Product, product_id).stock
+        finally:
+            web_app.db.session.remove()
+
+
+# === BASELINES ===
+
+def register_baselines(web_app):
+    """Add the pre-optimization versions of some views under /loadtest/"""
+    app, Product, Order = web_app.app, web_app.Product, web_app.Order
+
+    def products_full():
+        products = Product.query.order_by(Product.id).all()
+        return jsonify([
+            {'id': p.id, 'name': p.name, 'price': p.price, 'stock': p.stock, 'image': p.image}
+            for p in products
+        ])
+
+    def search_scan():
+        q = request.args.get('q', '').strip()
+        products = Product.query.order_by(Product.id).all()
+        if q:
+            products = [p for p in products if q.lower() in p.name.lower()]
+        return render_template('index.html', products=products, cart_count=web_app.cart_count(), search_query=q)
+
+    def orders_all():
+        orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).all()
+        results = []
+        for o in orders:
+            items = [{
+                'product_id': i.product_id,
+                'product_name': i.product_name,
+                'qty': i.qty,
+                'price': i.price
+            } for i in o.items]
+            results.append({'order_id': o.id, 'total': o.total, 'created_at': o.created_at.isoformat(),
+                            'items': items})
+        return jsonify(results)
+
+    def cookie_cart_save():
+        session['cart'] = request.get_json()['cart']
+        return jsonify({'success': True, 'message': 'Cart saved', 'cart': session['cart']})
+
+    def cookie_cart_add():
+        data = request.get_json() or {}
+        product_id = data.get('product_id')
+        qty = int(data.get('qty', 1))
+        product = Product.query.get_or_404(product_id)
+        if product.stock < qty:
+            return jsonify({'success': False, 'message': f'{product.name} only has {product.stock} in stock'}), 400
+        cart = session.get('cart', {})
+        cart[str(product_id)] = cart.get(str(product_id), 0) + qty
+        session['cart'] = cart
+        return jsonify({'success': True, 'message': f'Added {qty} x {product.name} to cart', 'cart': cart})
+
+    app.add_url_rule('/loadtest/products_full', 'loadtest_products_full', products_full)
+    app.add_url_rule('/loadtest/cookie_cart/save', 'loadtest_cookie_cart_save', cookie_cart_save,
+                     methods=['POST'])
+    app.add_url_rule('/loadtest/cookie_cart/add', 'loadtest_cookie_cart_add', cookie_cart_add,
+                     methods=['POST'])
+    app.add_url_rule('/loadtest/orders_all', 'loadtest_orders_all', login_required(orders_all))
+    app.add_url_rule('/loadtest/search_scan', 'loadtest_search_scan', search_scan)
+
+
+# === CLIENTS ===
+
+class QueryCounter:
+    """SQL statements executed by the current thread"""
+
+    def __init__(self, engine):
+        self._local = threading.local()
+        event.listen(engine, 'after_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self._local.n = getattr(self._local, 'n', 0) + 1
+
+    def get(self):
+        return getattr(self._local, 'n', 0)
+
+
+def login(client, username):
+    # the JSON API checks session['user_id'], the pages use Flask-Login
+    client.post('/api/login', json={'username': username, 'password': PASSWORD})
+    client.post('/login', data={'username': username, 'password': PASSWORD})
+
+
+_cart_products = {}
+
+
+def cart_products(scenario, product_ids):
+    """The products in the starting cart of `scenario`, the same for every client"""
+    if scenario not in _cart_products:
+        n = CART_SCENARIOS[scenario]
+        _cart_products[scenario] = random.Random(n).sample(product_ids, n)
+    return _cart_products[scenario]
+
+
+def fill_cart(scenario, client, product_ids):
+    """Give a client of one of the CART_SCENARIOS its starting cart"""
+    # spread out ids and mixed quantities, which compress like a real cart
+    rnd = random.Random(CART_SCENARIOS[scenario])
+    cart = {str(pid): rnd.randint(1, 3) for pid in cart_products(scenario, product_ids)}
+    path = '/loadtest/cookie_cart/save' if scenario.startswith('cookie_') else '/api/cart/save'
+    client.post(path, json={'cart': cart})
+
+
+def cookie_bytes(web_app, scenario, username, product_ids):
+    """Size of the Cookie request header a client of `scenario` sends"""
+    client = web_app.app.test_client()
+    login(client, username)
+    fill_cart(scenario, client, product_ids)
+    make_request(scenario, client, random.Random(0), product_ids)
+    cookie = client.get_cookie(web_app.app.config['SESSION_COOKIE_NAME'])
+    return len(f'{cookie.key}={cookie.value}')
+
+
+def make_request(scenario, client, rnd, product_ids):
+    if scenario == 'browse':
+        return client.get('/')
+    if scenario == 'products':
+        return client.get('/api/products', query_string={'limit': 100})
+    if scenario == 'products_full':
+        return client.get('/loadtest/products_full')
+    if scenario == 'search':
+        return client.get('/api/products/search', query_string={'q': rnd.choice(WORDS)[:rnd.randint(2, 5)]})
+    if scenario in ('search_page', 'search_scan'):
+        path = '/' if scenario == 'search_page' else '/loadtest/search_scan'
+        return client.get(path, query_string={'q': rnd.choice(WORDS)[:rnd.randint(2, 5)]})
+    if scenario == 'cart_add':
+        return client.post('/api/cart/add', json={'product_id': rnd.choice(product_ids), 'qty': 1})
+    if scenario in CART_SCENARIOS:
+        # products already in the cart, so it keeps its size
+        path = '/loadtest/cookie_cart/add' if scenario.startswith('cookie_') else '/api/cart/add'
+        return client.post(path, json={'product_id': rnd.choice(cart_products(scenario, product_ids)), 'qty': 1})
+    if scenario == 'checkout':
+        cart = {str(pid): rnd.randint(1, 2) for pid in rnd.sample(product_ids, rnd.randint(1, 3))}
+        return client.post('/api/checkout', json={'cart': cart})
+    if scenario in ('orders', 'heavy_orders'):
+        return client.get('/api/orders')
+    if scenario == 'heavy_orders_all':
+        return client.get('/loadtest/orders_all')
+    if scenario == 'mixed':
+        if rnd.random() < 0.2:
+            return make_request('checkout', client, rnd, product_ids)
+        if rnd.random() < 0.5:
+            return client.get('/api/orders')
+        return client.get(f'/api/products/{rnd.choice(product_ids)}')
+    if scenario == 'oversell':
+        # product_ids is just the limited product
+        return client.post('/api/checkout', json={'cart': {str(product_ids[0]): 1}})
+    if scenario == 'checkout_replay':
+        return client.post('/api/checkout', json={'cart': {str(product_ids[0]): 1}},
+                           headers={'Idempotency-Key': REPLAY_KEY})
+    if scenario == 'admin_edit':
+        pid = rnd.choice(product_ids)
+        return client.post(f'/admin/edit/{pid}', data={
+            'name': f'{rnd.choice(WORDS).title()} {rnd.choice(WORDS)} {pid}',
+            'price': f'{rnd.uniform(1, 200):.2f}', 'stock': str(10 ** 7)})
+    if scenario == 'analytics':
+        return client.get('/admin/api/analytics')
+    raise ValueError(f'unknown scenario {scenario}')
+
+
+def run_clients(web_app, counter, scenario, clients, total, seed_value, user_names, product_ids, first=0, ready=None):
+    """Make `total` requests from `clients` threads of this process
+
+    Returns (latencies, queries, sizes, statuses, seconds). Clients are
+    numbered from `first`; `ready` is called once all of them are logged in,
+    just before the clock starts.
+    """
+    per_client = [total // clients + (1 if i < total % clients else 0) for i in range(clients)]
+    latencies, queries, sizes, statuses = [], [], [], {}
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients + 1)
+
+    def worker(index):
+        rnd = random.Random(seed_value * 1000 + first + index)
+        client = web_app.app.test_client()
+        if scenario in ADMIN_SCENARIOS:
+            login(client, 'loadtest-admin')
+        elif scenario in HEAVY_SCENARIOS:
+            login(client, HEAVY_USER)
+        else:
+            # replays only share an Idempotency-Key within one user
+            login(client, user_names[0 if scenario == 'checkout_replay' else (first + index) % len(user_names)])
+        if scenario in CART_SCENARIOS:
+            fill_cart(scenario, client, product_ids)
+        mine_latency, mine_queries, mine_sizes, mine_status = [], [], [], {}
+        barrier.wait()
+        for _ in range(per_client[index]):
+            before = counter.get()
+            started = time.perf_counter()
+            response = make_request(scenario, client, rnd, product_ids)
+            body = response.get_data()
+            mine_latency.append(time.perf_counter() - started)
+            mine_queries.append(counter.get() - before)
+            mine_sizes.append(len(body))
+            mine_status[response.status_code] = mine_status.get(response.status_code, 0) + 1
+        with lock:
+            latencies.extend(mine_latency)
+            queries.extend(mine_queries)
+            sizes.extend(mine_sizes)
+            for code, n in mine_status.items():
+                statuses[code] = statuses.get(code, 0) + n
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    if ready:
+        ready()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    return latencies, queries, sizes, statuses, time.perf_counter() - started
+
+
+def worker_process(results, barrier, web_app, *args):
+    with web_app.app.app_context():
+        # pooled connections were opened by the parent and stay with it
+        web_app.db.engine.dispose(close=False)
+    results.put(run_clients(web_app, *args, ready=barrier.wait)[:4])
+
+
+def run_scenario(web_app, counter, scenario, clients, total, seed_value, user_names, product_ids, workers=1):
+    if workers <= 1:
+        return summarize(*run_clients(web_app, counter, scenario, clients, total, seed_value, user_names,
+                                      product_ids))
+    ctx = multiprocessing.get_context('fork')
+    results = ctx.Queue()
+    barrier = ctx.Barrier(workers + 1)
+    processes = [
+        ctx.Process(target=worker_process, args=(
+            results, barrier, web_app, counter, scenario, clients, total // workers + (1 if w < total % workers else 0),
+            seed_value, user_names, product_ids, w * clients))
+        for w in range(workers)]
+    for p in processes:
+        p.start()
+    barrier.wait()
+    started = time.perf_counter()
+    parts = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for p in processes:
+        p.join()
+    latencies, queries, sizes, statuses = [], [], [], {}
+    for part_latencies, part_queries, part_sizes, part_statuses in parts:
+        latencies.extend(part_latencies)
+        queries.extend(part_queries)
+        sizes.extend(part_sizes)
+        for code, n in part_statuses.items():
+            statuses[code] = statuses.get(code, 0) + n
+    return summarize(latencies, queries, sizes, statuses, elapsed)
+
+
+def count_orders(web_app):
+    with web_app.app.app_context():
+        try:
+            return web_app.Order.query.count()
+        finally:
+            web_app.db.session.remove()
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summarize(latencies, queries, sizes, statuses, elapsed):
+    ordered = sorted(latencies)
+    ms = lambda s: round(s * 1000, 2)
+    return {
+        'requests': len(latencies),
+        'errors': sum(n for code, n in statuses.items() if code >= 400),
+        'statuses': {str(code): n for code, n in sorted(statuses.items())},
+        'seconds': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': ms(statistics.fmean(latencies)) if latencies else 0.0,
+        'p50_ms': ms(percentile(ordered, 0.50)),
+        'p90_ms': ms(percentile(ordered, 0.90)),
+        'p95_ms': ms(percentile(ordered, 0.95)),
+        'p99_ms': ms(percentile(ordered, 0.99)),
+        'max_ms': ms(ordered[-1]) if ordered else 0.0,
+        'queries_per_request': round(statistics.fmean(queries), 2) if queries else 0.0,
+        'max_queries': max(queries) if queries else 0,
+        'bytes_per_request': round(statistics.fmean(sizes)) if sizes else 0,
+    }
+
+
+# === REPORTING ===
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results, baseline=None):
+    header = (f'{"scenario":<17} {"req":>6} {"err":>5} {"rps":>8} {"p50":>8} {"p95":>8} {"p99":>8} '
+              f'{"sql/req":>8} {"KB/req":>9}')
+    if baseline:
+        header += f' {"rps Δ":>8} {"p95 Δ":>8}'
+    print(header)
+    for name, r in results.items():
+        line = (f'{name:<17} {r["requests"]:>6} {r["errors"]:>5} {r["rps"]:>8.1f} {r["p50_ms"]:>8.2f} '
+                f'{r["p95_ms"]:>8.2f} {r["p99_ms"]:>8.2f} {r["queries_per_request"]:>8.2f} '
+                f'{r.get("bytes_per_request", 0) / 1024:>9.1f}')
+        old = (baseline or {}).get(name)
+        if old:
+            line += f' {change(old["rps"], r["rps"]):>8} {change(old["p95_ms"], r["p95_ms"]):>8}'
+        print(line)
+
+
+def change(old, new):
+    if not old:
+        return 'n/a'
+    return f'{(new - old) / old * 100:+.0f}%'
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f'unknown scenarios: {", ".join(sorted(unknown))}')
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    setup_environment(workdir, args.sqlite_pragmas == 'on', args.catalog_cache == 'on')
+    import web_app
+
+    rnd = random.Random(args.seed)
+    with web_app.app.app_context():
+        heavy = args.heavy_orders if set(scenarios) & set(HEAVY_SCENARIOS) else 0
+        seeded = seed(web_app, rnd, args.users, args.products, args.orders, heavy)
+        product_ids = [p for (p,) in web_app.db.session.query(web_app.Product.id)]
+        web_app.db.session.remove()
+    print(f'seeded {seeded} in {workdir}')
+    register_baselines(web_app)
+    user_names = [f'user{i}' for i in range(args.users)] or ['loadtest-admin']
+    with web_app.app.app_context():
+        counter = QueryCounter(web_app.db.engine)
+
+    results = {}
+    failures = []
+    for index, scenario in enumerate(scenarios):
+        orders_before = count_orders(web_app)
+        targets = product_ids
+        if scenario == 'oversell':
+            targets = [add_product(web_app, args.oversell_stock)]
+        results[scenario] = run_scenario(web_app, counter, scenario, args.clients, args.requests,
+                                         args.seed + index, user_names, targets, args.workers)
+        print(f'{scenario}: {results[scenario]["rps"]} req/s, p95 {results[scenario]["p95_ms"]} ms')
+        if scenario in CART_SCENARIOS:
+            results[scenario]['cookie_bytes'] = cookie_bytes(web_app, scenario, user_names[0], product_ids)
+        if scenario == 'checkout_replay':
+            created = results[scenario]['orders_created'] = count_orders(web_app) - orders_before
+            if created != 1:
+                failures.append(f'checkout_replay created {created} orders, expected exactly 1')
+        if scenario == 'oversell':
+            created = results[scenario]['orders_created'] = count_orders(web_app) - orders_before
+            stock = results[scenario]['stock_left'] = product_stock(web_app, targets[0])
+            expected = min(args.oversell_stock, args.requests)
+            if stock < 0 or created != expected or stock != args.oversell_stock - created:
+                failures.append(f'oversell created {created} orders for {args.oversell_stock} units '
+                                f'({expected} expected), {stock} left')
+
+    report = {
+        'commit': git_commit(),
+        'at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {k: v for k, v in vars(args).items() if k not in ('out', 'compare', 'keep_db')},
+        'seed_data': seeded,
+        'scenarios': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['scenarios']
+    print()
+    print_table(results, baseline)
+    cookies = {name: r['cookie_bytes'] for name, r in results.items() if 'cookie_bytes' in r}
+    if cookies:
+        print('\nCookie header bytes: ' + ', '.join(f'{name} {n}' for name, n in cookies.items()))
+    print(f'\nresults written to {args.out}')
+    if args.keep_db:
+        print(f'database kept at {workdir}')
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if failures:
+        sys.exit('FAILED: ' + '; '.join(failures))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Persistent cart for the Kivy app.
+
+Lines are indexed by product id, so adding to the cart is a dict lookup
+rather than a scan. Changes are written to cart.json with a debounced,
+atomic write: a burst of taps produces one write once it settles, and a
+crash mid-write leaves the previous file intact (write to a temp file,
+fsync, then rename over the old one).
+"""
+import json
+import os
+
+CART_FILE = "cart.json"
+
+
+def kivy_schedule(callback, delay):
+    from kivy.clock import Clock
+    Clock.schedule_once(lambda dt: callback(), delay)
+
+
+class CartStore:
+    def __init__(self, path=CART_FILE, flush_delay=0.5, schedule=kivy_schedule):
+        self.path = path
+        self.flush_delay = flush_delay
+        self.schedule = schedule
+        self._lines = {}
+        self._dirty = False
+        self._flush_pending = False
+        self.writes = 0
+        self.bytes_written = 0
+        self.load()
+
+    def load(self):
+        """Read the saved cart (a list of {"product", "quantity"} lines)"""
+        try:
+            with open(self.path, "r") as f:
+                lines = json.load(f)
+        except (OSError, ValueError):
+            lines = []
+        self._lines = {}
+        for line in lines:
+            try:
+                self._lines[line["product"]["id"]] = line
+            except (KeyError, TypeError):
+                continue
+
+    # -- mutations ---------------------------------------------------------
+
+    def add(self, product, quantity=1):
+        line = self._lines.get(product["id"])
+        if line is None:
+            self._lines[product["id"]] = {"product": product, "quantity": quantity}
+        else:
+            line["quantity"] += quantity
+        self._changed()
+
+    def remove(self, product_id):
+        if self._lines.pop(product_id, None) is not None:
+            self._changed()
+
+    def clear(self):
+        if self._lines:
+            self._lines.clear()
+            self._changed()
+
+    # -- reads -------------------------------------------------------------
+
+    def __iter__(self):
+        return iter(list(self._lines.values()))
+
+    def __len__(self):
+        return len(self._lines)
+
+    def total(self):
+        return sum(line["product"]["price"] * line["quantity"] for line in self._lines.values())
+
+    def payload(self):
+        """The cart in /api/checkout form: {product_id: quantity}"""
+        return {str(pid): line["quantity"] for pid, line in self._lines.items()}
+
+    # -- persistence -------------------------------------------------------
+
+    def _changed(self):
+        self._dirty = True
+        if not self._flush_pending:
+            self._flush_pending = True
+            self.schedule(self._scheduled_flush, self.flush_delay)
+
+    def _scheduled_flush(self):
+        self._flush_pending = False
+        self.flush()
+
+    def flush(self):
+        """Write the cart now if it changed since the last write"""
+        if not self._dirty:
+            return
+        data = json.dumps(list(self._lines.values()), separators=(",", ":"))
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._dirty = False
+        self.writes += 1
+        self.bytes_written += len(data)
@@ -1,53 +1,90 @@
-import requests
-import json
+import os
+import uuid
+from io import BytesIO
 from kivy.app import App
 from kivy.lang import Builder
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.label import Label
-from kivy.uix.image import AsyncImage
+from kivy.uix.image import Image
+from kivy.core.image import Image as CoreImage
 from kivy.uix.button import Button
-from kivy.clock import mainthread
+from kivy.uix.relativelayout import RelativeLayout
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.properties import ObjectProperty
+from kivy.clock import Clock, mainthread
 from kivy.metrics import dp
 from kivy.graphics import Color, RoundedRectangle
-from threading import Thread
+from api_client import ApiClient
+from catalog_store import CatalogStore
+from image_cache import ImageCache
+from local_cart import CartStore
 
 Builder.load_file("shopping.kv")
 
-session = requests.Session()
+SERVER_URL = "http://172.29.184.133:5000"
 
-# Global cart storage
-cart = []
+# One background pool + keep-alive session for every request the app makes
+api = ApiClient(SERVER_URL)
 
-def save_cart():
-    with open("cart.json", "w") as f:
-        json.dump(cart, f)  # json.dump comes from the json module
+PRODUCT_FIELDS = "id,name,price,image,images"
+
+# network errors and 502/503/504 on checkout are retried with the same key
+CHECKOUT_RETRIES = 3
+
+# Offline catalog, kept in sync with /api/products/changes
+catalog = CatalogStore()
+
+# Product thumbnails: memory LRU + size-capped disk cache, 3 downloads at a time
+image_cache = ImageCache("image_cache")
+# rows below the current one whose images are fetched ahead of time
+PREFETCH_ROWS = 6
+
+# Global cart storage, persisted to cart.json
+cart = CartStore("cart.json")
 
 class LoginScreen(Screen):
     def login(self):
         username = self.ids.username.text
         password = self.ids.password.text
 
-        try:
-            response = session.post(
-                f"http://172.29.184.133:5000/api/login",
-                json={"username": username, "password": password}
-            )
-            data = response.json()
-
-            if response.status_code == 200 and data.get("status") == "success":
-                self.ids.message.text = "✅ Login Successful"
-                self.manager.current = "catalog"
-            else:
-                self.ids.message.text = f"❌ {data.get('message')}"
-
-        except Exception as e:
-            self.ids.message.text = f"❌ Error: {str(e)}"
-
-class ProductCard(BoxLayout):
-    def __init__(self, product, **kwargs):
-        super().__init__(orientation='vertical', size_hint_y=None, height=dp(180), spacing=dp(5), padding=dp(10), **kwargs)
-        self.product = product
+        self.ids.message.text = "Logging in..."
+        api.post(
+            "/api/login",
+            json={"username": username, "password": password},
+            on_success=self.on_login,
+            on_error=self.on_login_error
+        )
+
+    def on_login(self, response, data):
+        data = data or {}
+        if response.status_code == 200 and data.get("status") == "success":
+            self.ids.message.text = "✅ Login Successful"
+            self.manager.current = "catalog"
+        else:
+            self.ids.message.text = f"❌ {data.get('message')}"
+
+    def on_login_error(self, e):
+        self.ids.message.text = f"❌ Error: {str(e)}"
+
+def product_image_url(product, width="240"):
+    """Absolute URL of the resized JPEG variant, falling back to the original upload"""
+    path = product.get("images", {}).get("jpeg", {}).get(width) or product.get("image")
+    if not path or path.startswith(("http://", "https://")):
+        return path or ""
+    return f"{SERVER_URL}/{path}"
+
+class ProductCard(RecycleDataViewBehavior, BoxLayout):
+    """Catalog row; one instance is reused for many products as the list scrolls"""
+    product = ObjectProperty(None, allownone=True)
+    # wait this long after a card is bound before fetching its image, so
+    # rows that fly past during a fling never start a download
+    IMAGE_DELAY = 0.15
+
+    def __init__(self, **kwargs):
+        super().__init__(orientation='vertical', spacing=dp(5), padding=dp(10), **kwargs)
+        self._image_event = None
+        self._image_url = None
 
         # Card background
         with self.canvas.before:
@@ -57,20 +94,26 @@ class ProductCard(BoxLayout):
 
         # Top layout: Image + Details
         top_layout = BoxLayout(orientation='horizontal', spacing=dp(10))
-        img_url = product.get("image", "")
-        top_layout.add_widget(AsyncImage(source=img_url, size_hint_x=None, width=dp(100)) if img_url else Label(text="No Image", size_hint_x=None, width=dp(100)))
+        image_box = RelativeLayout(size_hint_x=None, width=dp(100))
+        self.image = Image(opacity=0)
+        self.no_image = Label(text="No Image")
+        image_box.add_widget(self.no_image)
+        image_box.add_widget(self.image)
+        top_layout.add_widget(image_box)
 
         details = BoxLayout(orientation='vertical', spacing=dp(5))
-        details.add_widget(Label(text=product.get("name", "N/A"), bold=True, font_size=dp(16)))
-        details.add_widget(Label(text=f"Price: ₱{product.get('price', 0)}", color=(1,0,0,1), font_size=dp(14)))
+        self.name_label = Label(bold=True, font_size=dp(16))
+        self.price_label = Label(color=(1,0,0,1), font_size=dp(14))
+        details.add_widget(self.name_label)
+        details.add_widget(self.price_label)
         top_layout.add_widget(details)
         self.add_widget(top_layout)
 
         # Rating stars
-        rating = product.get("rating", 0)
         stars_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=dp(20))
-        for i in range(5):
-            stars_layout.add_widget(Label(text="★" if i<rating else "☆", color=(1,0.8,0,1)))
+        self.stars = [Label(color=(1,0.8,0,1)) for _ in range(5)]
+        for star in self.stars:
+            stars_layout.add_widget(star)
         self.add_widget(stars_layout)
 
         # Add to Cart Button
@@ -78,14 +121,43 @@ class ProductCard(BoxLayout):
         btn.bind(on_press=self.add_to_cart)
         self.add_widget(btn)
 
+    def refresh_view_attrs(self, rv, index, data):
+        super().refresh_view_attrs(rv, index, data)
+        product = self.product
+        self.name_label.text = product.get("name", "N/A")
+        self.price_label.text = f"Price: ₱{product.get('price', 0)}"
+        rating = product.get("rating", 0)
+        for i, star in enumerate(self.stars):
+            star.text = "★" if i < rating else "☆"
+
+        # Throttle image loading to rows that stay on screen
+        if self._image_event is not None:
+            self._image_event.cancel()
+        img_url = product_image_url(product)
+        self._image_url = img_url
+        self.image.texture = None
+        self.image.opacity = 0
+        self.no_image.opacity = 0 if img_url else 1
+        if img_url:
+            self._image_event = Clock.schedule_once(lambda dt: self.load_image(img_url), self.IMAGE_DELAY)
+        if rv is not None:
+            upcoming = rv.data[index + 1:index + 1 + PREFETCH_ROWS]
+            image_cache.prefetch(product_image_url(d["product"]) for d in upcoming)
+
+    def load_image(self, img_url):
+        self._image_event = None
+        image_cache.get(img_url, self.on_image)
+
+    def on_image(self, img_url, data):
+        if img_url != self._image_url:
+            return  # card was recycled for another product meanwhile
+        ext = os.path.splitext(img_url)[1].lstrip(".").lower() or "jpg"
+        self.image.texture = CoreImage(BytesIO(data), ext=ext, nocache=True).texture
+        self.image.opacity = 1
+
     def add_to_cart(self, instance):
         # Add product to cart or increase quantity
-        for item in cart:
-            if item["product"]["id"] == self.product["id"]:
-                item["quantity"] += 1
-                break
-        else:
-            cart.append({"product": self.product, "quantity": 1})
+        cart.add(self.product)
         print(f"Cart updated: {len(cart)} items")
 
     def update_rect(self, *args):
@@ -93,29 +165,55 @@ class ProductCard(BoxLayout):
         self.rect.size = self.size
 
 class CatalogScreen(Screen):
+    # catalog version currently on screen (None until first render)
+    rendered_version = None
+
     def on_enter(self):
-        self.ids.products_container.clear_widgets()
-        self.ids.products_container.add_widget(Label(text="Loading products...", size_hint_y=None, height=dp(40)))
-        Thread(target=self._fetch_products).start()
-
-    def _fetch_products(self):
-        try:
-            response = requests.get("http://172.29.184.133:5000/api/products")
-            products = response.json()
-        except Exception as e:
-            print("Error fetching products:", e)
-            products = []
-        self.update_products(products)
+        if self.rendered_version is None:
+            if catalog.products:
+                # Render the offline copy straight away, then sync
+                self.update_products(catalog.all())
+                self.rendered_version = catalog.version
+            else:
+                self.ids.status.text = "Loading products..."
+        self.sync()
+
+    def sync(self):
+        api.get(
+            "/api/products/changes",
+            params={"since": catalog.version, "fields": PRODUCT_FIELDS},
+            on_success=self.on_changes,
+            on_error=self.on_sync_error
+        )
+
+    def on_changes(self, response, delta):
+        if response.status_code != 200:
+            self.on_sync_error(f"HTTP {response.status_code}")
+            return
+        old_version = catalog.version
+        catalog.apply(delta)
+        if catalog.version != old_version:
+            catalog.save()
+        if delta.get("more"):
+            if self.rendered_version is None:
+                # cold start: show each page as it arrives
+                self.update_products(catalog.all())
+            self.sync()
+            return
+        if self.rendered_version != catalog.version:
+            self.update_products(catalog.all())
+            self.rendered_version = catalog.version
+
+    def on_sync_error(self, e):
+        print("Error syncing products:", e)
+        if self.rendered_version is None:
+            self.update_products(catalog.all())
 
     @mainthread
     def update_products(self, products):
-        container = self.ids.products_container
-        container.clear_widgets()
-        if not products:
-            container.add_widget(Label(text="No products found", size_hint_y=None, height=dp(40)))
-            return
-        for product in products:
-            container.add_widget(ProductCard(product))
+        # The RecycleView only builds cards for the rows on screen
+        self.ids.products_view.data = [{"product": p} for p in products]
+        self.ids.status.text = "" if products else "No products found"
 
 class CartScreen(Screen):
     def on_enter(self):
@@ -139,10 +237,15 @@ class CartScreen(Screen):
         self.ids.total_label.text = f"Total: ₱{total_price}"
 
     def remove_item(self, item):
-        cart.remove(item)
+        cart.remove(item["product"]["id"])
         self.on_enter()  # Refresh cart screen
 
 class CheckoutScreen(Screen):
+    placing_order = False
+    # (cart payload, Idempotency-Key) of the order not yet confirmed, so a
+    # retry after a lost response can't order the same cart twice
+    pending_order = None
+
     def on_enter(self):
         self.ids.checkout_container.clear_widgets()
         if not cart:
@@ -166,30 +269,44 @@ class CheckoutScreen(Screen):
             self.ids.confirm_label.text = "❌ Cart is empty!"
             return
 
-        payload = {str(item["product"]["id"]): item["quantity"] for item in cart}
-
-        try:
-            response = session.post(
-                f"http://172.29.184.133:5000/api/checkout",
-                json={"cart": payload}
+        if self.placing_order:
+            return
+        self.placing_order = True
+        self.ids.confirm_label.text = "Placing order..."
+
+        payload = cart.payload()
+        if self.pending_order is None or self.pending_order[0] != payload:
+            self.pending_order = (payload, uuid.uuid4().hex)
+        api.post(
+            "/api/checkout",
+            json={"cart": payload},
+            headers={"Idempotency-Key": self.pending_order[1]},
+            retries=CHECKOUT_RETRIES,
+            on_success=self.on_order,
+            on_error=self.on_order_error
+        )
+
+    def on_order(self, response, data):
+        self.placing_order = False
+        data = data or {}
+        if response.status_code < 500:
+            self.pending_order = None
+        if response.status_code == 200 and data.get("status") == "success":
+            self.ids.confirm_label.text = (
+                f"✅ Order Placed!\n"
+                f"Order ID: {data['order_id']}\n"
+                f"Total: ₱{data['total']:.2f}"
             )
-            data = response.json()
-
-            if response.status_code == 200 and data.get("status") == "success":
-                self.ids.confirm_label.text = (
-                    f"✅ Order Placed!\n"
-                    f"Order ID: {data['order_id']}\n"
-                    f"Total: ₱{data['total']:.2f}"
-                )
-                cart.clear()
-                self.ids.checkout_container.clear_widgets()
-                self.ids.total_label.text = "Total: ₱0"
+            cart.clear()
+            self.ids.checkout_container.clear_widgets()
+            self.ids.total_label.text = "Total: ₱0"
 
-            else:
-                self.ids.confirm_label.text = f"❌ {data.get('message')}"
+        else:
+            self.ids.confirm_label.text = f"❌ {data.get('message')}"
 
-        except Exception as e:
-            self.ids.confirm_label.text = f"❌ Error: {str(e)}"
+    def on_order_error(self, e):
+        self.placing_order = False
+        self.ids.confirm_label.text = f"❌ Error: {str(e)}"
 
 
 class ShoppingApp(App):
@@ -201,5 +318,13 @@ class ShoppingApp(App):
         sm.add_widget(CheckoutScreen(name="checkout"))
         return sm
 
+    def on_pause(self):
+        # the OS may kill a paused app without calling on_stop
+        cart.flush()
+        return True
+
+    def on_stop(self):
+        cart.flush()
+
 if __name__ == "__main__":
     ShoppingApp().run()
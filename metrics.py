@@ -0,0 +1,213 @@
+"""Per-endpoint request metrics for web_app.
+
+For every request this records latency (into a fixed-bucket histogram),
+status, response size, and the number and total time of SQL statements it
+issued, counted with SQLAlchemy engine events. Requests slower than
+SLOW_REQUEST_MS are logged together with their slowest statements and kept
+in a short list for /admin/metrics.
+
+Numbers are per worker process. Set METRICS=0 to turn collection off.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from flask import request
+from sqlalchemy import event
+
+# upper bounds in seconds, as in the Prometheus client defaults
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_LOG_SIZE = 50
+SLOW_QUERIES_SHOWN = 5
+MAX_QUERIES_KEPT = 100
+
+log = logging.getLogger('web_app.metrics')
+
+
+class EndpointStats:
+    __slots__ = ('count', 'errors', 'seconds', 'max_seconds', 'buckets', 'statuses',
+                 'sql_count', 'sql_seconds', 'bytes')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.statuses = {}
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.bytes = 0
+
+    def quantile(self, q):
+        """Upper bound (seconds) of the bucket holding the q-th quantile"""
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.buckets):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.max_seconds
+
+
+class RequestMetrics:
+    def __init__(self, slow_ms=500):
+        self.slow_seconds = slow_ms / 1000
+        self.endpoints = {}
+        self.slow = deque(maxlen=SLOW_LOG_SIZE)
+        self.started = time.time()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    # -- hooks -------------------------------------------------------------
+
+    def before_request(self):
+        local = self._local
+        local.start = time.perf_counter()
+        local.sql_count = 0
+        local.sql_seconds = 0.0
+        local.queries = []
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_start'].pop()
+        local = self._local
+        if getattr(local, 'start', None) is None:
+            return  # outside a request (CLI, background threads)
+        local.sql_count += 1
+        local.sql_seconds += elapsed
+        if len(local.queries) < MAX_QUERIES_KEPT:
+            local.queries.append((elapsed, statement))
+
+    def after_request(self, response):
+        local = self._local
+        start = getattr(local, 'start', None)
+        if start is None:
+            return response
+        local.start = None
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or '<unmatched>'
+        key = (endpoint, request.method)
+        size = response.content_length or 0
+        with self._lock:
+            stats = self.endpoints.get(key)
+            if stats is None:
+                stats = self.endpoints[key] = EndpointStats()
+            stats.count += 1
+            stats.seconds += elapsed
+            stats.max_seconds = max(stats.max_seconds, elapsed)
+            stats.buckets[bisect.bisect_left(BUCKETS, elapsed)] += 1
+            stats.statuses[response.status_code] = stats.statuses.get(response.status_code, 0) + 1
+            if response.status_code >= 500:
+                stats.errors += 1
+            stats.sql_count += local.sql_count
+            stats.sql_seconds += local.sql_seconds
+            stats.bytes += size
+        if elapsed >= self.slow_seconds:
+            self._log_slow(endpoint, elapsed, response.status_code, local)
+        return response
+
+    def _log_slow(self, endpoint, elapsed, status, local):
+        worst = sorted(local.queries, key=lambda q: q[0], reverse=True)[:SLOW_QUERIES_SHOWN]
+        entry = {
+            'at': time.time(),
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'status': status,
+            'ms': round(elapsed * 1000, 1),
+            'sql_count': local.sql_count,
+            'sql_ms': round(local.sql_seconds * 1000, 1),
+            'slowest_queries': [{'ms': round(s * 1000, 2), 'sql': ' '.join(q.split())[:500]} for s, q in worst],
+        }
+        with self._lock:
+            self.slow.append(entry)
+        log.warning('slow request %s %s %.0f ms, %d queries (%.0f ms): %s',
+                    entry['method'], entry['path'], entry['ms'], entry['sql_count'], entry['sql_ms'],
+                    '; '.join(f"{q['ms']} ms {q['sql'][:200]}" for q in entry['slowest_queries']))
+
+    # -- reports -----------------------------------------------------------
+
+    def snapshot(self):
+        """Per-endpoint summary, busiest (by total time) first"""
+        with self._lock:
+            items = [(k, _copy(s)) for k, s in self.endpoints.items()]
+            slow = list(self.slow)
+        rows = []
+        for (endpoint, method), s in sorted(items, key=lambda kv: kv[1].seconds, reverse=True):
+            rows.append({
+                'endpoint': endpoint,
+                'method': method,
+                'count': s.count,
+                'errors': s.errors,
+                'statuses': s.statuses,
+                'avg_ms': round(s.seconds / s.count * 1000, 2),
+                'p50_ms': round(s.quantile(0.5) * 1000, 1),
+                'p95_ms': round(s.quantile(0.95) * 1000, 1),
+                'p99_ms': round(s.quantile(0.99) * 1000, 1),
+                'max_ms': round(s.max_seconds * 1000, 2),
+                'sql_per_request': round(s.sql_count / s.count, 2),
+                'sql_ms_per_request': round(s.sql_seconds / s.count * 1000, 2),
+                'avg_bytes': s.bytes // s.count,
+            })
+        return {'since': self.started, 'slow_ms': self.slow_seconds * 1000,
+                'endpoints': rows, 'slow_requests': slow}
+
+    def prometheus(self):
+        """The counters in Prometheus text exposition format"""
+        with self._lock:
+            items = sorted((k, _copy(s)) for k, s in self.endpoints.items())
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by endpoint.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for (endpoint, method), s in items:
+            labels = f'endpoint="{endpoint}",method="{method}"'
+            cumulative = 0
+            for bound, n in zip(BUCKETS, s.buckets):
+                cumulative += n
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {s.count}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {s.seconds:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {s.count}')
+        for name, kind, help_text, value in (
+                ('http_requests_total', 'counter', 'Requests by endpoint and status.', None),
+                ('http_response_bytes_total', 'counter', 'Response body bytes by endpoint.', 'bytes'),
+                ('db_queries_total', 'counter', 'SQL statements issued by endpoint.', 'sql_count'),
+                ('db_query_duration_seconds_total', 'counter', 'Time spent in SQL by endpoint.', 'sql_seconds')):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for (endpoint, method), s in items:
+                labels = f'endpoint="{endpoint}",method="{method}"'
+                if value is None:
+                    for status, n in sorted(s.statuses.items()):
+                        lines.append(f'{name}{{{labels},status="{status}"}} {n}')
+                else:
+                    lines.append(f'{name}{{{labels}}} {getattr(s, value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _copy(stats):
+    copy = EndpointStats()
+    for name in EndpointStats.__slots__:
+        value = getattr(stats, name)
+        setattr(copy, name, value.copy() if isinstance(value, (list, dict)) else value)
+    return copy
+
+
+def init_app(app, engine):
+    """Install the request hooks and SQL listeners; returns the RequestMetrics or None"""
+    if os.environ.get('METRICS', '1') == '0':
+        return None
+    metrics = RequestMetrics(slow_ms=float(os.environ.get('SLOW_REQUEST_MS', 500)))
+    app.before_request(metrics.before_request)
+    app.after_request(metrics.after_request)
+    event.listen(engine, 'before_cursor_execute', metrics.before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', metrics.after_cursor_execute)
+    app.extensions['metrics'] = metrics
+    return metrics
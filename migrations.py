@@ -0,0 +1,267 @@
+"""Versioned schema migrations for web_app.
+
+Applied versions are recorded in the `schema_version` table. On startup
+`migrate()` reads MAX(version) in a single query and returns straight away
+when the database is current; only pending migrations run, each in its own
+transaction together with its schema_version row.
+
+Migrations are plain functions registered in order with `@migration(n)`.
+They receive a Connection and the application's MetaData (so this module
+never imports web_app) and must cope with databases that predate this
+runner, where some of the work was already done by the old ad-hoc checks.
+Add new schema changes as a new numbered function at the end; never edit
+one that has shipped. A migration may create a table it introduces from
+the MetaData, but once that table changes, the change is a new migration.
+"""
+import time
+from datetime import datetime
+
+from sqlalchemy import (Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+                        inspect, text)
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+import analytics
+
+MIGRATIONS = []
+
+version_metadata = MetaData()
+schema_version = Table(
+    'schema_version', version_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(120), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+# The schema of the first release, frozen: migration 1 must create the same
+# tables however the models change later.
+baseline_metadata = MetaData()
+Table('user', baseline_metadata,
+      Column('id', Integer, primary_key=True),
+      Column('username', String(80), unique=True, nullable=False),
+      Column('password_hash', String(200), nullable=False),
+      Column('is_admin', Boolean))
+Table('product', baseline_metadata,
+      Column('id', Integer, primary_key=True),
+      Column('name', String(120), nullable=False, index=True),
+      Column('price', Float, nullable=False),
+      Column('image', String(200)),
+      Column('stock', Integer),
+      Column('image_variants', Text))
+Table('product_change', baseline_metadata,
+      Column('product_id', Integer, primary_key=True),
+      Column('version', Integer, nullable=False, unique=True),
+      Column('deleted', Boolean, nullable=False))
+Table('cart', baseline_metadata,
+      Column('id', String(32), primary_key=True),
+      Column('user_id', Integer, ForeignKey('user.id'), unique=True),
+      Column('updated_at', DateTime, index=True))
+Table('cart_line', baseline_metadata,
+      Column('cart_id', String(32), ForeignKey('cart.id'), primary_key=True),
+      Column('product_id', Integer, primary_key=True),
+      Column('qty', Integer, nullable=False))
+Table('order', baseline_metadata,
+      Column('id', Integer, primary_key=True),
+      Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+      Column('total', Float, nullable=False),
+      Column('created_at', DateTime),
+      Index('ix_order_user_created', 'user_id', 'created_at'))
+Table('order_item', baseline_metadata,
+      Column('id', Integer, primary_key=True),
+      Column('order_id', Integer, ForeignKey('order.id'), nullable=False, index=True),
+      Column('product_id', Integer, ForeignKey('product.id'), nullable=False),
+      Column('product_name', String(120), nullable=False),
+      Column('price', Float, nullable=False),
+      Column('qty', Integer, nullable=False))
+
+
+def migration(version):
+    """Register `fn(conn, metadata)` as schema version `version`"""
+    def register(fn):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f'migration {version} registered out of order')
+        MIGRATIONS.append((version, fn.__name__, fn))
+        return fn
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(conn):
+    """Highest applied version, or None before the first migration"""
+    try:
+        return conn.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        conn.rollback()
+        return None
+
+
+def pending(engine):
+    with engine.connect() as conn:
+        version = current_version(conn) or 0
+    return [m for m in MIGRATIONS if m[0] > version]
+
+
+def migrate(engine, metadata, log=None):
+    """Apply pending migrations; returns how many ran"""
+    with engine.connect() as conn:
+        version = current_version(conn)
+    if version == latest_version():
+        return 0
+    if version is None:
+        schema_version.create(engine, checkfirst=True)
+        version = 0
+    applied = 0
+    for number, name, fn in MIGRATIONS:
+        if number <= version:
+            continue
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            # another worker may have got here first
+            if conn.execute(text('SELECT 1 FROM schema_version WHERE version = :v'), {'v': number}).first():
+                continue
+            fn(conn, metadata)
+            conn.execute(schema_version.insert().values(version=number, name=name, applied_at=datetime.utcnow()))
+        applied += 1
+        if log:
+            log(f'applied migration {number} {name} ({(time.perf_counter() - started) * 1000:.0f} ms)')
+    return applied
+
+
+# === MIGRATIONS ===
+
+@migration(1)
+def create_tables(conn, metadata):
+    """The first release's tables (baseline_metadata) that do not exist yet"""
+    baseline_metadata.create_all(conn, checkfirst=True)
+
+
+@migration(2)
+def product_image_stock_variants(conn, metadata):
+    """Columns added to product after the first release"""
+    columns = {c['name'] for c in inspect(conn).get_columns('product')}
+    for name, ddl in (('image', 'TEXT'), ('stock', 'INTEGER DEFAULT 50'), ('image_variants', 'TEXT')):
+        if name not in columns:
+            conn.execute(text(f'ALTER TABLE product ADD COLUMN {name} {ddl}'))
+
+
+@migration(3)
+def hot_column_indexes(conn, metadata):
+    """Indexes for the order history, order items and product name lookups
+
+    user.username is UNIQUE and order.user_id leads ix_order_user_created,
+    so both are already indexed.
+    """
+    for table in ('order', 'order_item', 'product'):
+        for index in baseline_metadata.tables[table].indexes:
+            index.create(conn, checkfirst=True)
+
+
+PRODUCT_FTS_DDL = [
+    "CREATE VIRTUAL TABLE product_fts USING fts5(name, content='product', content_rowid='id')",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN
+         INSERT INTO product_fts(rowid, name) VALUES (new.id, new.name);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN
+         INSERT INTO product_fts(product_fts, rowid, name) VALUES ('delete', old.id, old.name);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name ON product BEGIN
+         INSERT INTO product_fts(product_fts, rowid, name) VALUES ('delete', old.id, old.name);
+         INSERT INTO product_fts(rowid, name) VALUES (new.id, new.name);
+       END""",
+]
+
+
+@migration(4)
+def product_search_index(conn, metadata):
+    """FTS5 product index and the triggers that keep it in sync (SQLite only)"""
+    if conn.dialect.name != 'sqlite':
+        return
+    if conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_fts'")).first():
+        return
+    try:
+        conn.execute(text(PRODUCT_FTS_DDL[0]))
+    except OperationalError:
+        # SQLite built without FTS5; search_products falls back to LIKE
+        return
+    for stmt in PRODUCT_FTS_DDL[1:]:
+        conn.execute(text(stmt))
+    # index the rows that were there before the triggers
+    conn.execute(text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
+
+
+# Every write to product (including the checkout stock decrement) moves the
+# product to the newest catalog version; deletes leave a tombstone.
+PRODUCT_CHANGE_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS product_change_ai AFTER INSERT ON product BEGIN
+         INSERT OR REPLACE INTO product_change(product_id, version, deleted)
+         VALUES (new.id, (SELECT COALESCE(MAX(version), 0) + 1 FROM product_change), 0);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS product_change_au AFTER UPDATE ON product BEGIN
+         INSERT OR REPLACE INTO product_change(product_id, version, deleted)
+         VALUES (new.id, (SELECT COALESCE(MAX(version), 0) + 1 FROM product_change), 0);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS product_change_ad AFTER DELETE ON product BEGIN
+         INSERT OR REPLACE INTO product_change(product_id, version, deleted)
+         VALUES (old.id, (SELECT COALESCE(MAX(version), 0) + 1 FROM product_change), 1);
+       END""",
+]
+
+
+@migration(5)
+def product_change_log(conn, metadata):
+    """Change log triggers, seeded with the existing products (SQLite only)"""
+    if conn.dialect.name != 'sqlite':
+        return
+    if conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'product_change_ai'")).first():
+        return
+    conn.execute(text(
+        "INSERT OR IGNORE INTO product_change(product_id, version, deleted) "
+        "SELECT id, (SELECT COALESCE(MAX(version), 0) FROM product_change) + ROW_NUMBER() OVER (ORDER BY id), 0 "
+        "FROM product"))
+    for stmt in PRODUCT_CHANGE_DDL:
+        conn.execute(text(stmt))
+
+
+@migration(6)
+def sales_rollups(conn, metadata):
+    """Daily sales rollup tables filled from existing orders, and an index for low-stock queries"""
+    metadata.create_all(conn, tables=[metadata.tables['product_daily_sales'], metadata.tables['daily_sales']])
+    for index in metadata.tables['product'].indexes:
+        index.create(conn, checkfirst=True)
+    analytics.backfill(conn)
+
+
+@migration(7)
+def job_queue(conn, metadata):
+    """Background job outbox and the low-stock alerts its first consumer writes"""
+    metadata.create_all(conn, tables=[metadata.tables['job'], metadata.tables['stock_alert']])
+
+
+@migration(8)
+def checkout_idempotency_keys(conn, metadata):
+    """Idempotency-Key records for /api/checkout"""
+    metadata.create_all(conn, tables=[metadata.tables['idempotency_key']])
+
+
+@migration(9)
+def product_change_log_everywhere(conn, metadata):
+    """Keep the change log from the app on every backend instead of SQLite triggers
+
+    Products the log doesn't know yet (every product on databases that never
+    had the triggers) are added after the newest version, and the counter
+    row starts from there.
+    """
+    if conn.dialect.name == 'sqlite':
+        for trigger in ('product_change_ai', 'product_change_au', 'product_change_ad'):
+            conn.execute(text(f'DROP TRIGGER IF EXISTS {trigger}'))
+    metadata.create_all(conn, tables=[metadata.tables['product_change_counter']])
+    latest = conn.execute(text('SELECT COALESCE(MAX(version), 0) FROM product_change')).scalar()
+    conn.execute(text(
+        "INSERT INTO product_change (product_id, version, deleted) "
+        "SELECT id, :latest + ROW_NUMBER() OVER (ORDER BY id), :deleted FROM product "
+        "WHERE id NOT IN (SELECT product_id FROM product_change)"), {'latest': latest, 'deleted': False})
+    latest = conn.execute(text('SELECT COALESCE(MAX(version), 0) FROM product_change')).scalar()
+    conn.execute(text('DELETE FROM product_change_counter'))
+    conn.execute(text('INSERT INTO product_change_counter (id, version) VALUES (1, :latest)'), {'latest': latest})
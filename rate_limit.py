@@ -0,0 +1,60 @@
+"""In-process sliding-window rate limiter.
+
+Used to cap failed login attempts before any password hashing happens, so
+a brute-force run costs a dict lookup per request instead of a hash. Counts
+are per worker process; with N workers an attacker gets at most N times
+the limit.
+"""
+import threading
+import time
+from collections import deque
+
+
+class RateLimiter:
+    def __init__(self, limit=10, window=60, max_keys=100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._hits = {}
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _prune(self, now):
+        cutoff = now - self.window
+        for key in [k for k, q in self._hits.items() if not q or q[-1] <= cutoff]:
+            del self._hits[key]
+
+    def hit(self, key):
+        """Record an attempt for `key`; returns 0 if allowed, else seconds until it would be"""
+        now = time.monotonic()
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                if len(self._hits) >= self.max_keys:
+                    self._prune(now)
+                hits = self._hits[key] = deque()
+            while hits and hits[0] <= now - self.window:
+                hits.popleft()
+            if len(hits) >= self.limit:
+                self.rejected += 1
+                return hits[0] + self.window - now
+            hits.append(now)
+            return 0
+
+    def wait(self, key):
+        """Like hit() but without recording an attempt"""
+        now = time.monotonic()
+        with self._lock:
+            hits = self._hits.get(key)
+            if not hits:
+                return 0
+            while hits and hits[0] <= now - self.window:
+                hits.popleft()
+            if len(hits) >= self.limit:
+                self.rejected += 1
+                return hits[0] + self.window - now
+            return 0
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
@@ -0,0 +1,230 @@
+"""Slow-client benchmark: sync gunicorn worker vs asgi_app, one process each.
+
+Seeds a scratch database the same way as loadtest.py, then for each server
+and each count N in --clients opens N connections to the read API that send
+half of their request, stall for --stall-seconds (a slow mobile uplink) and
+then finish it. While they are stalled a probe client keeps fetching a
+product page and records how long each takes.
+
+A sync worker gives each connection a thread from its first byte until it
+has been answered, so once N reaches --threads every other request waits
+for a stalled client. The ASGI server waits on all of them at once. The
+largest N at which no probe took longer than --probe-limit-ms is reported
+as the number of slow connections the process can hold.
+
+    pip install -r requirements-asgi.txt
+    python slow_clients.py --clients 1,2,4,8,32,128,512 --out slow.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+import loadtest
+
+PATHS = ('/api/products?limit=20', '/api/products/{pid}', '/api/orders?limit=10')
+PROBE_PATH = '/api/products?limit=20'
+SERVERS = ('sync', 'asgi')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--clients', default='1,2,4,8,32,128,512', help='slow connection counts to try')
+    parser.add_argument('--stall-seconds', type=float, default=2.0, help='how long each slow request stalls')
+    parser.add_argument('--threads', type=int, default=4, help='threads of the sync gunicorn worker')
+    parser.add_argument('--probe-limit-ms', type=float, default=100.0)
+    parser.add_argument('--servers', default=','.join(SERVERS))
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', default='slow_clients.json')
+    return parser.parse_args(argv)
+
+
+# === SERVERS ===
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def server_command(kind, port, threads):
+    if kind == 'sync':
+        return [sys.executable, '-m', 'gunicorn', '-w', '1', '--threads', str(threads),
+                '-b', f'127.0.0.1:{port}', '--log-level', 'warning', 'web_app:app']
+    return [sys.executable, '-m', 'uvicorn', 'asgi_app:app', '--port', str(port), '--log-level', 'warning']
+
+
+def wait_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}{PROBE_PATH}', timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def session_cookie(port, username):
+    """Log in through the form and return the session cookie header value"""
+    data = f'username={username}&password={loadtest.PASSWORD}'.encode()
+    opener = urllib.request.build_opener(NoRedirect)
+    try:
+        response = opener.open(f'http://127.0.0.1:{port}/login', data=data, timeout=10)
+    except urllib.error.HTTPError as e:
+        # the successful login is a redirect
+        response = e
+    return response.headers['Set-Cookie'].split(';', 1)[0]
+
+
+# === CLIENTS ===
+
+async def fetch(port, path, cookie, stall=0.0, timeout=30.0):
+    """GET `path`, pausing `stall` seconds halfway through the request; returns (status, seconds)
+
+    A request that takes longer than `timeout` counts as status 0.
+    """
+    started = time.perf_counter()
+    try:
+        return await asyncio.wait_for(_fetch(port, path, cookie, stall, started), stall + timeout)
+    except (asyncio.TimeoutError, OSError):
+        return 0, time.perf_counter() - started
+
+
+async def _fetch(port, path, cookie, stall, started):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    request = (f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\n'
+               f'Connection: close\r\n\r\n').encode()
+    if stall:
+        writer.write(request[:len(request) // 2])
+        await writer.drain()
+        await asyncio.sleep(stall)
+        request = request[len(request) // 2:]
+    writer.write(request)
+    await writer.drain()
+    try:
+        response = await reader.read()
+    finally:
+        writer.close()
+    status = int(response.split(b' ', 2)[1]) if response else 0
+    return status, time.perf_counter() - started
+
+
+async def run_level(port, clients, stall, cookie, product_ids):
+    """Open `clients` stalled connections and probe the server while they stall"""
+    started = time.perf_counter()
+    slow = asyncio.gather(*(
+        fetch(port, PATHS[i % len(PATHS)].format(pid=product_ids[i % len(product_ids)]), cookie, stall)
+        for i in range(clients)))
+    # let every slow connection get its first bytes in
+    await asyncio.sleep(min(0.2, stall / 4))
+    probes = []
+    while time.perf_counter() - started < stall * 0.75:
+        probes.append(await fetch(port, PROBE_PATH, cookie))
+    results = await slow
+    return results, probes
+
+
+def summarize(clients, results, probes):
+    ms = lambda s: round(s * 1000, 1)
+    times = sorted(seconds for _, seconds in results)
+    errors = sum(1 for status, _ in results + probes if status != 200)
+    probes = sorted(seconds for _, seconds in probes)
+    return {
+        'clients': clients,
+        'errors': errors,
+        'slow_max_ms': ms(times[-1]),
+        'probes': len(probes),
+        'probe_p50_ms': ms(loadtest.percentile(probes, 0.50)),
+        'probe_max_ms': ms(probes[-1]) if probes else 0.0,
+    }
+
+
+# === REPORTING ===
+
+def capacity(levels, limit_ms):
+    """Largest slow-connection count at which every probe took less than `limit_ms`"""
+    ok = [level['clients'] for level in levels if level['probe_max_ms'] < limit_ms and not level['errors']]
+    return max(ok) if ok else 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    servers = [s.strip() for s in args.servers.split(',') if s.strip()]
+    unknown = set(servers) - set(SERVERS)
+    if unknown:
+        sys.exit(f'unknown servers: {", ".join(sorted(unknown))}')
+    counts = [int(n) for n in args.clients.split(',') if n.strip()]
+    workdir = tempfile.mkdtemp(prefix='slow-clients-')
+    loadtest.setup_environment(workdir)
+    import web_app
+
+    with web_app.app.app_context():
+        seeded = loadtest.seed(web_app, random.Random(args.seed), args.users, args.products, args.orders)
+        product_ids = [p for (p,) in web_app.db.session.query(web_app.Product.id).limit(100)]
+        web_app.db.session.remove()
+    print(f'seeded {seeded} in {workdir}')
+
+    results = {}
+    try:
+        for kind in servers:
+            port = free_port()
+            proc = subprocess.Popen(server_command(kind, port, args.threads),
+                                    cwd=os.path.dirname(os.path.abspath(__file__)))
+            levels = []
+            try:
+                wait_ready(port)
+                cookie = session_cookie(port, 'user0')
+                for n in counts:
+                    levels.append(summarize(n, *asyncio.run(
+                        run_level(port, n, args.stall_seconds, cookie, product_ids))))
+                    print(f'{kind} {n}: probe p50 {levels[-1]["probe_p50_ms"]} ms')
+            finally:
+                proc.terminate()
+                proc.wait(10)
+            results[kind] = {'capacity': capacity(levels, args.probe_limit_ms), 'levels': levels}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'commit': loadtest.git_commit(),
+        'at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'params': {k: v for k, v in vars(args).items() if k != 'out'},
+        'servers': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nprobe p50 / max (ms) while N slow connections stall for {args.stall_seconds:g} s')
+    print(f'{"N":>6} ' + ' '.join(f'{kind:>20}' for kind in results))
+    for i, n in enumerate(counts):
+        cells = []
+        for r in results.values():
+            level = r['levels'][i]
+            cells.append(f'{level["probe_p50_ms"]:>9.1f} / {level["probe_max_ms"]:>8.1f}'
+                         + ('!' if level['errors'] else ' '))
+        print(f'{n:>6} ' + ' '.join(f'{c:>20}' for c in cells))
+    for kind, r in results.items():
+        print(f'{kind}: holds {r["capacity"]} slow connections with every probe under {args.probe_limit_ms:g} ms')
+    print(f'\nresults written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Shared fixtures: web_app on a scratch SQLite database, and a stand-in
+HTTP server for the app's network clients
+
+The environment is set up before web_app is imported, since it reads its
+configuration at import time.
+"""
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+WORKDIR = tempfile.mkdtemp(prefix='shop-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR, 'test.db')
+os.environ['CATALOG_CACHE_STAMP'] = os.path.join(WORKDIR, 'catalog.version')
+os.environ['USER_CACHE_STAMP'] = os.path.join(WORKDIR, 'users.version')
+# cheap hashes, and no background job thread sharing the engine with the tests
+os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+os.environ['JOB_WORKERS'] = '0'
+
+PASSWORD = 'secret'
+_names = itertools.count(1)
+
+
+@pytest.fixture(scope='session')
+def web_app():
+    import web_app
+    with web_app.app.app_context():
+        web_app.init_db()
+        web_app.db.session.remove()
+    return web_app
+
+
+@pytest.fixture
+def app_context(web_app):
+    with web_app.app.app_context():
+        yield
+        web_app.db.session.remove()
+
+
+def make_user(web_app, is_admin=False):
+    """Create a user with PASSWORD and return its username"""
+    username = f'user{next(_names)}'
+    with web_app.app.app_context():
+        web_app.db.session.add(web_app.User(
+            username=username, password_hash=web_app.hash_password(PASSWORD), is_admin=is_admin))
+        web_app.db.session.commit()
+        web_app.db.session.remove()
+    return username
+
+
+def make_products(web_app, n, stock=10 ** 6):
+    """Insert `n` products and return their ids"""
+    with web_app.app.app_context():
+        products = [web_app.Product(name=f'Product {next(_names)}', price=2.5, stock=stock) for _ in range(n)]
+        web_app.db.session.add_all(products)
+        web_app.db.session.commit()
+        ids = [p.id for p in products]
+        web_app.db.session.remove()
+    web_app.catalog_cache.bump()
+    return ids
+
+
+def login(client, username):
+    """Sign in through both the JSON API (session user_id) and the form (Flask-Login)"""
+    assert client.post('/api/login', json={'username': username, 'password': PASSWORD}).status_code == 200
+    assert client.post('/login', data={'username': username, 'password': PASSWORD}).status_code == 302
+
+
+@pytest.fixture
+def client(web_app):
+    return web_app.app.test_client()
+
+
+@pytest.fixture
+def user_client(web_app, client):
+    login(client, make_user(web_app))
+    return client
+
+
+# === STAND-IN SERVER ===
+
+class StandIn(ThreadingHTTPServer):
+    """Keep-alive HTTP/1.1 server answering from `routes`
+
+    routes maps a path (without query) to handler(request, body) returning
+    (status, headers, payload bytes). Connections and requests are counted.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.routes = {}
+        self.connections = 0
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def requests_to(self, path):
+        return [r for r in self.requests if r[1].split('?', 1)[0] == path]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def answer(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        with self.server.lock:
+            self.server.requests.append((self.command, self.path, dict(self.headers)))
+        route = self.server.routes.get(self.path.split('?', 1)[0])
+        status, headers, payload = route(self, body) if route else (404, {}, b'')
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = answer
+
+
+def json_route(data, status=200, delay=0.0):
+    def route(request, body):
+        time.sleep(delay)
+        return status, {'Content-Type': 'application/json'}, json.dumps(data).encode()
+    return route
+
+
+@pytest.fixture
+def standin():
+    server = StandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,108 @@
+"""ApiClient against a local stand-in server, without a Kivy window
+
+Callbacks are dispatched to a queue that the test thread drains, the way
+Kivy's Clock runs them on the UI thread. The server answers slowly, so any
+request sent from the calling thread would show up as blocking time.
+"""
+import queue
+import threading
+import time
+
+import pytest
+
+import api_client
+from api_client import ApiClient
+from conftest import json_route
+
+DELAY = 0.2
+
+
+class MainLoop:
+    """Stand-in for the Kivy main thread"""
+
+    def __init__(self):
+        self.calls = queue.Queue()
+        self.thread = threading.current_thread()
+        self.ran_on = set()
+
+    def dispatch(self, func, *args):
+        self.calls.put((func, args))
+
+    def run(self, n, timeout=5):
+        """Run the next `n` dispatched callbacks"""
+        for _ in range(n):
+            func, args = self.calls.get(timeout=timeout)
+            self.ran_on.add(threading.current_thread())
+            func(*args)
+
+
+@pytest.fixture
+def loop():
+    return MainLoop()
+
+
+@pytest.fixture
+def api(standin, loop):
+    api = ApiClient(standin.url, max_workers=4, dispatch=loop.dispatch)
+    yield api
+    api.close()
+
+
+def test_requests_do_not_block_the_ui_thread(standin, loop, api):
+    standin.routes['/api/products'] = json_route([{'id': 1}], delay=DELAY)
+    standin.routes['/api/login'] = json_route({'status': 'success'}, delay=DELAY)
+    results = []
+
+    started = time.perf_counter()
+    for i in range(4):
+        api.get('/api/products', params={'cursor': i}, on_success=lambda r, d: results.append(d))
+    api.post('/api/login', json={'username': 'u'}, on_success=lambda r, d: results.append(d))
+    blocked = time.perf_counter() - started
+
+    loop.run(5)
+    assert blocked < DELAY / 4, f'UI thread blocked for {blocked * 1000:.1f} ms'
+    assert len(results) == 5
+    assert loop.ran_on == {loop.thread}
+
+
+def test_connections_are_reused(standin, loop, api):
+    standin.routes['/api/products'] = json_route([])
+    for i in range(20):
+        api.get('/api/products', params={'cursor': i}, on_success=lambda r, d: None)
+        loop.run(1)
+    assert len(standin.requests) == 20
+    assert standin.connections == 1
+
+
+def test_concurrent_identical_gets_share_one_request(standin, loop, api):
+    standin.routes['/api/products'] = json_route([{'id': 1}], delay=DELAY)
+    results = []
+    for _ in range(5):
+        api.get('/api/products', params={'limit': 10}, on_success=lambda r, d: results.append(d))
+    loop.run(5)
+    assert results == [[{'id': 1}]] * 5
+    assert len(standin.requests_to('/api/products')) == 1
+
+
+def test_network_errors_reach_on_error(loop):
+    client = ApiClient('http://127.0.0.1:9', timeout=(0.5, 0.5), dispatch=loop.dispatch)
+    errors = []
+    client.get('/api/products', on_error=errors.append)
+    loop.run(1)
+    client.close()
+    assert len(errors) == 1
+
+
+def test_retries_gateway_errors(standin, loop, api, monkeypatch):
+    monkeypatch.setattr(api_client, 'RETRY_BACKOFF', 0.01)
+    statuses = iter([503, 502, 200])
+
+    def flaky(request, body):
+        return next(statuses), {'Content-Type': 'application/json'}, b'{}'
+
+    standin.routes['/api/checkout'] = flaky
+    responses = []
+    api.post('/api/checkout', json={}, retries=3, on_success=lambda r, d: responses.append(r.status_code))
+    loop.run(1)
+    assert responses == [200]
+    assert len(standin.requests_to('/api/checkout')) == 3
@@ -0,0 +1,88 @@
+"""Fingerprinted static files over a simulated browsing session
+
+A small browser cache replays a session of page views: fresh entries are
+used without a request, stale ones are revalidated with If-None-Match.
+With versioned URLs every asset should cost one download for the whole
+session; with the plain paths the templates used before, every later page
+view revalidates each asset again.
+"""
+import re
+
+import pytest
+
+from conftest import make_products
+
+PAGES = ('/', '/cart', '/login', '/?q=product', '/signup', '/', '/cart', '/')
+ASSET = re.compile(r'(?:href|src)="(/static/[^"]+)"')
+
+
+class Browser:
+    """Counts requests and bytes the way a browser cache would spend them"""
+
+    def __init__(self, client, versioned=True):
+        self.client = client
+        self.versioned = versioned
+        self.cache = {}  # url -> (immutable, etag)
+        self.downloads = self.conditional = self.not_modified = self.bytes = 0
+
+    def page(self, path):
+        response = self.client.get(path, headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        for url in sorted(set(ASSET.findall(response.get_data(as_text=True)))):
+            self.asset(url if self.versioned else url.split('?', 1)[0])
+
+    def asset(self, url):
+        headers = {'Accept-Encoding': 'gzip'}
+        cached = self.cache.get(url)
+        if cached:
+            immutable, etag = cached
+            if immutable:
+                return
+            headers['If-None-Match'] = etag
+            self.conditional += 1
+        response = self.client.get(url, headers=headers)
+        self.bytes += len(response.data)
+        if response.status_code == 304:
+            self.not_modified += 1
+            return
+        assert response.status_code == 200
+        self.downloads += 1
+        self.cache[url] = ('immutable' in response.headers['Cache-Control'], response.headers['ETag'])
+
+
+def browse(client, versioned):
+    browser = Browser(client, versioned)
+    for path in PAGES:
+        browser.page(path)
+    return browser
+
+
+@pytest.fixture(scope='module', autouse=True)
+def catalog(web_app):
+    # products without an image show the placeholder
+    make_products(web_app, 3)
+
+
+def test_versioned_assets_are_fetched_once_per_session(web_app, client):
+    browser = browse(client, versioned=True)
+    assert browser.downloads == len(browser.cache) >= 2  # style.css and placeholder.svg
+    assert browser.conditional == 0
+
+
+def test_plain_paths_revalidate_on_every_page(web_app, client):
+    versioned = browse(client, versioned=True)
+    plain = browse(web_app.app.test_client(), versioned=False)
+    assert plain.downloads == len(plain.cache)
+    assert plain.conditional == plain.not_modified > 0
+    assert plain.conditional >= len(PAGES) - 1
+    assert plain.bytes >= versioned.bytes
+
+
+def test_text_assets_are_served_compressed(web_app, client):
+    url = web_app.app.extensions['assets'].url('style.css')
+    plain = client.get(url)
+    gzipped = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in gzipped.headers['Vary']
+    assert gzipped.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert len(gzipped.data) < len(plain.data)
@@ -0,0 +1,93 @@
+"""Server-side carts: TTL sweep, carts that expired under a live session,
+the guest-to-user merge on login and carts left in old session cookies
+"""
+from datetime import datetime, timedelta
+
+from conftest import login, make_products, make_user
+
+
+def session_cart(client):
+    with client.session_transaction() as sess:
+        return sess.get('cart_id')
+
+
+def cart(web_app, cid):
+    with web_app.app.app_context():
+        try:
+            return web_app.cart_items(cid)
+        finally:
+            web_app.db.session.remove()
+
+
+def expire(web_app, cid):
+    with web_app.app.app_context():
+        web_app.Cart.query.filter_by(id=cid).update(
+            {'updated_at': datetime.utcnow() - timedelta(seconds=web_app.CART_TTL + 60)})
+        web_app.db.session.commit()
+        web_app.sweep_expired_carts()
+        web_app.db.session.remove()
+
+
+def orphan_lines(web_app):
+    with web_app.app.app_context():
+        try:
+            return web_app.CartLine.query.filter(
+                ~web_app.db.exists().where(web_app.Cart.id == web_app.CartLine.cart_id)).count()
+        finally:
+            web_app.db.session.remove()
+
+
+def test_sweep_deletes_only_expired_guest_carts(web_app, client):
+    p1, p2 = make_products(web_app, 2)
+    assert client.post('/api/cart/save', json={'cart': {str(p1): 1, str(p2): 2}}).status_code == 200
+    old = session_cart(client)
+    fresh = web_app.app.test_client()
+    fresh.post('/api/cart/save', json={'cart': {str(p1): 1}})
+    expire(web_app, old)
+    assert cart(web_app, old) == {}
+    assert cart(web_app, session_cart(fresh)) == {p1: 1}
+    with web_app.app.app_context():
+        assert web_app.db.session.get(web_app.Cart, old) is None
+        web_app.db.session.remove()
+
+
+def test_expired_cart_is_replaced_not_written_to(web_app, client):
+    p1, p2 = make_products(web_app, 2)
+    client.post('/api/cart/save', json={'cart': {str(p1): 1}})
+    old = session_cart(client)
+    expire(web_app, old)
+
+    assert client.get(f'/add/{p2}').status_code == 302
+    new = session_cart(client)
+    assert new != old
+    assert cart(web_app, new) == {p2: 1}
+    assert orphan_lines(web_app) == 0
+    assert client.get('/').status_code == 200
+
+
+def test_login_merges_the_guest_cart(web_app, client):
+    p1, p2 = make_products(web_app, 2)
+    username = make_user(web_app)
+    owner = web_app.app.test_client()
+    login(owner, username)
+    owner.post('/api/cart/save', json={'cart': {str(p1): 1, str(p2): 1}})
+    user_cart = session_cart(owner)
+
+    client.post('/api/cart/save', json={'cart': {str(p1): 2}})
+    guest = session_cart(client)
+    login(client, username)
+    assert session_cart(client) == user_cart
+    assert cart(web_app, user_cart) == {p1: 3, p2: 1}
+    assert cart(web_app, guest) == {}
+    assert orphan_lines(web_app) == 0
+
+
+def test_legacy_cookie_cart_keeps_only_valid_lines(web_app, client):
+    p1, p2 = make_products(web_app, 2)
+    with client.session_transaction() as sess:
+        sess['guest_cart'] = {str(p1): 2, 'abc': 1, str(p2): -1, '7': 1.5, '8': 'x'}
+        sess['cart'] = ['not', 'a', 'dict']
+    assert client.get('/').status_code == 200
+    assert cart(web_app, session_cart(client)) == {p1: 2}
+    with client.session_transaction() as sess:
+        assert 'guest_cart' not in sess and 'cart' not in sess
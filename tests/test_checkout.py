@@ -0,0 +1,48 @@
+"""Checkout input validation and stock under concurrent orders"""
+import threading
+
+import pytest
+
+from conftest import login, make_products, make_user
+
+
+@pytest.mark.parametrize('qty', [True, False, 0, -1, 1.5, '2'])
+def test_api_checkout_rejects_bad_quantities(web_app, user_client, qty):
+    pid = make_products(web_app, 1)[0]
+    response = user_client.post('/api/checkout', json={'cart': {str(pid): qty}})
+    assert response.status_code == 400
+    assert response.get_json() == {'status': 'error', 'message': f'Invalid quantity for product {pid}'}
+
+
+@pytest.mark.parametrize('qty', [True, 0, 1.5])
+def test_cart_save_rejects_bad_quantities(web_app, client, qty):
+    pid = make_products(web_app, 1)[0]
+    response = client.post('/api/cart/save', json={'cart': {str(pid): qty}})
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_concurrent_checkouts_never_oversell(web_app, app_context):
+    stock, buyers = 5, 20
+    pid = make_products(web_app, 1, stock=stock)[0]
+    clients = []
+    for _ in range(buyers):
+        client = web_app.app.test_client()
+        login(client, make_user(web_app))
+        clients.append(client)
+    statuses = []
+    barrier = threading.Barrier(buyers)
+
+    def buy(client):
+        barrier.wait()
+        statuses.append(client.post('/api/checkout', json={'cart': {str(pid): 1}}).status_code)
+
+    threads = [threading.Thread(target=buy, args=(c,)) for c in clients]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(statuses) == [200] * stock + [400] * (buyers - stock)
+    assert web_app.db.session.get(web_app.Product, pid).stock == 0
+    assert web_app.OrderItem.query.filter_by(product_id=pid).count() == stock
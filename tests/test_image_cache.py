@@ -0,0 +1,123 @@
+"""ImageCache against a local stand-in image server
+
+Browses a 3-page catalog of thumbnails back and forth and counts what
+reaches the network: each image is downloaded once, a restart is served
+from disk, and expired entries are revalidated instead of downloaded.
+"""
+import threading
+import time
+
+import pytest
+
+from image_cache import ImageCache
+
+PAGES, PER_PAGE = 3, 10
+IMAGE_BYTES = 2048
+
+
+def image_route(n, delay=0.0):
+    etag = f'"img-{n}"'
+    payload = bytes([n % 256]) * IMAGE_BYTES
+
+    def route(request, body):
+        time.sleep(delay)
+        if request.headers.get('If-None-Match') == etag:
+            return 304, {'ETag': etag}, b''
+        return 200, {'Content-Type': 'image/jpeg', 'ETag': etag}, payload
+    return route
+
+
+@pytest.fixture
+def pages(standin):
+    urls = []
+    for n in range(PAGES * PER_PAGE):
+        standin.routes[f'/img/{n}.jpg'] = image_route(n)
+        urls.append(f'{standin.url}/img/{n}.jpg')
+    return [urls[i:i + PER_PAGE] for i in range(0, len(urls), PER_PAGE)]
+
+
+def open_cache(path, **kwargs):
+    # callbacks run straight away instead of on the Kivy main thread
+    return ImageCache(str(path), dispatch=lambda func, *args: func(*args), **kwargs)
+
+
+def show(cache, urls):
+    """Request every image of a page and wait until they are loaded"""
+    shown = []
+    futures = [cache.get(url, lambda url, data: shown.append(url)) for url in urls]
+    for future in futures:
+        if future is not None:
+            future.result(timeout=5)
+    return shown
+
+
+def image_requests(standin):
+    return [r for r in standin.requests if r[1].startswith('/img/')]
+
+
+def test_repeated_navigation_fetches_each_image_once(standin, pages, tmp_path):
+    cache = open_cache(tmp_path)
+    for _ in range(3):
+        for page in pages:
+            show(cache, page)
+    assert cache.stats['fetches'] == len(image_requests(standin)) == PAGES * PER_PAGE
+    assert cache.stats['bytes_fetched'] == PAGES * PER_PAGE * IMAGE_BYTES
+    assert cache.hit_rate() == pytest.approx(2 / 3)
+
+
+def test_restart_is_served_from_disk(standin, pages, tmp_path):
+    for page in pages:
+        show(open_cache(tmp_path), page)
+    cache = open_cache(tmp_path)
+    for page in pages:
+        show(cache, page)
+    assert cache.stats['fetches'] == 0
+    assert cache.stats['disk_hits'] == PAGES * PER_PAGE
+    assert len(image_requests(standin)) == PAGES * PER_PAGE
+
+
+def test_expired_entries_are_revalidated(standin, pages, tmp_path):
+    show(open_cache(tmp_path), pages[0])
+    cache = open_cache(tmp_path, max_age=0)
+    assert len(show(cache, pages[0])) == PER_PAGE
+    assert cache.stats['revalidated'] == cache.stats['fetches'] == PER_PAGE
+    assert cache.stats['bytes_fetched'] == 0
+    assert all(r[2].get('If-None-Match') for r in image_requests(standin)[PER_PAGE:])
+
+
+def test_prefetched_page_needs_no_fetch(standin, pages, tmp_path):
+    cache = open_cache(tmp_path)
+    show(cache, pages[0])
+    cache.prefetch(pages[1])
+    cache.executor.shutdown(wait=True)  # let the prefetches finish
+    fetches = cache.stats['fetches']
+    cache.executor = type(cache.executor)(max_workers=3)
+    show(cache, pages[1])
+    assert cache.stats['fetches'] == fetches == 2 * PER_PAGE
+
+
+def test_concurrent_requests_share_a_download(standin, tmp_path):
+    standin.routes['/img/slow.jpg'] = image_route(1, delay=0.2)
+    url = f'{standin.url}/img/slow.jpg'
+    cache = open_cache(tmp_path)
+    shown = []
+    threads = [threading.Thread(target=lambda: shown.extend(show(cache, [url]))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(shown) == 5
+    assert len(image_requests(standin)) == 1
+
+
+def test_memory_and_disk_budgets(standin, pages, tmp_path):
+    cache = open_cache(tmp_path, memory_bytes=4 * IMAGE_BYTES, disk_bytes=PER_PAGE * IMAGE_BYTES)
+    for page in pages:
+        show(cache, page)
+    assert cache._memory_size <= 4 * IMAGE_BYTES
+    assert cache._disk_size() <= PER_PAGE * IMAGE_BYTES
+    # the last page is still on disk, the first one had to go
+    show(cache, pages[-1])
+    assert cache.stats['fetches'] == PAGES * PER_PAGE
+    show(cache, pages[0])
+    assert cache.stats['fetches'] == (PAGES + 1) * PER_PAGE
@@ -0,0 +1,22 @@
+"""Upload names come from the content hash, never from the client's path"""
+import pytest
+
+from image_pipeline import content_name
+
+HASH = content_name(b'photo', 'x.jpg')[:16]
+
+
+@pytest.mark.parametrize('filename, ext', [
+    ('IMG_4541.JPG', '.jpg'),
+    ('photo.webp', '.webp'),
+    ('../../etc/passwd', '.bin'),
+    ('..\\\\..\\\\app.py', '.py'),
+    ('evil.p<h>p', '.bin'),
+    ('a.jpg\x00.png', '.png'),
+    ('noext', '.bin'),
+    ('', '.bin'),
+    (None, '.bin'),
+])
+def test_content_name(filename, ext):
+    name = content_name(b'photo', filename)
+    assert name == HASH + ext
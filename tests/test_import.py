@@ -0,0 +1,46 @@
+"""import-products: invalid rows are reported with their line number and skipped"""
+import json
+
+from conftest import WORKDIR
+
+
+def run_import(web_app, name, text, *args):
+    path = f'{WORKDIR}/{name}'
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return web_app.app.test_cli_runner().invoke(args=['import-products', path, *args])
+
+
+def imported(web_app, prefix):
+    with web_app.app.app_context():
+        try:
+            return {p.name: p.price for p in web_app.Product.query.filter(web_app.Product.name.like(f'{prefix}%'))}
+        finally:
+            web_app.db.session.remove()
+
+
+def test_jsonl_import_skips_bad_lines(web_app):
+    lines = [
+        json.dumps({'name': 'Import A', 'price': 1.5}),
+        '{"name": "Import broken", "price": ',
+        json.dumps([1, 2]),
+        '{"name": "Import NaN", "price": NaN}',
+        json.dumps({'name': 'Import inf', 'price': 'inf'}),
+        json.dumps({'name': 'Import B', 'price': '2'}),
+    ]
+    result = run_import(web_app, 'products.jsonl', '\n'.join(lines) + '\n', '--key', 'name')
+    assert result.exit_code == 0, result.output
+    assert imported(web_app, 'Import ') == {'Import A': 1.5, 'Import B': 2.0}
+    assert 'line 2: skipped, invalid JSON' in result.output
+    assert 'line 3: skipped, expected a JSON object' in result.output
+    assert "line 4: skipped, invalid price: nan" in result.output
+    assert "line 5: skipped, invalid price: 'inf'" in result.output
+    assert '2 inserted, 0 updated, 4 skipped' in result.output
+
+
+def test_csv_import_rejects_non_finite_prices(web_app):
+    text = 'name,price\nCsv ok,3\nCsv nan,nan\nCsv inf,-inf\n'
+    result = run_import(web_app, 'products.csv', text, '--key', 'name')
+    assert result.exit_code == 0, result.output
+    assert imported(web_app, 'Csv ') == {'Csv ok': 3.0}
+    assert '1 inserted, 0 updated, 2 skipped' in result.output
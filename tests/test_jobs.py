@@ -0,0 +1,41 @@
+"""Job queue: a worker whose lease ran out must not finish a reclaimed job"""
+import jobs
+from sqlalchemy import text
+
+
+def job_row(conn, key):
+    return conn.execute(text('SELECT id, status, locked_by FROM job WHERE idempotency_key = :k'), {'k': key}).first()
+
+
+def test_expired_lease_rolls_back_the_handler(web_app, app_context):
+    engine = web_app.db.engine
+    calls = []
+
+    def handler(conn, payload):
+        calls.append(payload['n'])
+        jobs.enqueue(conn, 'side-effect', {}, key=f"side-effect-{payload['n']}")
+
+    with engine.begin() as conn:
+        # due before anything else in the table, so batch=1 claims it first
+        jobs.enqueue(conn, 'lease-test', {'n': 1}, key='lease-test', delay=-10 ** 9)
+
+    slow = jobs.Worker(engine, {'lease-test': handler}, batch=1, lease=-1)
+    slow.name = 'slow'
+    fast = jobs.Worker(engine, {'lease-test': handler}, batch=1)
+    fast.name = 'fast'
+    [claimed] = slow.claim()
+    # slow's lease has already run out, so fast takes the job over
+    assert [job['id'] for job in fast.claim()] == [claimed['id']]
+
+    slow.run_job(claimed)
+    assert (slow.lost, slow.processed, slow.failed) == (1, 0, 0)
+    with engine.connect() as conn:
+        assert job_row(conn, 'side-effect-1') is None
+        assert tuple(job_row(conn, 'lease-test'))[1:] == ('running', fast.worker_id())
+
+    fast.run_job(claimed)
+    assert fast.processed == 1
+    assert calls == [1, 1]
+    with engine.connect() as conn:
+        assert job_row(conn, 'lease-test').status == 'done'
+        assert job_row(conn, 'side-effect-1') is not None
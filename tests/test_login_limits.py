@@ -0,0 +1,65 @@
+"""Login and signup rate limits
+
+Only failed logins count against the client address and the username from
+that address, so a classroom or office behind one NAT can sign in and no one
+can lock an account from elsewhere; guessing still gets 429.
+"""
+from conftest import PASSWORD, make_user
+
+
+def client_from(web_app, address):
+    client = web_app.app.test_client()
+    client.environ_base['REMOTE_ADDR'] = address
+    return client
+
+
+def api_login(client, username, password=PASSWORD):
+    return client.post('/api/login', json={'username': username, 'password': password}).status_code
+
+
+def test_many_users_log_in_from_one_address(web_app):
+    limit = web_app.login_limiter.limit
+    statuses = [api_login(client_from(web_app, '192.0.2.1'), make_user(web_app)) for _ in range(limit + 2)]
+    assert statuses == [200] * (limit + 2)
+    form = client_from(web_app, '192.0.2.1').post(
+        '/login', data={'username': make_user(web_app), 'password': PASSWORD})
+    assert form.status_code == 302
+
+
+def test_failed_logins_are_limited_per_address(web_app):
+    limit = web_app.login_limiter.limit
+    client = client_from(web_app, '192.0.2.2')
+    statuses = [api_login(client, make_user(web_app), 'wrong') for _ in range(limit)]
+    assert statuses == [401] * limit
+    # the address is locked out, even with the right password
+    assert api_login(client, make_user(web_app)) == 429
+    assert client.post('/login', data={'username': 'x', 'password': 'y'}).status_code == 429
+    assert api_login(client_from(web_app, '192.0.2.3'), make_user(web_app)) == 200
+
+
+def test_failures_from_other_addresses_do_not_lock_the_account(web_app):
+    limit = web_app.login_limiter.limit
+    username = make_user(web_app)
+    statuses = [api_login(client_from(web_app, f'198.51.100.{n}'), username, 'wrong') for n in range(limit + 2)]
+    assert statuses == [401] * (limit + 2)
+    assert api_login(client_from(web_app, '198.51.100.200'), username) == 200
+
+
+def test_failed_logins_are_limited_per_username_and_address(web_app):
+    limit = web_app.login_limiter.limit
+    username = make_user(web_app)
+    client = client_from(web_app, '198.51.100.201')
+    statuses = [api_login(client, username, 'wrong') for _ in range(limit)]
+    assert statuses == [401] * limit
+    assert api_login(client, username) == 429
+    assert client.post('/login', data={'username': username, 'password': PASSWORD}).status_code == 429
+
+
+def test_signup_has_its_own_limit(web_app):
+    limit = web_app.signup_limiter.limit
+    client = client_from(web_app, '192.0.2.4')
+    for _ in range(web_app.login_limiter.limit):
+        api_login(client, 'nobody', 'wrong')
+    statuses = [client_from(web_app, '192.0.2.4').post(
+        '/signup', data={'username': f'signup{n}', 'password': PASSWORD}).status_code for n in range(limit + 1)]
+    assert statuses == [302] * limit + [429]
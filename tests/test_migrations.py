@@ -0,0 +1,41 @@
+"""Migrations bring a new database to the schema of the current models"""
+import os
+
+from sqlalchemy import create_engine, inspect
+
+import migrations
+from conftest import WORKDIR
+
+
+def schema(engine):
+    inspector = inspect(engine)
+    return {
+        table: (sorted(c['name'] for c in inspector.get_columns(table)),
+                sorted((i['name'], tuple(i['column_names']), bool(i['unique']))
+                       for i in inspector.get_indexes(table)))
+        for table in inspector.get_table_names()
+        if table != 'schema_version' and not table.startswith('product_fts')
+    }
+
+
+def scratch_engine(name):
+    path = os.path.join(WORKDIR, name)
+    if os.path.exists(path):
+        os.remove(path)
+    return create_engine('sqlite:///' + path)
+
+
+def test_migrated_database_matches_the_models(web_app):
+    migrated = scratch_engine('migrated.db')
+    assert migrations.migrate(migrated, web_app.db.metadata) == migrations.latest_version()
+    assert migrations.migrate(migrated, web_app.db.metadata) == 0
+    created = scratch_engine('created.db')
+    web_app.db.metadata.create_all(created)
+    assert schema(migrated) == schema(created)
+
+
+def test_first_migration_ignores_the_models(web_app):
+    engine = scratch_engine('baseline.db')
+    with engine.begin() as conn:
+        migrations.create_tables(conn, web_app.db.metadata)
+    assert set(inspect(engine).get_table_names()) == set(migrations.baseline_metadata.tables)
@@ -0,0 +1,93 @@
+"""The product change log behind /api/products/changes
+
+It is kept by the app (ORM flush hook, checkout, bulk import), not by
+SQLite triggers, so it works the same on PostgreSQL.
+"""
+import pytest
+
+from conftest import login, make_products, make_user
+
+
+@pytest.fixture
+def admin_client(web_app, client):
+    login(client, make_user(web_app, is_admin=True))
+    return client
+
+
+def latest_version(client):
+    since = 0
+    while True:
+        delta = client.get('/api/products/changes', query_string={'since': since}).get_json()
+        if not delta['more']:
+            return delta['version']
+        since = delta['version']
+
+
+def changes_since(client, since):
+    delta = client.get('/api/products/changes', query_string={'since': since}).get_json()
+    assert not delta['reset']
+    return {p['id']: p for p in delta['changed']}, delta['deleted'], delta['version']
+
+
+def test_admin_add_edit_and_delete_are_logged(web_app, admin_client):
+    since = latest_version(admin_client)
+    admin_client.post('/admin/add', data={'name': 'Lamp', 'price': '10', 'stock': '3'})
+    changed, deleted, version = changes_since(admin_client, since)
+    assert [p['name'] for p in changed.values()] == ['Lamp']
+    pid = next(iter(changed))
+
+    admin_client.post(f'/admin/edit/{pid}', data={'name': 'Desk lamp', 'price': '12', 'stock': '3'})
+    changed, deleted, newer = changes_since(admin_client, version)
+    assert changed[pid]['name'] == 'Desk lamp' and newer > version
+
+    admin_client.post(f'/admin/delete/{pid}')
+    changed, deleted, _ = changes_since(admin_client, newer)
+    assert deleted == [pid] and not changed
+
+
+def test_checkout_logs_the_stock_change(web_app, user_client):
+    pid, other = make_products(web_app, 2, stock=10)
+    since = latest_version(user_client)
+    assert user_client.post('/api/checkout', json={'cart': {str(pid): 3}}).status_code == 200
+    changed, deleted, _ = changes_since(user_client, since)
+    assert list(changed) == [pid]
+    assert changed[pid]['stock'] == 7
+
+
+def test_bulk_import_is_logged(web_app, client, app_context):
+    since = latest_version(client)
+    pid = make_products(web_app, 1)[0]
+    inserted, updated = web_app.upsert_products([
+        {'id': pid, 'name': 'Renamed', 'price': 1.0, 'stock': 1},
+        {'name': 'Imported', 'price': 2.0, 'stock': 2},
+    ], key='id')
+    assert (inserted, updated) == (1, 1)
+    changed, _, _ = changes_since(client, since)
+    assert sorted(p['name'] for p in changed.values()) == ['Imported', 'Renamed']
+
+
+def test_versions_follow_the_counter(web_app, app_context):
+    make_products(web_app, 3)
+    versions = [v for (v,) in web_app.db.session.query(web_app.ProductChange.version)]
+    counter = web_app.db.session.get(web_app.ProductChangeCounter, 1).version
+    assert len(versions) == len(set(versions))
+    assert max(versions) == counter
+
+
+def test_no_sqlite_triggers_write_the_log(web_app, app_context):
+    triggers = web_app.db.session.execute(web_app.db.text(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'product_change%'")).all()
+    assert triggers == []
+
+
+def test_product_deleted_after_the_log_was_read_is_reported_deleted(web_app, client):
+    since = latest_version(client)
+    [pid] = make_products(web_app, 1)
+    # as if it went between the change-log query and the product query
+    with web_app.app.app_context():
+        web_app.db.session.execute(web_app.db.text('DELETE FROM product WHERE id = :id'), {'id': pid})
+        web_app.db.session.commit()
+        web_app.db.session.remove()
+    changed, deleted, _ = changes_since(client, since)
+    assert pid not in changed
+    assert pid in deleted
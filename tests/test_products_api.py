@@ -0,0 +1,39 @@
+"""/api/products pages the catalog, except for clients that never asked for pages"""
+from conftest import make_products
+
+
+def test_without_limit_or_cursor_the_whole_catalog_is_returned(web_app, client):
+    ids = make_products(web_app, web_app.PRODUCTS_PAGE_SIZE + 20)
+    resp = client.get('/api/products')
+    assert resp.status_code == 200
+    assert 'X-Next-Cursor' not in resp.headers
+    assert set(ids) <= {p['id'] for p in resp.get_json()}
+
+
+def test_pages_add_up_to_the_whole_catalog(web_app, client):
+    make_products(web_app, 25)
+    everything = [p['id'] for p in client.get('/api/products', query_string={'fields': 'id'}).get_json()]
+    paged, query = [], {'limit': 10, 'fields': 'id'}
+    while True:
+        resp = client.get('/api/products', query_string=query)
+        page = resp.get_json()
+        assert len(page) <= 10
+        paged.extend(p['id'] for p in page)
+        if 'X-Next-Cursor' not in resp.headers:
+            break
+        assert resp.headers['Link'].endswith('rel="next"')
+        query['cursor'] = resp.headers['X-Next-Cursor']
+    assert paged == everything
+
+
+def test_a_cursor_alone_gets_the_default_page_size(web_app, client):
+    make_products(web_app, web_app.PRODUCTS_PAGE_SIZE + 1)
+    resp = client.get('/api/products', query_string={'cursor': 0})
+    assert len(resp.get_json()) == web_app.PRODUCTS_PAGE_SIZE
+    assert 'X-Next-Cursor' in resp.headers
+
+
+def test_bad_limit_is_rejected(client):
+    resp = client.get('/api/products', query_string={'limit': 'ten'})
+    assert resp.status_code == 400
+    assert resp.get_json()['status'] == 'error'
@@ -0,0 +1,76 @@
+"""Cart and checkout endpoints run a fixed number of SQL statements
+
+Whatever the number of lines, a cart is loaded with one IN query and an
+order decrements stock with one UPDATE, so a 40-line cart costs exactly
+as many statements as a 1-line cart.
+"""
+import contextlib
+
+import pytest
+from sqlalchemy import event
+
+from conftest import make_products
+
+LINES = (1, 40)
+
+
+@contextlib.contextmanager
+def count_statements(web_app):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with web_app.app.app_context():
+        engine = web_app.db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@pytest.fixture(scope='module')
+def product_ids(web_app):
+    return make_products(web_app, max(LINES))
+
+
+def fill_cart(client, product_ids, lines):
+    cart = {str(pid): 2 for pid in product_ids[:lines]}
+    assert client.post('/api/cart/save', json={'cart': cart}).status_code == 200
+    return cart
+
+
+def cart_page(client, product_ids, lines, path):
+    fill_cart(client, product_ids, lines)
+    return lambda: client.get(path)
+
+
+def api_checkout(client, product_ids, lines):
+    cart = {str(pid): 1 for pid in product_ids[:lines]}
+    return lambda: client.post('/api/checkout', json={'cart': cart})
+
+
+ENDPOINTS = {
+    'api_cart': lambda client, ids, lines: cart_page(client, ids, lines, '/api/cart'),
+    'api_cart_load': lambda client, ids, lines: cart_page(client, ids, lines, '/api/cart/load'),
+    'show_cart': lambda client, ids, lines: cart_page(client, ids, lines, '/cart'),
+    'checkout': lambda client, ids, lines: cart_page(client, ids, lines, '/checkout'),
+    'api_checkout': api_checkout,
+}
+
+
+def statements_for(web_app, client, product_ids, endpoint, lines):
+    request = ENDPOINTS[endpoint](client, product_ids, lines)
+    # load the signed-in user into the user cache first
+    assert client.get('/api/cart').status_code == 200
+    with count_statements(web_app) as statements:
+        response = request()
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return statements
+
+
+@pytest.mark.parametrize('endpoint', sorted(ENDPOINTS))
+def test_statement_count_does_not_grow_with_cart_lines(web_app, user_client, product_ids, endpoint):
+    counts = {lines: statements_for(web_app, user_client, product_ids, endpoint, lines) for lines in LINES}
+    assert len(counts[1]) == len(counts[40]), counts
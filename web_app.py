@@ -1,25 +1,91 @@
-from flask import Flask, render_template, redirect, url_for, request, flash, session, abort, jsonify, session
+from flask import Flask, render_template, redirect, url_for, request, flash, session, abort, jsonify, session, stream_with_context
 import os
-from werkzeug.utils import secure_filename
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user, UserMixin
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import generate_password_hash, check_password_hash
 from models import sample_products
 from models import User
+import csv
+import functools
+import hashlib
+import io
 import json
-from sqlalchemy.exc import SQLAlchemyError
+import math
+import random
+import re
+import secrets
+import threading
+import time
+import zlib
+import click
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError, OperationalError
+import analytics
+import db_config
+import jobs
+import metrics
+import migrations
+from rate_limit import RateLimiter
+from catalog_cache import CatalogCache, FileVersion
+from image_pipeline import ImagePipeline
+import assets
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///shopping.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = db_config.database_url()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_config.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.secret_key = 'dev-secret'
 app.config['JSON_SORT_KEYS'] = False
 
+# Behind N reverse proxies, take the client address and scheme from the
+# X-Forwarded-* headers they add. Only set this when every request comes
+# through them, or clients can pick their own address.
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+
+assets.init_app(app)
+
 db = SQLAlchemy(app)
+with app.app_context():
+    db_config.install_sqlite_pragmas(db.engine)
+    request_metrics = metrics.init_app(app, db.engine)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
+# Catalog reads are served from memory until an admin edit or a checkout
+# bumps the version stamp shared by all workers on this host.
+catalog_cache = CatalogCache(
+    maxsize=int(os.environ.get('CATALOG_CACHE_SIZE', 256)),
+    ttl=float(os.environ.get('CATALOG_CACHE_TTL', 60)),
+    version=FileVersion(os.environ.get('CATALOG_CACHE_STAMP',
+                                       os.path.join(app.instance_path, 'catalog.version'))),
+    enabled=os.environ.get('CATALOG_CACHE', '1') != '0',
+)
+
+# load_user runs on every signed-in request; who a user is (id, username,
+# is_admin) rarely changes, so it is cached the same way as the catalog.
+user_cache = CatalogCache(
+    maxsize=int(os.environ.get('USER_CACHE_SIZE', 4096)),
+    ttl=float(os.environ.get('USER_CACHE_TTL', 300)),
+    version=FileVersion(os.environ.get('USER_CACHE_STAMP',
+                                       os.path.join(app.instance_path, 'users.version'))),
+    enabled=os.environ.get('USER_CACHE', '1') != '0',
+)
+
+# werkzeug method string; stored hashes using anything else are upgraded on
+# the next successful login
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+LOW_STOCK_THRESHOLD = int(os.environ.get('LOW_STOCK_THRESHOLD', 5))
+login_limiter = RateLimiter(limit=int(os.environ.get('LOGIN_RATE_LIMIT', 10)),
+                            window=float(os.environ.get('LOGIN_RATE_WINDOW', 60)))
+signup_limiter = RateLimiter(limit=int(os.environ.get('SIGNUP_RATE_LIMIT', 10)),
+                             window=float(os.environ.get('SIGNUP_RATE_WINDOW', 3600)))
+
+image_pipeline = ImagePipeline(os.path.join(app.root_path, 'static', 'uploads'))
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -30,12 +96,62 @@ class User(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
 
 
+def hash_password(password):
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+
+@functools.lru_cache(maxsize=None)
+def password_hash_prefix():
+    """PASSWORD_HASH_METHOD as werkzeug writes it (defaults filled in)"""
+    return hash_password('').split('$', 1)[0]
+
+
+def verify_password(user, password):
+    """Check `password`, rehashing it when the stored hash uses other parameters
+
+    An upgraded hash is committed straight away.
+    """
+    if user is None or not password or not user.check_password(password):
+        return False
+    if user.password_hash.split('$', 1)[0] != password_hash_prefix():
+        user.password_hash = hash_password(password)
+        db.session.commit()
+    return True
+
+
+def login_user_key(username):
+    # per address too: failures from other addresses must not lock the owner out
+    return ('user', (username or '').lower(), request.remote_addr)
+
+
+def login_wait(username):
+    """Seconds until this client may try to log in again, 0 if it may now
+
+    Only failed attempts count, so users signing in from behind one NAT or
+    proxy don't lock each other out.
+    """
+    by_ip = login_limiter.wait(('ip', request.remote_addr))
+    by_user = login_limiter.wait(login_user_key(username))
+    return max(by_ip, by_user)
+
+
+def login_failed(username):
+    login_limiter.hit(('ip', request.remote_addr))
+    login_limiter.hit(login_user_key(username))
+
+
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(120), nullable=False)
+    name = db.Column(db.String(120), nullable=False, index=True)
     price = db.Column(db.Float, nullable=False)
     image = db.Column(db.String(200), nullable=True)
-    stock = db.Column(db.Integer, default=50)
+    stock = db.Column(db.Integer, default=50, index=True)
+    # JSON {format: {width: url}} filled in by the image pipeline
+    image_variants = db.Column(db.Text, nullable=True)
+
+    @property
+    def images(self):
+        return json.loads(self.image_variants) if self.image_variants else {}
 
 
 class Order(db.Model):
@@ -45,10 +161,12 @@ class Order(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     items = db.relationship('OrderItem', backref='order', lazy=True)
 
+    __table_args__ = (db.Index('ix_order_user_created', 'user_id', 'created_at'),)
+
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     product_name = db.Column(db.String(120), nullable=False)
     price = db.Column(db.Float, nullable=False)
@@ -56,39 +174,570 @@ class OrderItem(db.Model):
     product = db.relationship('Product')
 
 
+class ProductChange(db.Model):
+    """Latest change per product, written by record_product_changes()"""
+    product_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, unique=True)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+
+
+class ProductChangeCounter(db.Model):
+    """Single row holding the newest ProductChange version"""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Cart(db.Model):
+    # random token kept in the session cookie instead of the cart itself
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    lines = db.relationship('CartLine', cascade='all, delete-orphan', lazy=True)
+
+
+class CartLine(db.Model):
+    cart_id = db.Column(db.String(32), db.ForeignKey('cart.id'), primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    qty = db.Column(db.Integer, nullable=False)
+
+
+class ProductDailySales(db.Model):
+    """Units and revenue per product per day, maintained by checkout (see analytics.py)"""
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+
+class DailySales(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    # products a checkout took to or below LOW_STOCK_THRESHOLD
+    low_stock_events = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Job(db.Model):
+    """Background job queue, read and written by jobs.py (times are epoch seconds)"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    idempotency_key = db.Column(db.String(120), unique=True, nullable=True)
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.Float, nullable=False)
+    locked_until = db.Column(db.Float, nullable=True)
+    locked_by = db.Column(db.String(64), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.Float, nullable=False)
+    finished_at = db.Column(db.Float, nullable=True)
+
+    __table_args__ = (db.Index('ix_job_status_run_at', 'status', 'run_at'),)
+
+
+class StockAlert(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    order_id = db.Column(db.Integer, nullable=False)
+    stock = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (db.UniqueConstraint('product_id', 'order_id'),)
+
+
+class IdempotencyKey(db.Model):
+    """Idempotency-Key of a checkout and the order it created (times are epoch seconds)"""
+    user_id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(128), primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)
+    order_id = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.Float, nullable=False, index=True)
+
+
+def user_identity(user_id):
+    row = db.session.query(User.id, User.username, User.is_admin).filter(User.id == user_id).first()
+    return tuple(row) if row else None
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    row = user_cache.get_or_load(user_id, lambda: user_identity(user_id))
+    if row is None:
+        return None
+    # transient User with just the cached fields; never add it to a session
+    return User(id=row[0], username=row[1], is_admin=row[2])
+
+
+USER_CACHE_FIELDS = ('username', 'is_admin')
+
+
+@event.listens_for(db.session, 'before_flush')
+def note_user_changes(session, flush_context, instances):
+    # ORM writes only; raw SQL updates to user must call user_cache.bump()
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            session.info['users_changed'] = True
+    for obj in session.dirty:
+        if isinstance(obj, User) and any(db.inspect(obj).attrs[f].history.has_changes()
+                                         for f in USER_CACHE_FIELDS):
+            session.info['users_changed'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_user_cache(session):
+    if session.info.pop('users_changed', False):
+        user_cache.bump()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_user_changes(session):
+    session.info.pop('users_changed', None)
+
+
+def record_product_changes(conn, changes):
+    """Move products to the newest catalog version; `changes` is [(product_id, deleted), ...]
+
+    Versions come from the counter row, whose UPDATE holds a row lock until
+    commit, so they are handed out in commit order on every backend.
+    """
+    latest = {}
+    for pid, deleted in changes:
+        latest.pop(pid, None)
+        latest[pid] = deleted
+    if not latest:
+        return
+    counter, log = ProductChangeCounter.__table__, ProductChange.__table__
+    top = conn.execute(counter.update().values(version=counter.c.version + len(latest))
+                       .returning(counter.c.version)).scalar()
+    conn.execute(log.delete().where(log.c.product_id.in_(list(latest))))
+    first = top - len(latest)
+    conn.execute(log.insert(), [{'product_id': pid, 'version': first + i, 'deleted': deleted}
+                                for i, (pid, deleted) in enumerate(latest.items(), 1)])
+
+
+@event.listens_for(db.session, 'after_flush')
+def log_product_changes(session, flush_context):
+    # ORM writes only; bulk and raw SQL writes to product call record_product_changes()
+    changes = [(obj.id, False) for obj in session.new if isinstance(obj, Product)]
+    changes += [(obj.id, False) for obj in session.dirty
+                if isinstance(obj, Product) and session.is_modified(obj, include_collections=False)]
+    changes += [(obj.id, True) for obj in session.deleted if isinstance(obj, Product)]
+    if changes:
+        record_product_changes(session.connection(), changes)
 
 
 def init_db():
-    db.create_all()
-    # ensure `image` column exists for older DBs
-    try:
-        cols = [r[1] for r in db.session.execute("PRAGMA table_info('product')").all()]
-        if 'image' not in cols:
-            with db.engine.begin() as conn:
-                conn.execute("ALTER TABLE product ADD COLUMN image TEXT")
-        if 'stock' not in cols:
-            with db.engine.begin() as conn:
-                conn.execute("ALTER TABLE product ADD COLUMN stock INTEGER DEFAULT 50")
-    except Exception:
-        pass
+    # schema changes live in migrations.py; this is one query when up to date
+    migrations.migrate(db.engine, db.metadata, log=app.logger.info)
     if User.query.filter_by(username='admin').first() is None:
-        admin = User(username='admin', password_hash=generate_password_hash('adminpass'), is_admin=True)
+        admin = User(username='admin', password_hash=hash_password('adminpass'), is_admin=True)
         db.session.add(admin)
-    if Product.query.count() == 0:
+    if db.session.query(Product.id).first() is None:
         for p in sample_products:
             db.session.add(Product(id=p['id'], name=p['name'], price=p['price'], image=p.get('image'), stock=50))
     db.session.commit()
+    catalog_cache.bump()
+
+
+SEARCH_LIMIT = 50
+
+
+def fts_query(q):
+    """Build an FTS5 MATCH expression doing prefix matching on every word of `q`"""
+    words = re.findall(r'\w+', q.lower())
+    return ' '.join(f'"{w}"*' for w in words)
+
+
+def search_products(q, limit=SEARCH_LIMIT):
+    """Return up to `limit` products matching `q`, best matches first"""
+    match = fts_query(q)
+    if not match:
+        return []
+    try:
+        return Product.query.from_statement(db.text(
+            "SELECT product.* FROM product_fts "
+            "JOIN product ON product.id = product_fts.rowid "
+            "WHERE product_fts MATCH :match ORDER BY rank LIMIT :limit"
+        )).params(match=match, limit=limit).all()
+    except OperationalError:
+        # no FTS index (older DB or non-SQLite backend)
+        db.session.rollback()
+        return (Product.query.filter(Product.name.ilike(f'%{q}%'))
+                .order_by(Product.id).limit(limit).all())
 
 
 # Initialize DB on startup (avoid using `before_first_request` decorator)
 
 
+CART_TTL = int(os.environ.get('CART_TTL', 7 * 24 * 3600))  # guest carts, seconds
+CART_SWEEP_INTERVAL = 600
+MAX_CART_LINES = 1000
+_last_cart_sweep = 0.0
+
+
+def sweep_expired_carts():
+    """Delete guest carts untouched for CART_TTL seconds, and lines left without a cart"""
+    cutoff = datetime.utcfromtimestamp(time.time() - CART_TTL)
+    Cart.query.filter(Cart.user_id.is_(None), Cart.updated_at < cutoff).delete(synchronize_session=False)
+    orphaned = ~db.exists().where(Cart.id == CartLine.cart_id)
+    CartLine.query.filter(orphaned).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def new_cart(user_id=None):
+    global _last_cart_sweep
+    if time.time() - _last_cart_sweep > CART_SWEEP_INTERVAL:
+        _last_cart_sweep = time.time()
+        sweep_expired_carts()
+    cart = Cart(id=secrets.token_hex(16), user_id=user_id)
+    db.session.add(cart)
+    db.session.commit()
+    return cart.id
+
+
+def touch_cart(cid):
+    Cart.query.filter_by(id=cid).update({'updated_at': datetime.utcnow()}, synchronize_session=False)
+
+
+def session_cart_id(create=False):
+    """Id of the server-side cart for this session, optionally creating it
+
+    Carts from before the cart table (whole dicts in the session cookie) are
+    moved into the table the first time they're seen.
+    """
+    cid = session.get('cart_id')
+    if cid is not None and db.session.query(Cart.id).filter_by(id=cid).first() is None:
+        # swept after CART_TTL (or merged into a user's cart elsewhere)
+        session.pop('cart_id')
+        cid = None
+    legacy = {}
+    for key in ('cart', 'guest_cart'):
+        raw = session.pop(key, None)
+        if not isinstance(raw, dict):
+            continue
+        # /api/cart/save stored these without any validation; drop the bad lines
+        for pid, qty in raw.items():
+            try:
+                legacy.update(parse_cart({pid: qty}))
+            except ValueError:
+                pass
+    if cid is None and (create or legacy):
+        cid = new_cart()
+        session['cart_id'] = cid
+    if legacy:
+        cart_merge(cid, legacy)
+    return cid
+
+
+def user_cart_id(user_id):
+    cart = Cart.query.filter_by(user_id=user_id).first()
+    return cart.id if cart else new_cart(user_id)
+
+
+def cart_items(cid):
+    """The cart as {product_id: qty}"""
+    if not cid:
+        return {}
+    return dict(db.session.query(CartLine.product_id, CartLine.qty).filter_by(cart_id=cid).all())
+
+
+def cart_add(cid, product_id, qty):
+    updated = (CartLine.query.filter_by(cart_id=cid, product_id=product_id)
+               .update({'qty': CartLine.qty + qty}, synchronize_session=False))
+    if not updated:
+        db.session.add(CartLine(cart_id=cid, product_id=product_id, qty=qty))
+    touch_cart(cid)
+    db.session.commit()
+
+
+def cart_remove(cid, product_id):
+    """Drop a product from the cart; returns False if it wasn't there"""
+    if not cid:
+        return False
+    removed = CartLine.query.filter_by(cart_id=cid, product_id=product_id).delete(synchronize_session=False)
+    touch_cart(cid)
+    db.session.commit()
+    return bool(removed)
+
+
+def cart_replace(cid, items):
+    """Overwrite the cart with {product_id: qty}"""
+    CartLine.query.filter_by(cart_id=cid).delete(synchronize_session=False)
+    if items:
+        db.session.execute(db.insert(CartLine), [
+            {'cart_id': cid, 'product_id': pid, 'qty': qty} for pid, qty in items.items()
+        ])
+    touch_cart(cid)
+    db.session.commit()
+
+
+def cart_merge(cid, items):
+    """Add every {product_id: qty} in `items` to the cart in one write"""
+    merged = cart_items(cid)
+    for pid, qty in items.items():
+        merged[pid] = merged.get(pid, 0) + qty
+    cart_replace(cid, merged)
+
+
+def cart_clear(cid):
+    if cid:
+        cart_replace(cid, {})
+
+
+def merge_guest_cart(user_id):
+    """On login, fold this session's guest cart into the user's cart"""
+    guest = session_cart_id()
+    cid = user_cart_id(user_id)
+    if guest and guest != cid and Cart.query.filter_by(id=guest, user_id=None).first():
+        cart_merge(cid, cart_items(guest))
+        CartLine.query.filter_by(cart_id=guest).delete(synchronize_session=False)
+        Cart.query.filter_by(id=guest).delete(synchronize_session=False)
+        db.session.commit()
+    session['cart_id'] = cid
+
+
+def parse_cart(raw):
+    """Validate a client supplied {product_id: qty} dict"""
+    if not isinstance(raw, dict) or len(raw) > MAX_CART_LINES:
+        raise ValueError('Invalid cart format')
+    items = {}
+    for pid, qty in raw.items():
+        try:
+            pid = int(pid)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid product id: {pid}')
+        # bool is an int subclass, but true is not a quantity
+        if not isinstance(qty, int) or isinstance(qty, bool) or qty <= 0:
+            raise ValueError(f'Invalid quantity for product {pid}')
+        items[pid] = qty
+    return items
+
+
+def cart_json(cid):
+    return {str(pid): qty for pid, qty in cart_items(cid).items()}
+
+
 def cart_count():
-    c = session.get('cart', {})
-    return sum(c.values())
+    cid = session_cart_id()
+    if not cid:
+        return 0
+    return db.session.query(db.func.coalesce(db.func.sum(CartLine.qty), 0)).filter_by(cart_id=cid).scalar()
+
+
+def products_by_id(ids):
+    """Load the given product ids with a single IN (...) query"""
+    ids = set(ids)
+    if not ids:
+        return {}
+    return {p.id: p for p in Product.query.filter(Product.id.in_(ids)).all()}
+
+
+def hydrate_cart(cart):
+    """Resolve a {product_id: qty} cart into ([(product, qty), ...], total)
+
+    Unknown or malformed product ids are skipped.
+    """
+    quantities = []
+    for pid, qty in cart.items():
+        try:
+            quantities.append((int(pid), qty))
+        except (TypeError, ValueError):
+            continue
+    products = products_by_id(pid for pid, _ in quantities)
+    lines = []
+    total = 0.0
+    for pid, qty in quantities:
+        p = products.get(pid)
+        if p:
+            lines.append((p, qty))
+            total += p.price * qty
+    return lines, total
+
+
+def cart_item_json(p, qty):
+    return {
+        'id': p.id,
+        'name': p.name,
+        'price': p.price,
+        'qty': qty,
+        'image': p.image,
+        'stock': p.stock
+    }
+
+
+CHECKOUT_RETRIES = 5
+CHECKOUT_BACKOFF = 0.02  # seconds, doubled on every retry
+CHECKOUT_MAX_BACKOFF = 0.5
+
+
+class OutOfStock(Exception):
+    def __init__(self, name):
+        super().__init__(f'{name} is out of stock')
+        self.name = name
+
+
+class DuplicateRequest(Exception):
+    """Another checkout with the same Idempotency-Key committed first"""
+
+
+# Idempotency-Key records are kept this long, then swept
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 24 * 3600))
+IDEMPOTENCY_SWEEP_INTERVAL = 600
+IDEMPOTENCY_KEY_MAX_LENGTH = 128
+_last_idempotency_sweep = 0.0
+
+
+def request_fingerprint(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def stored_checkout(user_id, key):
+    return db.session.query(IdempotencyKey).filter_by(user_id=user_id, key=key).first()
+
+
+def sweep_idempotency_keys():
+    """Delete Idempotency-Key records older than IDEMPOTENCY_TTL"""
+    IdempotencyKey.query.filter(IdempotencyKey.created_at < time.time() - IDEMPOTENCY_TTL) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+
+
+def is_lock_error(e):
+    msg = str(e.orig if getattr(e, 'orig', None) is not None else e).lower()
+    return 'database is locked' in msg or 'database is busy' in msg
+
+
+def place_order(user_id, lines, total, idempotency=None):
+    """Create an order for [(product, qty), ...] in a single transaction
+
+    Stock for every line is decremented with one conditional UPDATE so
+    concurrent checkouts can never oversell; if any line can't be covered
+    the whole order is rolled back and OutOfStock is raised. SQLite busy/locked errors are retried with
+    bounded exponential backoff. Follow-up work (sales rollups, low-stock
+    alerts) is queued as an `order_placed` job in the same transaction.
+
+    `idempotency` is an optional (key, request_hash) pair. Its record is
+    written before any stock is touched, so a concurrent duplicate waits on
+    the primary key and then raises DuplicateRequest instead of ordering
+    again. Returns the new order id.
+    """
+    # plain values, so a retry never has to reload expired instances
+    items = sorted((p.id, p.name, p.price, qty) for p, qty in lines)
+    attempt = 0
+    while True:
+        try:
+            now = datetime.utcnow()
+            order = Order(user_id=user_id, total=total, created_at=now)
+            db.session.add(order)
+            if idempotency:
+                db.session.flush()
+                try:
+                    db.session.execute(db.insert(IdempotencyKey).values(
+                        user_id=user_id, key=idempotency[0], request_hash=idempotency[1],
+                        order_id=order.id, total=total, created_at=time.time()))
+                except IntegrityError:
+                    db.session.rollback()
+                    raise DuplicateRequest()
+            wanted = {}
+            for pid, _, _, qty in items:
+                wanted[pid] = wanted.get(pid, 0) + qty
+            needed = db.case(wanted, value=Product.id)
+            left = dict(db.session.execute(
+                db.update(Product)
+                .where(Product.id.in_(wanted), Product.stock >= needed)
+                .values(stock=Product.stock - needed)
+                .returning(Product.id, Product.stock)
+                .execution_options(synchronize_session=False)
+            ).all())
+            for pid, name, _, _ in items:
+                if pid not in left:
+                    raise OutOfStock(name)
+            record_product_changes(db.session.connection(), [(pid, False) for pid in sorted(left)])
+            low_stock = [(pid, stock) for pid, stock in sorted(left.items())
+                         if stock <= LOW_STOCK_THRESHOLD < stock + wanted[pid]]
+            db.session.flush()
+            db.session.execute(db.insert(OrderItem), [
+                {'order_id': order.id, 'product_id': pid, 'product_name': name, 'price': price, 'qty': qty}
+                for pid, name, price, qty in items
+            ])
+            enqueue_job(db.session, 'order_placed', {
+                'order_id': order.id,
+                'day': now.date().isoformat(),
+                'items': [(pid, price, qty) for pid, _, price, qty in items],
+                'low_stock': low_stock,
+            }, key=f'order:{order.id}')
+            db.session.commit()
+            catalog_cache.bump()
+            job_worker.notify()
+            return order.id
+        except OutOfStock:
+            db.session.rollback()
+            raise
+        except OperationalError as e:
+            db.session.rollback()
+            attempt += 1
+            if attempt > CHECKOUT_RETRIES or not is_lock_error(e):
+                raise
+            delay = min(CHECKOUT_BACKOFF * 2 ** (attempt - 1), CHECKOUT_MAX_BACKOFF)
+            time.sleep(delay * random.uniform(0.5, 1.0))
+
+
+# === BACKGROUND JOBS ===
+
+def handle_order_placed(conn, payload):
+    """Sales rollups for a committed order, plus a low-stock alert per product it ran down"""
+    analytics.record_order(conn, date.fromisoformat(payload['day']), payload['items'], len(payload['low_stock']))
+    for pid, stock in payload['low_stock']:
+        enqueue_job(conn, 'low_stock_alert', {'product_id': pid, 'stock': stock, 'order_id': payload['order_id']},
+                    key=f"low-stock:{payload['order_id']}:{pid}")
+
+
+def handle_low_stock_alert(conn, payload):
+    conn.execute(db.text(
+        "INSERT INTO stock_alert (product_id, order_id, stock, created_at) "
+        "VALUES (:product_id, :order_id, :stock, :created_at) "
+        "ON CONFLICT (product_id, order_id) DO NOTHING"
+    ).bindparams(db.bindparam('created_at', type_=db.DateTime)), dict(payload, created_at=datetime.utcnow()))
+    app.logger.warning('low stock: product %s has %s left after order %s',
+                       payload['product_id'], payload['stock'], payload['order_id'])
+
+
+JOB_HANDLERS = {
+    'order_placed': handle_order_placed,
+    'low_stock_alert': handle_low_stock_alert,
+}
+# JOBS_INLINE=1 runs handlers inside the enqueueing transaction (no worker needed)
+JOBS_INLINE = os.environ.get('JOBS_INLINE', '0') == '1'
+# worker threads started in each web process; 0 when a separate `flask worker` runs
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+
+with app.app_context():
+    job_worker = jobs.Worker(db.engine, JOB_HANDLERS, poll=float(os.environ.get('JOB_POLL_INTERVAL', 1.0)))
+_job_worker_lock = threading.Lock()
+_job_worker_started = False
+
+
+def enqueue_job(conn, kind, payload, key=None):
+    if JOBS_INLINE:
+        JOB_HANDLERS[kind](conn, payload)
+    else:
+        jobs.enqueue(conn, kind, payload, key=key)
+
+
+@app.before_request
+def start_job_worker():
+    # started lazily so it runs in the serving process, after any fork
+    global _job_worker_started
+    if _job_worker_started or JOB_WORKERS <= 0 or JOBS_INLINE:
+        return
+    with _job_worker_lock:
+        if not _job_worker_started:
+            job_worker.start(JOB_WORKERS)
+            _job_worker_started = True
 
 
 # === API ENDPOINTS FOR MOBILE APP ===
@@ -100,13 +749,22 @@ def api_login():
         username = data.get('username')
         password = data.get('password')
 
+        wait = login_wait(username)
+        if wait:
+            resp = jsonify({'status': 'error', 'message': 'Too many login attempts, try again later'})
+            resp.headers['Retry-After'] = str(int(wait) + 1)
+            return resp, 429
+
         user = User.query.filter_by(username=username).first()
 
-        if not user or not check_password_hash(user.password_hash, password):
+        if not verify_password(user, password):
+            login_failed(username)
             return jsonify({'status': 'error', 'message': 'Invalid credentials'}), 401
 
+        login_limiter.reset(login_user_key(username))
         # Store user id in session
         session['user_id'] = user.id
+        merge_guest_cart(user.id)
 
         return jsonify({
             'status': 'success',
@@ -117,89 +775,216 @@ def api_login():
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
     
+PRODUCT_FIELDS = ('id', 'name', 'price', 'stock', 'image', 'images')
+PRODUCTS_PAGE_SIZE = 100
+PRODUCTS_MAX_PAGE_SIZE = 500
+
+
+def parse_product_fields(raw):
+    """Turn a `fields=` query value into a tuple of product columns (id always first)"""
+    if not raw:
+        return PRODUCT_FIELDS
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in PRODUCT_FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    return ('id',) + tuple(f for f in PRODUCT_FIELDS if f in fields and f != 'id')
+
+
+def product_row(p):
+    return {f: getattr(p, f) for f in PRODUCT_FIELDS}
+
+
+def catalog_products():
+    """Every product as a plain dict, ordered by id (cached)"""
+    return catalog_cache.get_or_load('all', lambda: [
+        product_row(p) for p in Product.query.order_by(Product.id).all()
+    ])
+
+
+def catalog_search(q, limit=SEARCH_LIMIT):
+    """search_products() as plain dicts (cached)"""
+    return catalog_cache.get_or_load(('search', q.lower(), limit), lambda: [
+        product_row(p) for p in search_products(q, limit=limit)
+    ])
+
+
+def product_page_args(args):
+    """Parse /api/products query args into (fields, cursor, limit)
+
+    `limit` is None when neither `limit` nor `cursor` was sent: clients
+    from before pagination get the whole catalog, as they always did.
+    Raises ValueError for malformed values.
+    """
+    fields = parse_product_fields(args.get('fields'))
+    cursor = int(args.get('cursor', 0))
+    limit = None
+    if 'limit' in args or 'cursor' in args:
+        limit = max(1, min(int(args.get('limit', PRODUCTS_PAGE_SIZE)), PRODUCTS_MAX_PAGE_SIZE))
+    return fields, cursor, limit
+
+
+def product_page_query(cursor, limit, fields):
+    columns = [Product.image_variants if f == 'images' else getattr(Product, f) for f in fields]
+    query = db.select(*columns).where(Product.id > cursor).order_by(Product.id)
+    # fetch one extra row to know whether another page follows
+    return query if limit is None else query.limit(limit + 1)
+
+
+def product_page_result(rows, limit, fields):
+    """Turn the rows of product_page_query() into (page, next_cursor)"""
+    next_cursor = rows[limit - 1][0] if limit is not None and len(rows) > limit else None
+    page = [dict(zip(fields, row)) for row in rows[:limit]]
+    if 'images' in fields:
+        for item in page:
+            item['images'] = json.loads(item['images']) if item['images'] else {}
+    return page, next_cursor
+
+
+def product_page(cursor, limit, fields):
+    """Return (rows, next_cursor) for one keyset page of the catalog (cached)"""
+    def load():
+        rows = db.session.execute(product_page_query(cursor, limit, fields)).all()
+        return product_page_result(rows, limit, fields)
+
+    return catalog_cache.get_or_load(('page', cursor, limit, fields), load)
+
+
 @app.route('/api/products', methods=['GET'])
 def api_products():
-    """Return all products as JSON for mobile app"""
-    products = Product.query.order_by(Product.id).all()
-    return jsonify([
-        {
-            'id': p.id,
-            'name': p.name,
-            'price': p.price,
-            'stock': p.stock,
-            'image': p.image
+    """Return one page of products as JSON for mobile app
+
+    Query args: `limit` (page size), `cursor` (last product id of the previous
+    page) and `fields` (comma separated subset of PRODUCT_FIELDS). The id to
+    pass as the next `cursor` is sent back in the `X-Next-Cursor` header.
+    Without `limit` and `cursor` the response is the whole catalog.
+    """
+    try:
+        fields, cursor, limit = product_page_args(request.args)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    rows, next_cursor = product_page(cursor, limit, fields)
+    resp = jsonify(rows)
+    if next_cursor is not None:
+        resp.headers['X-Next-Cursor'] = str(next_cursor)
+        next_url = url_for('api_products', cursor=next_cursor, limit=limit,
+                           fields=request.args.get('fields') or None)
+        resp.headers['Link'] = f'<{next_url}>; rel="next"'
+    resp.add_etag()
+    return resp.make_conditional(request)
+
+
+@app.route('/api/products/search', methods=['GET'])
+def api_products_search():
+    """Full-text product search, best matches first"""
+    q = request.args.get('q', '').strip()
+    try:
+        fields = parse_product_fields(request.args.get('fields'))
+        limit = int(request.args.get('limit', SEARCH_LIMIT))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    limit = max(1, min(limit, PRODUCTS_MAX_PAGE_SIZE))
+    products = catalog_search(q, limit=limit)
+    return jsonify([{f: p[f] for f in fields} for p in products])
+
+
+CHANGES_PAGE_SIZE = 500
+
+
+def product_changes(since, limit, fields):
+    """Products changed after catalog version `since` (cached)
+
+    Returns {'version', 'changed', 'deleted', 'more', 'reset'}. When `more`
+    is set the client asks again with since=version; `reset` means `since`
+    came from another database and the client must drop its copy first.
+    """
+    def load():
+        latest = db.session.query(db.func.coalesce(db.func.max(ProductChange.version), 0)).scalar()
+        reset = since > latest
+        start = 0 if reset else since
+        changes = (ProductChange.query.filter(ProductChange.version > start)
+                   .order_by(ProductChange.version).limit(limit + 1).all())
+        more = len(changes) > limit
+        changes = changes[:limit]
+        changed_ids = [c.product_id for c in changes if not c.deleted]
+        deleted = [c.product_id for c in changes if c.deleted]
+        products = products_by_id(changed_ids)
+        changed = []
+        for pid in sorted(changed_ids):
+            if pid not in products:
+                # deleted since the change log was read; its delete entry comes in a later page
+                deleted.append(pid)
+                continue
+            row = product_row(products[pid])
+            changed.append({f: row[f] for f in fields})
+        return {
+            'version': changes[-1].version if changes else latest,
+            'changed': changed,
+            'deleted': deleted,
+            'more': more,
+            'reset': reset
         }
-        for p in products
-    ])
+
+    return catalog_cache.get_or_load(('changes', since, limit, fields), load)
+
+
+@app.route('/api/products/changes', methods=['GET'])
+def api_product_changes():
+    """Delta sync for offline catalogs: products changed since `since`"""
+    try:
+        fields = parse_product_fields(request.args.get('fields'))
+        since = int(request.args.get('since', 0))
+        limit = int(request.args.get('limit', CHANGES_PAGE_SIZE))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    limit = max(1, min(limit, CHANGES_PAGE_SIZE))
+    resp = jsonify(product_changes(since, limit, fields))
+    resp.add_etag()
+    return resp.make_conditional(request)
 
 
 @app.route('/api/products/<int:product_id>', methods=['GET'])
 def api_product_detail(product_id):
     """Return specific product details as JSON"""
-    product = Product.query.get_or_404(product_id)
-    return jsonify({
-        'id': product.id,
-        'name': product.name,
-        'price': product.price,
-        'stock': product.stock,
-        'image': product.image
-    })
+    def load():
+        product = db.session.get(Product, product_id)
+        return product_row(product) if product else None
+
+    product = catalog_cache.get_or_load(('product', product_id), load)
+    if product is None:
+        abort(404)
+    return jsonify(product)
 
 @app.route('/api/cart', methods=['GET'])
 @login_required
 def api_cart():
     """Return current cart as JSON"""
-    cart = session.get('cart', {})
-    items = []
-    total = 0.0
-    for pid, qty in cart.items():
-        p = Product.query.get(int(pid))
-        if p:
-            items.append({
-                'id': p.id,
-                'name': p.name,
-                'price': p.price,
-                'qty': qty,
-                'image': p.image,
-                'stock': p.stock
-            })
-            total += p.price * qty
+    lines, total = hydrate_cart(cart_items(session_cart_id()))
+    items = [cart_item_json(p, qty) for p, qty in lines]
     return jsonify({'items': items, 'total': total})
 
 @app.route('/api/cart/save', methods=['POST'])
 def api_cart_save():
     """Save guest cart to server (no login required)"""
     data = request.get_json() or {}
-    cart = data.get('cart', {})
-    if not isinstance(cart, dict):
-        return jsonify({'success': False, 'message': 'Invalid cart format'}), 400
-    
-    # Store in session
-    session['guest_cart'] = cart
-    return jsonify({'success': True, 'message': 'Cart saved', 'cart': cart})
+    try:
+        items = parse_cart(data.get('cart', {}))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    cid = session_cart_id(create=True)
+    cart_replace(cid, items)
+    return jsonify({'success': True, 'message': 'Cart saved', 'cart': cart_json(cid)})
 
 @app.route('/api/cart/load', methods=['GET'])
 def api_cart_load():
     """Load guest cart from server (no login required)"""
-    cart = session.get('guest_cart', {})
-    items = []
-    total = 0.0
-    for pid, qty in cart.items():
-        try:
-            p = Product.query.get(int(pid))
-            if p:
-                items.append({
-                    'id': p.id,
-                    'name': p.name,
-                    'price': p.price,
-                    'qty': qty,
-                    'image': p.image,
-                    'stock': p.stock
-                })
-                total += p.price * qty
-        except Exception:
-            continue
-    return jsonify({'success': True, 'items': items, 'total': total, 'cart': cart})
+    cart = cart_items(session_cart_id())
+    lines, total = hydrate_cart(cart)
+    items = [cart_item_json(p, qty) for p, qty in lines]
+    return jsonify({'success': True, 'items': items, 'total': total,
+                    'cart': {str(pid): qty for pid, qty in cart.items()}})
 
 @app.route('/api/cart/add', methods=['POST'])
 @login_required
@@ -208,15 +993,16 @@ def api_cart_add():
     data = request.get_json() or {}
     product_id = data.get('product_id')
     qty = int(data.get('qty', 1))
+    if qty <= 0:
+        return jsonify({'success': False, 'message': 'Quantity must be positive'}), 400
     product = Product.query.get_or_404(product_id)
 
     if product.stock < qty:
         return jsonify({'success': False, 'message': f'{product.name} only has {product.stock} in stock'}), 400
 
-    cart = session.get('cart', {})
-    cart[str(product_id)] = cart.get(str(product_id), 0) + qty
-    session['cart'] = cart
-    return jsonify({'success': True, 'message': f'Added {qty} x {product.name} to cart', 'cart': cart})
+    cid = session_cart_id(create=True)
+    cart_add(cid, product.id, qty)
+    return jsonify({'success': True, 'message': f'Added {qty} x {product.name} to cart', 'cart': cart_json(cid)})
 
 
 @app.route('/api/cart/remove', methods=['POST'])
@@ -224,15 +1010,36 @@ def api_cart_add():
 def api_cart_remove():
     """Remove product from cart"""
     data = request.get_json() or {}
-    product_id = str(data.get('product_id'))
-    cart = session.get('cart', {})
-    if product_id in cart:
-        cart.pop(product_id)
-        session['cart'] = cart
-        return jsonify({'success': True, 'message': 'Removed product from cart', 'cart': cart})
+    try:
+        product_id = int(data.get('product_id'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Product not in cart'}), 400
+    cid = session_cart_id()
+    if cart_remove(cid, product_id):
+        return jsonify({'success': True, 'message': 'Removed product from cart', 'cart': cart_json(cid)})
     return jsonify({'success': False, 'message': 'Product not in cart'}), 400
 
 
+def replay_checkout(user_id, key, request_hash):
+    """Response for an Idempotency-Key that already placed an order, else None"""
+    record = stored_checkout(user_id, key)
+    if record is None:
+        return None
+    if record.request_hash != request_hash:
+        return jsonify({
+            'status': 'error',
+            'message': 'Idempotency-Key was already used for a different cart'
+        }), 422
+    response = jsonify({
+        'status': 'success',
+        'message': 'Order placed successfully',
+        'order_id': record.order_id,
+        'total': record.total
+    })
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response, 200
+
+
 @app.route('/api/checkout', methods=['POST'])
 def api_checkout():
     try:
@@ -250,6 +1057,21 @@ def api_checkout():
         data = request.get_json(force=True) or {}
         cart = data.get('cart', {})
 
+        # A retried request with the same Idempotency-Key gets the original
+        # order back without touching stock again
+        key = request.headers.get('Idempotency-Key')
+        idempotency = None
+        if key is not None:
+            if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Idempotency-Key must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters'
+                }), 400
+            idempotency = (key, request_fingerprint(cart))
+            replay = replay_checkout(user_id, *idempotency)
+            if replay is not None:
+                return replay
+
         if not cart:
             return jsonify({
                 'status': 'error',
@@ -260,16 +1082,24 @@ def api_checkout():
         order_items = []
 
         # 2. Check stock and calculate total
+        quantities = []
         for pid_str, qty in cart.items():
             try:
-                pid = int(pid_str)
+                quantities.append((int(pid_str), qty))
             except ValueError:
                 return jsonify({
                     'status': 'error',
                     'message': f'Invalid product id: {pid_str}'
                 }), 400
+            if not isinstance(qty, int) or isinstance(qty, bool) or qty <= 0:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Invalid quantity for product {pid_str}'
+                }), 400
 
-            p = Product.query.get(pid)
+        products = products_by_id(pid for pid, _ in quantities)
+        for pid, qty in quantities:
+            p = products.get(pid)
             if not p:
                 return jsonify({
                     'status': 'error',
@@ -285,29 +1115,25 @@ def api_checkout():
             total += p.price * qty
             order_items.append((p, qty))
 
-        # 3. Create order with logged-in user
-        order = Order(user_id=user_id, total=total)
-        db.session.add(order)
-        db.session.commit()
-
-        # 4. Add order items and decrement stock
-        for p, qty in order_items:
-            oi = OrderItem(
-                order_id=order.id,
-                product_id=p.id,
-                product_name=p.name,
-                price=p.price,
-                qty=qty
-            )
-            db.session.add(oi)
-            p.stock -= qty
-
-        db.session.commit()
+        # 3. Create order, items and stock decrements in one transaction
+        global _last_idempotency_sweep
+        if idempotency and time.time() - _last_idempotency_sweep > IDEMPOTENCY_SWEEP_INTERVAL:
+            _last_idempotency_sweep = time.time()
+            sweep_idempotency_keys()
+        try:
+            order_id = place_order(user_id, order_items, total, idempotency)
+        except OutOfStock as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        except DuplicateRequest:
+            return replay_checkout(user_id, *idempotency)
 
         return jsonify({
             'status': 'success',
             'message': 'Order placed successfully',
-            'order_id': order.id,
+            'order_id': order_id,
             'total': total
         }), 200
 
@@ -325,34 +1151,98 @@ def api_checkout():
         }), 500
 
 
-@app.route('/api/orders', methods=['GET'])
-@login_required
-def api_orders():
-    """Return all orders for the current user"""
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).all()
-    results = []
-    for o in orders:
-        items = [{
+ORDERS_PAGE_SIZE = 20
+ORDERS_MAX_PAGE_SIZE = 200
+
+
+def parse_order_cursor(raw):
+    """Decode an order cursor of the form `<created_at isoformat>,<id>`"""
+    created_at, _, order_id = raw.rpartition(',')
+    try:
+        return datetime.fromisoformat(created_at), int(order_id)
+    except ValueError:
+        raise ValueError(f'Invalid cursor: {raw}')
+
+
+def order_page_query(user_id, cursor, limit, with_items):
+    """SELECT of one page of a user's orders, plus one to tell whether another follows"""
+    query = db.select(Order).where(Order.user_id == user_id)
+    if cursor:
+        created_at, order_id = parse_order_cursor(cursor)
+        query = query.where(db.or_(
+            Order.created_at < created_at,
+            db.and_(Order.created_at == created_at, Order.id < order_id)
+        ))
+    if with_items:
+        query = query.options(db.selectinload(Order.items))
+    return query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1)
+
+
+def order_page_result(orders, limit):
+    """Turn the orders of order_page_query() into (orders, next_cursor)"""
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        last = orders[-1]
+        next_cursor = f'{last.created_at.isoformat()},{last.id}'
+    return orders, next_cursor
+
+
+def order_page(user_id, cursor=None, limit=ORDERS_PAGE_SIZE, with_items=True):
+    """Return (orders, next_cursor) for one page of a user's orders, newest first
+
+    Pages are keyed on (created_at, id) so each one is an index range scan on
+    ix_order_user_created. Items are loaded for the whole page with one
+    extra IN query rather than one lazy load per order.
+    """
+    orders = db.session.scalars(order_page_query(user_id, cursor, limit, with_items)).all()
+    return order_page_result(orders, limit)
+
+
+def order_json(o, with_items=True):
+    result = {
+        'order_id': o.id,
+        'total': o.total,
+        'created_at': o.created_at.isoformat()
+    }
+    if with_items:
+        result['items'] = [{
             'product_id': i.product_id,
             'product_name': i.product_name,
             'qty': i.qty,
             'price': i.price
         } for i in o.items]
-        results.append({
-            'order_id': o.id,
-            'total': o.total,
-            'created_at': o.created_at.isoformat(),
-            'items': items
-        })
-    return jsonify(results)
+    return result
+
+
+@app.route('/api/orders', methods=['GET'])
+@login_required
+def api_orders():
+    """Return one page of orders for the current user
+
+    Query args: `limit`, `cursor` (from the previous page's `X-Next-Cursor`
+    header) and `summary=1` to leave out the line items.
+    """
+    summary = request.args.get('summary') in ('1', 'true')
+    try:
+        limit = int(request.args.get('limit', ORDERS_PAGE_SIZE))
+        limit = max(1, min(limit, ORDERS_MAX_PAGE_SIZE))
+        orders, next_cursor = order_page(current_user.id, request.args.get('cursor'), limit, with_items=not summary)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    resp = jsonify([order_json(o, with_items=not summary) for o in orders])
+    if next_cursor:
+        resp.headers['X-Next-Cursor'] = next_cursor
+    return resp
 # === WEB ROUTES ===
 
 @app.route('/')
 def index():
     q = request.args.get('q', '').strip()
-    products = Product.query.order_by(Product.id).all()
     if q:
-        products = [p for p in products if q.lower() in p.name.lower()]
+        products = catalog_search(q)
+    else:
+        products = catalog_products()
     return render_template('index.html', products=products, cart_count=cart_count(), search_query=q)
 
 
@@ -362,31 +1252,21 @@ def add(product_id):
     if product.stock <= 0:
         flash('Product out of stock', 'danger')
         return redirect(url_for('index'))
-    cart = session.get('cart', {})
-    cart[str(product_id)] = cart.get(str(product_id), 0) + 1
-    session['cart'] = cart
+    cart_add(session_cart_id(create=True), product_id, 1)
     flash(f'Added {product.name} to cart', 'success')
     return redirect(url_for('index'))
 
 
 @app.route('/cart')
 def show_cart():
-    cart = session.get('cart', {})
-    items = []
-    total = 0.0
-    for pid, qty in cart.items():
-        p = Product.query.get(int(pid))
-        if p:
-            items.append({'id': p.id, 'name': p.name, 'price': p.price, 'qty': qty, 'image': p.image})
-            total += p.price * qty
+    lines, total = hydrate_cart(cart_items(session_cart_id()))
+    items = [{'id': p.id, 'name': p.name, 'price': p.price, 'qty': qty, 'image': p.image} for p, qty in lines]
     return render_template('cart.html', items=items, total=total)
 
 
 @app.route('/remove/<int:product_id>')
 def remove(product_id):
-    cart = session.get('cart', {})
-    cart.pop(str(product_id), None)
-    session['cart'] = cart
+    cart_remove(session_cart_id(), product_id)
     return redirect(url_for('show_cart'))
 
 
@@ -395,29 +1275,19 @@ def checkout():
     if not current_user.is_authenticated:
         flash('Please log in to checkout', 'danger')
         return redirect(url_for('login'))
-    cart = session.get('cart', {})
-    total = 0.0
-    order_items = []
-    for pid, qty in cart.items():
-        p = Product.query.get(int(pid))
-        if p:
-            if p.stock < qty:
-                flash(f'{p.name} only has {p.stock} in stock', 'danger')
-                return redirect(url_for('show_cart'))
-            total += p.price * qty
-            order_items.append((p, qty))
-    # Create order record
-    order = Order(user_id=current_user.id, total=total)
-    db.session.add(order)
-    db.session.commit()
-    # Add order items and decrement stock
+    cid = session_cart_id()
+    order_items, total = hydrate_cart(cart_items(cid))
     for p, qty in order_items:
-        oi = OrderItem(order_id=order.id, product_id=p.id, product_name=p.name, price=p.price, qty=qty)
-        db.session.add(oi)
-        p.stock -= qty
-    db.session.commit()
-    session['cart'] = {}
-    return render_template('checkout.html', total=total, order_id=order.id)
+        if p.stock < qty:
+            flash(f'{p.name} only has {p.stock} in stock', 'danger')
+            return redirect(url_for('show_cart'))
+    try:
+        order_id = place_order(current_user.id, order_items, total)
+    except OutOfStock as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('show_cart'))
+    cart_clear(cid)
+    return render_template('checkout.html', total=total, order_id=order_id)
 
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -425,11 +1295,18 @@ def login():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
+        wait = login_wait(username)
+        if wait:
+            flash(f'Too many login attempts, try again in {int(wait) + 1} seconds', 'danger')
+            return render_template('login.html'), 429
         user = User.query.filter_by(username=username).first()
-        if user and user.check_password(password):
+        if verify_password(user, password):
+            login_limiter.reset(login_user_key(username))
             login_user(user)
+            merge_guest_cart(user.id)
             flash('Logged in', 'success')
             return redirect(url_for('index'))
+        login_failed(username)
         flash('Invalid credentials', 'danger')
     return render_template('login.html')
 
@@ -442,13 +1319,17 @@ def signup():
         if not username or not password:
             flash('Username and password required', 'danger')
             return render_template('signup.html')
+        if signup_limiter.hit(request.remote_addr):
+            flash('Too many attempts, try again later', 'danger')
+            return render_template('signup.html'), 429
         if User.query.filter_by(username=username).first():
             flash('Username already taken', 'danger')
             return render_template('signup.html')
-        user = User(username=username, password_hash=generate_password_hash(password), is_admin=False)
+        user = User(username=username, password_hash=hash_password(password), is_admin=False)
         db.session.add(user)
         db.session.commit()
         login_user(user)
+        merge_guest_cart(user.id)
         flash('Account created and logged in', 'success')
         return redirect(url_for('index'))
     return render_template('signup.html')
@@ -458,6 +1339,7 @@ def signup():
 @login_required
 def logout():
     logout_user()
+    session.pop('cart_id', None)
     flash('Logged out', 'info')
     return redirect(url_for('index'))
 
@@ -474,11 +1356,30 @@ def admin_required(func):
     return wrapper
 
 
+def save_product_image(p, f):
+    """Store an uploaded image for `p` and queue its resized variants"""
+    p.image = image_pipeline.store(f)
+    p.image_variants = None
+
+
+def apply_image_variants(image_url, variants):
+    """Pipeline callback: attach variants to products still using `image_url`"""
+    with app.app_context():
+        updated = db.session.execute(
+            db.update(Product).where(Product.image == image_url)
+            .values(image_variants=json.dumps(variants)).returning(Product.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        record_product_changes(db.session.connection(), [(pid, False) for pid in updated])
+        db.session.commit()
+        catalog_cache.bump()
+
+
 @app.route('/admin')
 @login_required
 @admin_required
 def admin():
-    products = Product.query.order_by(Product.id).all()
+    products = catalog_products()
     return render_template('admin.html', products=products)
 
 
@@ -494,14 +1395,12 @@ def admin_add():
         # handle image upload
         f = request.files.get('image_file')
         if f and f.filename:
-            uploads = os.path.join(app.root_path, 'static', 'uploads')
-            os.makedirs(uploads, exist_ok=True)
-            filename = secure_filename(f.filename)
-            path = os.path.join(uploads, filename)
-            f.save(path)
-            p.image = f'static/uploads/{filename}'
+            save_product_image(p, f)
         db.session.add(p)
         db.session.commit()
+        catalog_cache.bump()
+        if f and f.filename:
+            image_pipeline.submit(p.image, apply_image_variants)
         flash('Product added', 'success')
         return redirect(url_for('admin'))
     return render_template('product_form.html', action='Add')
@@ -519,13 +1418,11 @@ def admin_edit(product_id):
         # handle image upload
         f = request.files.get('image_file')
         if f and f.filename:
-            uploads = os.path.join(app.root_path, 'static', 'uploads')
-            os.makedirs(uploads, exist_ok=True)
-            filename = secure_filename(f.filename)
-            path = os.path.join(uploads, filename)
-            f.save(path)
-            p.image = f'static/uploads/{filename}'
+            save_product_image(p, f)
         db.session.commit()
+        catalog_cache.bump()
+        if f and f.filename:
+            image_pipeline.submit(p.image, apply_image_variants)
         flash('Product updated', 'success')
         return redirect(url_for('admin'))
     return render_template('product_form.html', action='Edit', product=p)
@@ -538,6 +1435,7 @@ def admin_delete(product_id):
     p = Product.query.get_or_404(product_id)
     db.session.delete(p)
     db.session.commit()
+    catalog_cache.bump()
     flash('Product deleted', 'info')
     return redirect(url_for('admin'))
 
@@ -545,18 +1443,427 @@ def admin_delete(product_id):
 @app.route('/orders')
 @login_required
 def user_orders():
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).all()
-    return render_template('orders.html', orders=orders)
+    try:
+        orders, next_cursor = order_page(current_user.id, request.args.get('cursor'))
+    except ValueError:
+        abort(400)
+    return render_template('orders.html', orders=orders, next_cursor=next_cursor)
 
 
 @app.route('/admin/stock')
 @login_required
 @admin_required
 def admin_stock():
-    products = Product.query.order_by(Product.id).all()
+    products = catalog_products()
     return render_template('stock.html', products=products)
 
 
+@app.route('/admin/api/cache')
+@login_required
+@admin_required
+def admin_cache_stats():
+    """Catalog cache hit/miss/eviction counters"""
+    return jsonify(catalog_cache.stats())
+
+
+ANALYTICS_DEFAULT_DAYS = 30
+ANALYTICS_MAX_TOP = 100
+
+
+@app.route('/admin/api/analytics')
+@login_required
+@admin_required
+def admin_analytics():
+    """Daily sales, top products and low stock, read from the rollup tables
+
+    Query args: `from` and `to` (YYYY-MM-DD, inclusive; default the last 30
+    days) and `top` (number of products, default 10).
+    """
+    try:
+        end = date.fromisoformat(request.args['to']) if request.args.get('to') else datetime.utcnow().date()
+        start = (date.fromisoformat(request.args['from']) if request.args.get('from')
+                 else end - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1))
+        top = max(1, min(int(request.args.get('top', 10)), ANALYTICS_MAX_TOP))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    if start > end:
+        return jsonify({'status': 'error', 'message': '`from` is after `to`'}), 400
+    report = analytics.sales_report(db.session, start, end + timedelta(days=1), top=top,
+                                    low_stock_threshold=LOW_STOCK_THRESHOLD)
+    return jsonify({'from': start.isoformat(), 'to': end.isoformat(), **report})
+
+
+@app.route('/admin/api/jobs', methods=['GET'])
+@login_required
+@admin_required
+def admin_jobs():
+    """Job queue counts, dead-lettered jobs and recent low-stock alerts"""
+    result = jobs.stats(db.session)
+    result['alerts'] = [
+        {'product_id': a.product_id, 'order_id': a.order_id, 'stock': a.stock, 'created_at': a.created_at.isoformat()}
+        for a in StockAlert.query.order_by(StockAlert.created_at.desc()).limit(20)
+    ]
+    return jsonify(result)
+
+
+@app.route('/admin/api/jobs/retry', methods=['POST'])
+@login_required
+@admin_required
+def admin_jobs_retry():
+    """Requeue dead-lettered jobs (?id=N for just one)"""
+    job_id = request.args.get('id', type=int)
+    count = jobs.retry_dead(db.session, job_id)
+    db.session.commit()
+    job_worker.notify()
+    return jsonify({'status': 'success', 'requeued': count})
+
+
+@app.route('/admin/metrics')
+@login_required
+@admin_required
+def admin_metrics():
+    """Per-endpoint latency, SQL and size metrics (?format=prometheus for text)"""
+    if request_metrics is None:
+        return jsonify({'status': 'error', 'message': 'metrics are disabled (METRICS=0)'}), 404
+    if request.args.get('format') == 'prometheus':
+        return app.response_class(request_metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+    return jsonify(request_metrics.snapshot())
+
+
+# === BULK IMPORT / EXPORT (flask --app web_app <command>) ===
+
+IMPORT_CHUNK_SIZE = 1000
+PRODUCT_EXPORT_FIELDS = ('id', 'name', 'price', 'stock', 'image')
+ORDER_EXPORT_FIELDS = ('order_id', 'user_id', 'created_at', 'order_total',
+                       'product_id', 'product_name', 'price', 'qty')
+
+
+def detect_format(path, fmt):
+    if fmt:
+        return fmt
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def read_rows(f, fmt):
+    """Yield (line number, row) from a CSV or JSONL stream
+
+    CSV rows are dicts; JSONL lines are yielded as text and decoded by
+    parse_product_row, so a malformed line is skipped like any invalid row.
+    """
+    if fmt == 'csv':
+        for lineno, row in enumerate(csv.DictReader(f), start=2):
+            yield lineno, row
+    else:
+        for lineno, line in enumerate(f, start=1):
+            if line.strip():
+                yield lineno, line
+
+
+def format_rows(fmt, fields, rows, batch=IMPORT_CHUNK_SIZE):
+    """Yield dict rows as CSV or JSONL text, `batch` rows per chunk"""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=fields) if fmt == 'csv' else None
+    if writer:
+        writer.writeheader()
+    for count, row in enumerate(rows, start=1):
+        if writer:
+            writer.writerow(row)
+        else:
+            buf.write(json.dumps(row, default=str) + '\n')
+        if count % batch == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def write_rows(f, fmt, fields, rows):
+    """Stream dict rows to `f` as CSV or JSONL; returns the row count"""
+    count = 0
+
+    def counted():
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    for chunk in format_rows(fmt, fields, counted()):
+        f.write(chunk)
+    return count
+
+
+def parse_product_row(row):
+    """Validate one import row (dict or JSON text); raises ValueError with a readable message"""
+    if isinstance(row, str):
+        try:
+            row = json.loads(row)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'invalid JSON: {e.msg}')
+        if not isinstance(row, dict):
+            raise ValueError('expected a JSON object')
+    name = (row.get('name') or '').strip()
+    if not name or len(name) > 120:
+        raise ValueError('name is required (max 120 characters)')
+    try:
+        price = float(row.get('price'))
+    except (TypeError, ValueError):
+        raise ValueError(f'invalid price: {row.get("price")!r}')
+    stock = row.get('stock')
+    try:
+        stock = 50 if stock in (None, '') else int(stock)
+    except (TypeError, ValueError):
+        raise ValueError(f'invalid stock: {stock!r}')
+    if not math.isfinite(price):
+        raise ValueError(f'invalid price: {row.get("price")!r}')
+    if price < 0 or stock < 0:
+        raise ValueError('price and stock must not be negative')
+    product = {'name': name, 'price': price, 'stock': stock, 'image': row.get('image') or None}
+    if row.get('id') not in (None, ''):
+        try:
+            product['id'] = int(row['id'])
+        except (TypeError, ValueError):
+            raise ValueError(f'invalid id: {row["id"]!r}')
+    return product
+
+
+def upsert_products(rows, key):
+    """Insert or update a chunk of validated product rows matched on `key` (id or name)
+
+    One SELECT finds the existing rows, then updates and inserts each go out
+    as a single executemany.
+    """
+    by_key, inserts = {}, []
+    for row in rows:
+        if key == 'id' and 'id' not in row:
+            inserts.append(row)  # no id: always a new product
+        else:
+            by_key[row[key]] = row  # last row wins within a chunk
+    column = Product.id if key == 'id' else Product.name
+    existing = {}
+    if by_key:
+        existing = dict(db.session.query(column, Product.id).filter(column.in_(list(by_key))).all())
+    updates = []
+    for k, row in by_key.items():
+        if k in existing:
+            updates.append(dict(row, id=existing[k]))
+        else:
+            inserts.append(row)
+    changed = [row['id'] for row in updates]
+    if updates:
+        db.session.execute(db.update(Product), updates)
+    if inserts:
+        changed += db.session.execute(db.insert(Product).returning(Product.id), inserts).scalars().all()
+    # bulk statements skip the flush hook that keeps the change log
+    record_product_changes(db.session.connection(), [(pid, False) for pid in changed])
+    db.session.commit()
+    return len(inserts), len(updates)
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def report(verb, count, started):
+    elapsed = time.perf_counter() - started
+    rss = peak_rss_mb()
+    rss = f', peak RSS {rss:.0f} MB' if rss is not None else ''
+    click.echo(f'{verb} {count} rows in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} rows/s{rss})', err=True)
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create tables and seed the admin user and sample products."""
+    init_db()
+    click.echo('Database initialized')
+
+
+@app.cli.command('migrate')
+@click.option('--status', is_flag=True, help='Only list pending migrations.')
+def migrate_command(status):
+    """Apply pending schema migrations."""
+    todo = migrations.pending(db.engine)
+    if status:
+        for number, name, _ in todo:
+            click.echo(f'pending {number} {name}')
+        click.echo(f'{len(todo)} pending, latest is {migrations.latest_version()}')
+        return
+    applied = migrations.migrate(db.engine, db.metadata, log=click.echo)
+    click.echo(f'{applied} migrations applied, schema at version {migrations.latest_version()}')
+
+
+@app.cli.command('backfill-analytics')
+@click.option('--since', type=click.DateTime(['%Y-%m-%d']), help='First day to rebuild (default: all history).')
+@click.option('--until', type=click.DateTime(['%Y-%m-%d']), help='Day after the last one to rebuild.')
+def backfill_analytics_command(since, until):
+    """Rebuild the daily sales rollups from the order tables."""
+    started = time.perf_counter()
+    days = analytics.backfill(db.session, since and since.date(), until and until.date())
+    db.session.commit()
+    click.echo(f'{days} days rebuilt in {time.perf_counter() - started:.1f}s')
+
+
+@app.cli.command('worker')
+@click.option('--threads', default=2, show_default=True)
+@click.option('--once', is_flag=True, help='Run the jobs that are due, then exit.')
+def worker_command(threads, once):
+    """Process background jobs (run web processes with JOB_WORKERS=0)."""
+    if once:
+        total = 0
+        while True:
+            claimed = job_worker.run_once()
+            if not claimed:
+                break
+            total += claimed
+        click.echo(f'{total} jobs run')
+        return
+    job_worker.start(threads)
+    click.echo(f'worker running with {threads} threads, Ctrl+C to stop')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        job_worker.stop()
+
+
+@app.cli.command('import-products')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--key', type=click.Choice(['id', 'name']), default='id', show_default=True,
+              help='Column used to match existing products.')
+@click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True)
+def import_products_command(path, fmt, key, chunk_size):
+    """Stream products from a CSV/JSONL file (- for stdin) in fixed-size chunks."""
+    fmt = detect_format(path, fmt)
+    started = time.perf_counter()
+    inserted = updated = skipped = 0
+    chunk = []
+    with click.open_file(path, 'r', encoding='utf-8') as f:
+        for lineno, raw in read_rows(f, fmt):
+            try:
+                chunk.append(parse_product_row(raw))
+            except (ValueError, AttributeError) as e:
+                skipped += 1
+                click.echo(f'line {lineno}: skipped, {e}', err=True)
+                continue
+            if len(chunk) >= chunk_size:
+                i, u = upsert_products(chunk, key)
+                inserted, updated, chunk = inserted + i, updated + u, []
+    if chunk:
+        i, u = upsert_products(chunk, key)
+        inserted, updated = inserted + i, updated + u
+    catalog_cache.bump()
+    click.echo(f'{inserted} inserted, {updated} updated, {skipped} skipped', err=True)
+    report('Imported', inserted + updated, started)
+
+
+@app.cli.command('export-products')
+@click.argument('path', default='-')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']))
+@click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True)
+def export_products_command(path, fmt, chunk_size):
+    """Stream the catalog to a CSV/JSONL file (default stdout)."""
+    fmt = detect_format(path, fmt)
+    started = time.perf_counter()
+    columns = [getattr(Product, f) for f in PRODUCT_EXPORT_FIELDS]
+    query = db.session.query(*columns).order_by(Product.id).execution_options(yield_per=chunk_size)
+    rows = (dict(zip(PRODUCT_EXPORT_FIELDS, r)) for r in query)
+    with click.open_file(path, 'w', encoding='utf-8') as f:
+        count = write_rows(f, fmt, PRODUCT_EXPORT_FIELDS, rows)
+    report('Exported', count, started)
+
+
+def order_item_rows(chunk_size=IMPORT_CHUNK_SIZE, since=None, until=None, user_id=None):
+    """Yield one dict per order item joined with its order, fetched in batches"""
+    query = (db.session.query(Order.id, Order.user_id, Order.created_at, Order.total,
+                              OrderItem.product_id, OrderItem.product_name, OrderItem.price, OrderItem.qty)
+             .join(OrderItem, OrderItem.order_id == Order.id))
+    if since:
+        query = query.filter(Order.created_at >= since)
+    if until:
+        query = query.filter(Order.created_at < until)
+    if user_id:
+        query = query.filter(Order.user_id == user_id)
+    query = query.order_by(Order.id, OrderItem.id).execution_options(yield_per=chunk_size)
+    for row in query:
+        row = dict(zip(ORDER_EXPORT_FIELDS, row))
+        row['created_at'] = row['created_at'].isoformat() if row['created_at'] else None
+        yield row
+
+
+@app.cli.command('export-orders')
+@click.argument('path', default='-')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']))
+@click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True)
+def export_orders_command(path, fmt, chunk_size):
+    """Stream every order item (with its order) to a CSV/JSONL file."""
+    fmt = detect_format(path, fmt)
+    started = time.perf_counter()
+    with click.open_file(path, 'w', encoding='utf-8') as f:
+        count = write_rows(f, fmt, ORDER_EXPORT_FIELDS, order_item_rows(chunk_size))
+    report('Exported', count, started)
+
+
+EXPORT_GZIP_LEVEL = int(os.environ.get('EXPORT_GZIP_LEVEL', 6))
+
+
+def gzip_chunks(chunks, level=EXPORT_GZIP_LEVEL):
+    """Gzip a stream of text chunks on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@app.route('/admin/export/orders')
+@login_required
+@admin_required
+def admin_export_orders():
+    """Stream order items joined with their orders as CSV or JSONL
+
+    Query args: `format` (csv or jsonl, default csv), `from` and `to`
+    (YYYY-MM-DD, inclusive), `user_id`, and `gzip=1` to compress on the fly.
+    Rows are fetched in batches of IMPORT_CHUNK_SIZE, so memory stays flat
+    however many orders there are.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({'status': 'error', 'message': '`format` must be csv or jsonl'}), 400
+    try:
+        start = date.fromisoformat(request.args['from']) if request.args.get('from') else None
+        end = date.fromisoformat(request.args['to']) if request.args.get('to') else None
+        user_id = int(request.args['user_id']) if request.args.get('user_id') else None
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    since = datetime.combine(start, datetime.min.time()) if start else None
+    until = datetime.combine(end + timedelta(days=1), datetime.min.time()) if end else None
+    compress = request.args.get('gzip') == '1'
+
+    def generate():
+        started = time.perf_counter()
+        count = 0
+        for count, row in enumerate(order_item_rows(IMPORT_CHUNK_SIZE, since, until, user_id), start=1):
+            yield row
+        app.logger.info(f'exported {count} order items in {time.perf_counter() - started:.1f}s')
+
+    body = format_rows(fmt, ORDER_EXPORT_FIELDS, generate())
+    filename = f'orders.{fmt}'
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    if compress:
+        body = gzip_chunks(body)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    return app.response_class(stream_with_context(body), mimetype=mimetype,
+                              headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
 if __name__ == '__main__':
     with app.app_context():
         init_db()